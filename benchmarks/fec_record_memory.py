@@ -0,0 +1,48 @@
+"""Memory used by FecRecord instances (tracemalloc), with and without the shared journal and account instances
+
+Usage (from the repository root) : python benchmarks/fec_record_memory.py [number of records]
+"""
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from typing import List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from qonto2fec.models.evidence import Evidence  # noqa: E402
+from qonto2fec.models.fec_record import FecRecord, FecRecordTables  # noqa: E402
+from qonto2fec.models.journal import Journal  # noqa: E402
+from qonto2fec.models.ledger_account import LedgerAccount  # noqa: E402
+
+DEFAULT_RECORDS = 1_000_000
+
+JOURNALS = [Journal("BQ", "Journal de banque"), Journal("AC", "Journal des achats")]
+ACCOUNTS = [LedgerAccount("512", "Banque principale (Qonto)"), LedgerAccount("6064", "Fournitures administratives"),
+            LedgerAccount("41110000010000", "ACME", "ACME")]
+EVIDENCE = Evidence(1, "Qonto", "reference", None, "20240105")
+
+
+def build_records(count: int, tables: Optional[FecRecordTables]) -> List[FecRecord]:
+    records = []
+    for i in range(count):
+        fec_record = FecRecord(datetime(2024, 1 + i % 12, 1 + i % 28), "label", JOURNALS[i % 2], ACCOUNTS[i % 3], 0, 1234, i // 3, EVIDENCE)
+        records.append(tables.share(fec_record) if tables else fec_record)
+    return records
+
+
+def measure(count: int, shared: bool) -> None:
+    tracemalloc.start()
+    start = time.perf_counter()
+    records = build_records(count, FecRecordTables() if shared else None)
+    elapsed = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{'shared' if shared else 'not shared'} : {current / len(records):.0f} bytes/record, built in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_RECORDS
+    measure(count, shared=False)
+    measure(count, shared=True)
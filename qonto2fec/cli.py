@@ -0,0 +1,553 @@
+"""
+Command line interface
+
+Each subcommand only imports what it needs so that quick operations (validate, balance)
+do not pay the cost of the Qonto client and of the whole accounting service.
+"""
+import argparse
+import logging
+import os
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional
+
+
+class Settings(NamedTuple):
+    """Company and accounting period settings (read from the environment or the .env file)"""
+
+    siren: str
+    start_date: str
+    end_date: str
+    reconciliation_search_limit: int
+    ledger_storage: str
+
+    def name(self, kind: str) -> str:
+        """Name of a file produced for this period (e.g. 123456789FEC2024-12-31)"""
+        return f"{self.siren}{kind}{self.end_date}"
+
+
+def read_settings() -> Settings:
+    siren = os.environ.get("company-siren")
+    if not siren:
+        raise Exception("company-siren must be defined")
+
+    accounting_period_start_date = os.environ.get("accounting-period-start-date")
+    if not accounting_period_start_date:
+        raise Exception("accounting-period-start-date must be defined")
+
+    accounting_period_end_date = os.environ.get("accounting-period-end-date")
+    if not accounting_period_end_date:
+        raise Exception("accounting_period_end_date must be defined")
+
+    from .services.reconciliation import DEFAULT_SEARCH_LIMIT
+    reconciliation_search_limit = int(os.environ.get("reconciliation-search-limit", DEFAULT_SEARCH_LIMIT))
+
+    ledger_storage = os.environ.get("ledger-storage", "tsv")
+
+    return Settings(siren, accounting_period_start_date, accounting_period_end_date, reconciliation_search_limit, ledger_storage)
+
+
+def fetch(settings: Settings, qonto: Any, save: bool = True) -> Any:
+    """Retrieves all the data needed for the accounting period from Qonto (listings fetched concurrently) and saves it for offline replay"""
+    from .services.file_utils import save_object_to_file
+
+    snapshot = qonto.getSnapshot(settings.start_date, settings.end_date)
+    logging.info(f"{len(snapshot.transactions)} bank transactions retrieved from Qonto")
+
+    if save:
+        save_object_to_file(snapshot, settings.name("QONTO"))
+    return snapshot
+
+
+def do_accounting(settings: Settings, snapshot: Any, event_log: bool = False, previous_year: Any = None, close: bool = True) -> Any:
+    """Builds the accounting for the period from Qonto data
+
+    With event_log, the posting decisions are logged (see the changes and replay --from-log commands).
+    With previous_year (closed accounting of the previous fiscal year), accounts are opened from it instead of the saved FEC.
+    Without close, the accounting is returned before the period is closed.
+    """
+    from .services.accounting import AccountingService
+    from .services.event_log import EventLog
+
+    accounting_service = AccountingService(settings.siren, settings.start_date, settings.end_date, settings.reconciliation_search_limit,
+                                           settings.ledger_storage, previous_year)
+    if event_log:
+        accounting_service.event_log = EventLog(settings.name("EVENTS"))
+
+    try:
+        # Opens accounts (new fiscal year)
+        accounting_service.generateRAN()
+
+        # Handles client invoices, credit notes and unpaid supplier invoices
+        accounting_service.addInvoices(snapshot.client_invoices)
+        accounting_service.addInvoices(snapshot.client_credit_notes)
+        accounting_service.addInvoices(snapshot.supplier_invoices)
+
+        # Handles bank transactions (with invoices and miscellaneous transactions in chronological order)
+        accounting_service.doAccountingByMonth(snapshot.transactions)
+
+        # Closes accounting period properly
+        if close:
+            accounting_service.closeAccouting()
+    except BaseException:
+        # The log of an interrupted run is not kept (the log of the last complete run stays the current one)
+        if accounting_service.event_log:
+            accounting_service.event_log.abort()
+        raise
+
+    return accounting_service
+
+
+def load_snapshot(settings: Settings) -> Any:
+    from .services.file_utils import read_object_from_file
+    return read_object_from_file(settings.name("QONTO"))
+
+
+def load_fec(settings: Settings, fec_path: Optional[str]) -> List[Any]:
+    """Loads FEC records from a file (default is the FEC saved for the period, read from the ledger database with the sqlite storage)"""
+    from .models.fec_record import FecRecord, FecRecordTables
+    from .services.file_utils import read_dict_from_csv
+
+    if not fec_path and settings.ledger_storage == "sqlite":
+        from .services.sqlite_store import SqliteLedgerStore
+        store = SqliteLedgerStore(settings.name("LEDGER"))
+        try:
+            data = store.get_fec_records()
+        finally:
+            store.close()
+        if not data:
+            raise FileNotFoundError(f"No FEC record found in {store.db_path}")
+        tables = FecRecordTables()
+        return [FecRecord.from_dict(row, tables) for row in data]
+
+    data = read_dict_from_csv(fec_path if fec_path else settings.name("FEC"), escape=False)
+    if not data:
+        raise FileNotFoundError(f"No FEC record found in {fec_path if fec_path else settings.name('FEC')}")
+    tables = FecRecordTables()
+    return [FecRecord.from_dict(row, tables) for row in data]
+
+
+def sync(settings: Settings, args: argparse.Namespace) -> None:
+    """Fetches Qonto data, does the accounting, saves it and exports evidences"""
+    from .services.qonto_client import QontoClient
+
+    qonto = QontoClient()
+    accounting_service = do_accounting(settings, fetch(settings, qonto), event_log=True)
+    accounting_service.displayCumulativeMonthlyBalance()
+    accounting_service.save()
+    if not args.no_evidences:
+        accounting_service.exportEvidences(qonto)
+
+
+def account(settings: Settings, args: argparse.Namespace) -> None:
+    """Does the accounting from the Qonto data saved by the last sync and saves it"""
+    accounting_service = do_accounting(settings, load_snapshot(settings), event_log=True)
+    accounting_service.displayCumulativeMonthlyBalance()
+    accounting_service.save()
+
+
+def multi_year(settings: Settings, args: argparse.Namespace) -> None:
+    """Fetches the Qonto history once and does the accounting of each fiscal year until the accounting period, in a single pass"""
+    from .services.file_utils import save_object_to_file
+    from .services.fiscal_years import get_fiscal_periods, split_snapshot
+    from .services.qonto_client import QontoClient
+
+    periods = get_fiscal_periods(args.first_start_date, settings.start_date, settings.end_date)
+    qonto = QontoClient()
+    history = fetch(settings._replace(start_date=periods[0][0]), qonto, save=False)
+
+    # Each fiscal year is opened from the closed accounting of the previous one (kept in memory)
+    accounting_service = None
+    for (start_date, end_date), snapshot in zip(periods, split_snapshot(history, periods)):
+        logging.info(f"Fiscal year {start_date} - {end_date} : {len(snapshot.transactions)} bank transactions")
+        year_settings = settings._replace(start_date=start_date, end_date=end_date)
+        save_object_to_file(snapshot, year_settings.name("QONTO"))
+        accounting_service = do_accounting(year_settings, snapshot, event_log=True, previous_year=accounting_service)
+        accounting_service.displayCumulativeMonthlyBalance()
+        accounting_service.save()
+        if not args.no_evidences:
+            accounting_service.exportEvidences(qonto)
+
+
+def replay(settings: Settings, args: argparse.Namespace) -> None:
+    """Does the accounting from the Qonto data saved by the last sync without saving anything (dry run)"""
+    if args.from_log:
+        from .services.balance_accumulator import BalanceAccumulator
+        from .services.event_log import EventLog, load_ledger
+        display_monthly_balance(settings, BalanceAccumulator(load_ledger(EventLog.get_path(settings.name("EVENTS")))))
+        return
+
+    if args.from_month:
+        from .services.date_utils import get_month_end, get_months, get_previous_month
+        from .services.event_log import EventLog, load_checkpoint
+
+        # Restores the accounting of the last run before the month, then posts the following months with the current rules
+        snapshot = load_snapshot(settings)
+        month, accounting_service = load_checkpoint(EventLog.get_path(settings.name("EVENTS")), args.from_month.replace("-", ""))
+        logging.info(f"Accounting restored from the snapshot of {month}")
+        posted_until = get_month_end(get_previous_month(month)) if month != get_months(settings.start_date, settings.end_date)[0] else None
+        accounting_service.reloadPendingInputs(snapshot.client_invoices + snapshot.client_credit_notes + snapshot.supplier_invoices, posted_until)
+        accounting_service.doAccountingByMonth(snapshot.transactions, month)
+        accounting_service.closeAccouting()
+    else:
+        accounting_service = do_accounting(settings, load_snapshot(settings))
+    accounting_service.displayCumulativeMonthlyBalance()
+
+
+def changes(settings: Settings, args: argparse.Namespace) -> None:
+    """Displays the FEC records removed and added by the last accounting run compared to the previous one"""
+    from .services.event_log import get_changes
+
+    removed, added = get_changes(settings.name("EVENTS"))
+    for sign, fec_records in [("-", removed), ("+", added)]:
+        for r in fec_records:
+            print(f"{sign} {r.EcritureNum}\t{r.EcritureDate}\t{r.CompteNum}\t{r.EcritureLib}\t{r.Debit}\t{r.Credit}\t{r.EcritureLet or ''}")
+    print(f"{len(removed)} records removed, {len(added)} records added")
+
+
+def watch(settings: Settings, args: argparse.Namespace) -> None:
+    """Keeps the accounting up to date : polls Qonto and the configuration files and recomputes the affected months"""
+    from .services.qonto_client import QontoClient
+    from .services.watch import AccountingWatcher
+
+    qonto = QontoClient()
+    watcher = AccountingWatcher(settings.siren, settings.start_date, settings.end_date, settings.reconciliation_search_limit,
+                                settings.ledger_storage, qonto)
+    try:
+        watcher.run(lambda: fetch(settings, qonto), args.interval)
+    except KeyboardInterrupt:
+        logging.info("Watch mode stopped")
+
+
+def validate(settings: Settings, args: argparse.Namespace) -> None:
+    """Validates an existing FEC file"""
+    from .services.fec_validation import validate_fec
+    validate_fec(load_fec(settings, args.fec), settings.start_date, settings.end_date)
+
+
+def balance(settings: Settings, args: argparse.Namespace) -> None:
+    """Displays the cumulative monthly balance of an existing FEC file, or its balances at a date or on a period"""
+    from .services.balance_accumulator import BalanceAccumulator
+    from .services.ledger_query import LedgerQuery
+    from .services.reporting import display_trial_balance
+
+    balances = BalanceAccumulator(load_fec(settings, args.fec))
+    if args.as_of or args.from_date or args.to_date or args.account:
+        start = args.from_date
+        end = args.as_of if args.as_of else args.to_date
+        ledger_query = LedgerQuery(balances)
+        if args.account:
+            print(f"{args.account} : {ledger_query.get_movement(args.account, start, end) / 100:.2f}")
+        else:
+            display_trial_balance(ledger_query.get_trial_balance(start, end), f"Trial balance {start or ''} - {end or ''}")
+        return
+
+    display_monthly_balance(settings, balances)
+
+
+def display_monthly_balance(settings: Settings, balances: Any) -> None:
+    from datetime import datetime
+    from .services.reporting import display_cumulative_monthly_balance
+
+    start_date = datetime.strptime(settings.start_date, "%Y-%m-%d")
+    end_date = datetime.strptime(settings.end_date, "%Y-%m-%d")
+    nb_months = (end_date.year - start_date.year) * 12 + end_date.month - start_date.month
+    display_cumulative_monthly_balance(balances, nb_months)
+
+
+def fec_rows(settings: Settings, fec_path: Optional[str]) -> Any:
+    """FEC lines reader of a file (default is the FEC saved for the period, read from the ledger database with the sqlite storage)"""
+    from .services.file_utils import iter_dict_from_csv
+
+    if not fec_path and settings.ledger_storage == "sqlite":
+        def read_store() -> List[Any]:
+            from .services.sqlite_store import SqliteLedgerStore
+            store = SqliteLedgerStore(settings.name("LEDGER"))
+            try:
+                return store.get_fec_records()
+            finally:
+                store.close()
+        return read_store
+
+    return lambda: iter_dict_from_csv(fec_path if fec_path else settings.name("FEC"), escape=False)
+
+
+def diff(settings: Settings, args: argparse.Namespace) -> None:
+    """Displays the operations added, removed and modified between two FEC files, whatever their numbering"""
+    from .services.fec_diff import diff_fec
+    from .services.reporting import display_fec_diff
+
+    if args.old:
+        old_rows = fec_rows(settings, args.old)
+    else:
+        from .services.event_log import EventLog, load_ledger
+        previous_path = EventLog.get_path(settings.name("EVENTS"), previous=True)
+
+        def old_rows() -> Iterator[Dict[str, Any]]:
+            return (fec_record._asdict() for fec_record in load_ledger(previous_path))
+
+    display_fec_diff(diff_fec(old_rows, fec_rows(settings, args.new), args.piece_ref))
+
+
+def serve(settings: Settings, args: argparse.Namespace) -> None:
+    """Serves ledger queries (balances, account ledger, open items, evidence records) over HTTP/JSON"""
+    from .services.query_server import LedgerServer
+
+    if args.fec:
+        paths = [args.fec]
+    elif settings.ledger_storage == "sqlite":
+        db_path = f"./export/{settings.name('LEDGER').replace('-', '')}.sqlite"
+        paths = [db_path, f"{db_path}-wal"]
+    else:
+        paths = [f"./export/{settings.name('FEC').replace('-', '')}.txt"]
+
+    LedgerServer(lambda: load_fec(settings, args.fec), paths).serve(args.host, args.port)
+
+
+def trace(settings: Settings, args: argparse.Namespace) -> None:
+    """Displays the FEC lines with their source (Qonto transaction, invoice, OPS, opening or closing entries)"""
+    from .services.provenance import ProvenanceIndex, BANK_TRANSACTION, INVOICE
+
+    provenance_index = ProvenanceIndex.load(settings.name("PROVENANCE"))
+    fec_records = load_fec(settings, None)
+    if len(fec_records) != len(provenance_index.provenances):
+        raise ValueError(f"{settings.name('PROVENANCE')} does not match the FEC file, please run the account or sync command again")
+
+    if args.line:
+        lines = [args.line]
+    elif args.ecriture:
+        lines = provenance_index.get_ecriture_lines(args.ecriture)
+    elif args.transaction:
+        lines = provenance_index.get_lines(BANK_TRANSACTION, args.transaction)
+    elif args.invoice:
+        lines = provenance_index.get_lines(INVOICE, args.invoice)
+    elif args.ref:
+        lines = [line for line, fec_record in enumerate(fec_records, start=1) if fec_record.PieceRef == args.ref]
+    else:
+        raise ValueError("One of --line, --ecriture, --transaction, --invoice or --ref is required")
+
+    for line in lines:
+        provenance = provenance_index.get_provenance(line)
+        if not provenance:
+            raise ValueError(f"No FEC line {line}")
+        r = fec_records[line - 1]
+        print(f"{line}\t{r.EcritureNum}\t{r.EcritureDate}\t{r.CompteNum}\t{r.EcritureLib}\t{r.Debit}\t{r.Credit}\t"
+              f"{provenance.kind}\t{provenance.source}\t{provenance.source_id}")
+    print(f"{len(lines)} lines")
+
+
+def closing(settings: Settings, args: argparse.Namespace) -> None:
+    """Displays the closing provisions and taxes of the saved FEC, and what they would be with other closing parameters (what-if)"""
+    from .services.accounting_config import load_accounting_config
+    from .services.balance_accumulator import BalanceAccumulator
+    from .services.closing import compute_closing, get_closing_aggregates, load_closing_parameters, parse_dated_table, ClosingParameters
+    from .services.provenance import ProvenanceIndex, CLOSING
+    from .services.reporting import display_closing
+
+    provenance_index = ProvenanceIndex.load(settings.name("PROVENANCE"))
+    fec_records = load_fec(settings, None)
+    if len(fec_records) != len(provenance_index.provenances):
+        raise ValueError(f"{settings.name('PROVENANCE')} does not match the FEC file, please run the account or sync command again")
+
+    # Aggregates of the ledger without its closing entries (no transaction is processed again)
+    balances = BalanceAccumulator(fec_record for fec_record, provenance in zip(fec_records, provenance_index.provenances) if provenance.kind != CLOSING)
+    aggregates = get_closing_aggregates(balances, settings.start_date, settings.end_date)
+
+    parameters = load_closing_parameters(load_accounting_config().closing)
+    results = {"accounting.cfg": compute_closing(aggregates, parameters)}
+    if args.set:
+        overrides = {}
+        for setting in args.set:
+            name, _, value = setting.partition("=")
+            if name not in ClosingParameters._fields:
+                raise ValueError(f"Unknown closing parameter {name} (expected one of {', '.join(ClosingParameters._fields)})")
+            overrides[name] = parse_dated_table(value)
+        results["what-if"] = compute_closing(aggregates, parameters._replace(**overrides))
+    display_closing(results)
+
+
+def scenarios(settings: Settings, args: argparse.Namespace) -> None:
+    """Compares closing scenarios (closing parameters, OPS entries added or removed, invoices moved) from the Qonto data saved by the last sync"""
+    from .services.reporting import display_scenarios
+    from .services.scenarios import load_scenarios, run_scenarios
+
+    scenario_path = args.file if args.file else f"config/{settings.name('SCENARIOS')}.txt".replace("-", "")
+    scenario_list = load_scenarios(scenario_path)
+    accounting_service = do_accounting(settings, load_snapshot(settings), close=False)
+    display_scenarios(run_scenarios(accounting_service, scenario_list, args.workers))
+
+
+def vat(settings: Settings, args: argparse.Namespace) -> None:
+    """Displays the monthly VAT figures (CA3 return) saved with the accounting"""
+    from .services.file_utils import read_dict_from_csv
+    from .services.reporting import display_vat_returns
+    from .services.vat_ledger import VatLedger
+
+    rows = read_dict_from_csv(settings.name("VAT"))
+    if not rows:
+        raise FileNotFoundError(f"No VAT figures found for {settings.name('VAT')}, please run the account command first")
+    display_vat_returns(VatLedger.from_rows(rows), args.month)
+
+
+def export_evidences(settings: Settings, args: argparse.Namespace) -> None:
+    """Downloads the evidence files referenced by the saved evidence database"""
+    from .services.evidence_db import EvidenceDB
+    from .services.qonto_client import QontoClient
+
+    if settings.ledger_storage == "sqlite":
+        from .services.sqlite_store import SqliteLedgerStore
+        store = SqliteLedgerStore(settings.name("LEDGER"))
+        try:
+            evidence_db = EvidenceDB(settings.name("EVIDENCES"))
+            evidence_db.load(store.get_evidences())
+            evidence_db.download_evidences(QontoClient(), settings.start_date)
+            with store.transaction():
+                store.save_evidences([e._asdict() for e in evidence_db.evidences])
+        finally:
+            store.close()
+        return
+
+    evidence_db = EvidenceDB(settings.name("EVIDENCES"))
+    evidence_db.load()
+    evidence_db.download_evidences(QontoClient(), settings.start_date)
+    evidence_db.save()
+
+
+def archive(settings: Settings, args: argparse.Namespace) -> None:
+    """Packages the FEC file, the evidence database and the evidence files in a single archive for the accountant"""
+    from .services.archive import build_archive
+
+    def export_path(kind: str) -> str:
+        return f"./export/{settings.name(kind).replace('-', '')}"
+
+    if not os.path.exists(f"{export_path('FEC')}.txt"):
+        raise FileNotFoundError(f"{export_path('FEC')}.txt does not exists, please run the account or sync command first")
+    members: List[Any] = [(os.path.basename(f"{export_path('FEC')}.txt"), f"{export_path('FEC')}.txt")]
+
+    if settings.ledger_storage == "sqlite":
+        import csv
+        import io
+        from .services.sqlite_store import SqliteLedgerStore, EVIDENCE_COLUMNS
+        store = SqliteLedgerStore(settings.name("LEDGER"))
+        try:
+            evidences = store.get_evidences()
+        finally:
+            store.close()
+        content = io.StringIO()
+        writer = csv.DictWriter(content, EVIDENCE_COLUMNS, delimiter="\t", quoting=csv.QUOTE_NONE)
+        writer.writeheader()
+        writer.writerows(evidences)
+        members.append((os.path.basename(f"{export_path('EVIDENCES')}.txt"), content.getvalue().encode()))
+    else:
+        from .services.file_utils import read_dict_from_csv
+        evidences = read_dict_from_csv(settings.name("EVIDENCES"), False)
+        if evidences:
+            members.append((os.path.basename(f"{export_path('EVIDENCES')}.txt"), f"{export_path('EVIDENCES')}.txt"))
+
+    # Downloaded evidence files (files of evidences renumbered since are not included)
+    for evidence in evidences:
+        if evidence["source_path"] and os.path.exists(evidence["source_path"]):
+            source_path = evidence["source_path"]
+            members.append((f"{os.path.basename(os.path.dirname(source_path))}/{os.path.basename(source_path)}", source_path))
+
+    build_archive(f"{export_path('ARCHIVE')}.{args.format}", members, args.format)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="qonto2fec", description="Create a valid FEC file directly from Qonto transactions")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Display debug messages")
+    subparsers = parser.add_subparsers(dest="command")
+
+    sub = subparsers.add_parser("sync", help=sync.__doc__)
+    sub.add_argument("--no-evidences", action="store_true", help="Do not download evidence files")
+    sub.set_defaults(func=sync)
+
+    sub = subparsers.add_parser("account", help=account.__doc__)
+    sub.set_defaults(func=account)
+
+    sub = subparsers.add_parser("multi-year", help=multi_year.__doc__)
+    sub.add_argument("--from", dest="first_start_date", required=True, help="Start date of the first fiscal year (YYYY-MM-DD)")
+    sub.add_argument("--no-evidences", action="store_true", help="Do not download evidence files")
+    sub.set_defaults(func=multi_year)
+
+    sub = subparsers.add_parser("watch", help=watch.__doc__)
+    sub.add_argument("--interval", type=int, default=300, help="Seconds between two polls")
+    sub.set_defaults(func=watch)
+
+    sub = subparsers.add_parser("validate", help=validate.__doc__)
+    sub.add_argument("fec", nargs="?", help="FEC file path (default is the FEC of the accounting period)")
+    sub.set_defaults(func=validate)
+
+    sub = subparsers.add_parser("balance", help=balance.__doc__)
+    sub.add_argument("fec", nargs="?", help="FEC file path (default is the FEC of the accounting period)")
+    sub.add_argument("--as-of", help="Balances at the end of this date (YYYY-MM-DD)")
+    sub.add_argument("--from", dest="from_date", help="Movements from this date (YYYY-MM-DD, included)")
+    sub.add_argument("--to", dest="to_date", help="Movements until this date (YYYY-MM-DD, included)")
+    sub.add_argument("--account", help="Only the accounts starting with this number")
+    sub.set_defaults(func=balance)
+
+    sub = subparsers.add_parser("diff", help=diff.__doc__)
+    sub.add_argument("old", nargs="?", help="Old FEC file path (default is the ledger of the previous sync or account run)")
+    sub.add_argument("new", nargs="?", help="New FEC file path (default is the FEC of the accounting period)")
+    sub.add_argument("--piece-ref", action="store_true", help="Also compare PieceRef (only when evidence numbers are stable between the files)")
+    sub.set_defaults(func=diff)
+
+    sub = subparsers.add_parser("serve", help=serve.__doc__)
+    sub.add_argument("fec", nargs="?", help="FEC file path (default is the FEC of the accounting period)")
+    sub.add_argument("--host", default="127.0.0.1", help="Listening address")
+    sub.add_argument("--port", type=int, default=8642, help="Listening port")
+    sub.set_defaults(func=serve)
+
+    sub = subparsers.add_parser("trace", help=trace.__doc__)
+    sub.add_argument("--line", type=int, help="FEC line number (1 is the first record)")
+    sub.add_argument("--ecriture", help="Lines of an operation (EcritureNum)")
+    sub.add_argument("--transaction", help="Lines produced by a Qonto transaction (transaction_id)")
+    sub.add_argument("--invoice", help="Lines produced by an invoice (source id)")
+    sub.add_argument("--ref", help="Lines of an evidence (PieceRef)")
+    sub.set_defaults(func=trace)
+
+    sub = subparsers.add_parser("closing", help=closing.__doc__)
+    sub.add_argument("--set", action="append", default=[], metavar="NAME=[YYYYMMDD:]VALUE[,...]",
+                     help="Closing parameter changed for the what-if (e.g. company_tax_rates=0.2 or social_tax_rates=00000000:0.167,20240601:0.455)")
+    sub.set_defaults(func=closing)
+
+    sub = subparsers.add_parser("scenarios", help=scenarios.__doc__)
+    sub.add_argument("file", nargs="?", help="Scenario file path (default is config/XXXSCENARIOSXX.txt)")
+    sub.add_argument("--workers", type=int, default=0, help="Number of processes (default is the number of processors)")
+    sub.set_defaults(func=scenarios)
+
+    sub = subparsers.add_parser("vat", help=vat.__doc__)
+    sub.add_argument("--month", help="Only this month (YYYY-MM)")
+    sub.set_defaults(func=vat)
+
+    sub = subparsers.add_parser("export-evidences", help=export_evidences.__doc__)
+    sub.set_defaults(func=export_evidences)
+
+    sub = subparsers.add_parser("archive", help=archive.__doc__)
+    sub.add_argument("--format", choices=["zip", "tar.xz"], default="zip", help="Archive format (tar.xz stores identical evidences once)")
+    sub.set_defaults(func=archive)
+
+    sub = subparsers.add_parser("replay", help=replay.__doc__)
+    sub.add_argument("--from-log", action="store_true", help="Rebuild the ledger of the last run from its event log (no accounting rules run)")
+    sub.add_argument("--from-month", help="Resume the accounting of the last run from its snapshot of this month (YYYY-MM) with the current rules")
+    sub.set_defaults(func=replay)
+
+    sub = subparsers.add_parser("changes", help=changes.__doc__)
+    sub.set_defaults(func=changes)
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import sys
+    from dotenv import load_dotenv
+
+    argv = sys.argv[1:] if argv is None else argv
+    args = build_parser().parse_args(argv)
+    logging.getLogger().setLevel(logging.DEBUG if args.verbose else logging.INFO)
+    load_dotenv()
+
+    # Full pipeline when no subcommand is given (historical behaviour)
+    if not args.command:
+        args = build_parser().parse_args(argv + ["sync"])
+
+    args.func(read_settings(), args)
+    return 0
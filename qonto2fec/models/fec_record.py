@@ -1,42 +1,93 @@
-from datetime import datetime, timedelta
-from typing import Optional, Dict
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Dict, NamedTuple, Optional, TypeVar, Union
 from .ledger_account import LedgerAccount
 from .evidence import Evidence
 from .journal import Journal
 
+T = TypeVar("T")
 
-class FecRecord:
-    """Represents a line in the French FEC (Fichier des Écritures Comptables) file."""
-
-    JournalCode: str
-    """Journal code (e.g., 'ACH' for purchases, 'VTE' for sales)."""
 
-    JournalLib: str
-    """Journal label (e.g., 'Purchases', 'Sales')."""
+FEC_COLUMNS = ["JournalCode", "JournalLib", "EcritureNum", "EcritureDate", "CompteNum", "CompteLib", "CompAuxNum", "CompAuxLib",
+               "PieceRef", "PieceDate", "EcritureLib", "Debit", "Credit", "EcritureLet", "DateLet", "ValidDate", "Montantdevise", "Idevise"]
+"""Columns of a FEC file, in order"""
 
-    EcritureNum: str
-    """Unique accounting entry number ensuring traceability."""
 
-    EcritureDate: str
-    """Accounting entry date in 'YYYYMMDD' format."""
+class FecAccount(NamedTuple):
+    """Account columns of FEC records, one instance shared by all the records of an account (flyweight)"""
 
     CompteNum: str
-    """General ledger account number (e.g., '411000' for a customer account)."""
-
     CompteLib: str
-    """General ledger account label (e.g., 'Customers')."""
-
     CompAuxNum: Optional[str]
-    """Auxiliary account number, used for third parties (customers, suppliers)."""
-
     CompAuxLib: Optional[str]
-    """Auxiliary account label (e.g., 'Client Dupont')."""
+
+
+class FecRecordTables:
+    """Journal and FecAccount instances shared by the records of an accounting run or of a loaded FEC (flyweight tables)"""
+
+    journals: Dict[Journal, Journal]
+    accounts: Dict[FecAccount, FecAccount]
+
+    def __init__(self) -> None:
+        self.journals = {}
+        self.accounts = {}
+
+    def share(self, fec_record: 'FecRecord') -> 'FecRecord':
+        """Makes a record use the journal and account instances already used by the other records of the table"""
+        fec_record.journal = _shared(self.journals, fec_record.journal)
+        fec_record.account = _shared(self.accounts, fec_record.account)
+        return fec_record
+
+
+def _shared(cache: Dict[T, T], value: T) -> T:
+    """Instance equal to value already used by other records (value itself the first time)"""
+    return cache.setdefault(value, value)
+
+
+@lru_cache(maxsize=16384)
+def _to_ordinal(date: str) -> Union[int, str]:
+    """Date ordinal of a YYYYMMDD date (0 if empty, the text itself if it is not a valid date)"""
+    if not date:
+        return 0
+    try:
+        return datetime.strptime(date, "%Y%m%d").toordinal()
+    except ValueError:
+        return date
+
+
+@lru_cache(maxsize=16384)
+def _from_ordinal(ordinal: int) -> str:
+    return date.fromordinal(ordinal).strftime("%Y%m%d") if ordinal else ""
+
+
+def _date_text(value: Union[int, str]) -> str:
+    return value if isinstance(value, str) else _from_ordinal(value)
+
+
+class FecRecord:
+    """Represents a line in the French FEC (Fichier des Écritures Comptables) file.
+
+    Journal and account columns are read from Journal and FecAccount instances (shared through FecRecordTables), dates are stored as
+    date ordinals : FEC columns are properties derived from them (see FEC_COLUMNS).
+    """
+
+    __slots__ = ("journal", "account", "EcritureNum", "ecriture_date", "PieceRef", "piece_date", "EcritureLib", "Debit", "Credit",
+                 "EcritureLet", "date_let", "valid_date", "Montantdevise", "Idevise")
+
+    journal: Journal
+    account: FecAccount
+
+    EcritureNum: str
+    """Unique accounting entry number ensuring traceability."""
+
+    ecriture_date: Union[int, str]
+    """Accounting entry date (date ordinal)"""
 
     PieceRef: str
     """Reference of the supporting document (e.g., invoice number)."""
 
-    PieceDate: str
-    """Date of the supporting document (invoice, expense report) in 'YYYYMMDD' format."""
+    piece_date: Union[int, str]
+    """Date of the supporting document (date ordinal, 0 if none)"""
 
     EcritureLib: str
     """Label of the accounting entry (e.g., 'Customer invoice n°1234')."""
@@ -50,11 +101,11 @@ class FecRecord:
     EcritureLet: Optional[str]
     """Matching code to link related accounting entries (e.g., 'A123')."""
 
-    DateLet: Optional[str]
-    """Matching date in 'YYYYMMDD' format, if the entry is matched."""
+    date_let: Union[int, str]
+    """Matching date (date ordinal, 0 if the entry is not matched)"""
 
-    ValidDate: str
-    """Accounting validation date in 'YYYYMMDD' format."""
+    valid_date: Union[int, str]
+    """Accounting validation date (date ordinal)"""
 
     Montantdevise: Optional[str]
     """Amount in foreign currency (if applicable)."""
@@ -69,27 +120,74 @@ class FecRecord:
         end_of_month = datetime(when.year, when.month, 1) + timedelta(days=32)
         end_of_month = end_of_month - timedelta(days=end_of_month.day + 1)
 
-        self.JournalCode = journal.code
-        self.JournalLib = journal.label
+        self.journal = journal
+        self.account = FecAccount(account.fec_compte_num(), account.fec_compte_lib(), account.fec_compte_aux_num(), account.fec_compte_aux_lib())
         self.EcritureNum = str(ecriture_num)
-        self.EcritureDate = when.strftime("%Y%m%d")
-        self.CompteNum = account.fec_compte_num()
-        self.CompteLib = account.fec_compte_lib()
-        self.CompAuxNum = account.fec_compte_aux_num()
-        self.CompAuxLib = account.fec_compte_aux_lib()
+        self.ecriture_date = _to_ordinal(when.strftime("%Y%m%d"))
         self.PieceRef = str(evidence.number) if evidence else ""
-        self.PieceDate = evidence.when if evidence else ""
+        self.piece_date = _to_ordinal(evidence.when) if evidence else 0
         self.EcritureLib = label
         self.Debit = FecRecord.centToFrenchFecFormat(debit_cent)
         self.Credit = FecRecord.centToFrenchFecFormat(credit_cent)
         self.EcritureLet = ecriture_rec
-        self.DateLet = end_of_month.strftime("%Y%m%d") if ecriture_rec else None
-        self.ValidDate = datetime(when.year, 12, 31).strftime("%Y%m%d")
+        self.date_let = _to_ordinal(end_of_month.strftime("%Y%m%d")) if ecriture_rec else 0
+        self.valid_date = self.ecriture_date if journal.code == "AN" else _to_ordinal(f"{when.year}1231")
         self.Montantdevise = None
         self.Idevise = None
 
-        if journal.code == "AN":
-            self.ValidDate = when.strftime("%Y%m%d")
+    @property
+    def JournalCode(self) -> str:
+        """Journal code (e.g., 'ACH' for purchases, 'VTE' for sales)."""
+        return self.journal.code
+
+    @property
+    def JournalLib(self) -> str:
+        """Journal label (e.g., 'Purchases', 'Sales')."""
+        return self.journal.label
+
+    @property
+    def EcritureDate(self) -> str:
+        """Accounting entry date in 'YYYYMMDD' format."""
+        return _date_text(self.ecriture_date)
+
+    @property
+    def CompteNum(self) -> str:
+        """General ledger account number (e.g., '411000' for a customer account)."""
+        return self.account.CompteNum
+
+    @property
+    def CompteLib(self) -> str:
+        """General ledger account label (e.g., 'Customers')."""
+        return self.account.CompteLib
+
+    @property
+    def CompAuxNum(self) -> Optional[str]:
+        """Auxiliary account number, used for third parties (customers, suppliers)."""
+        return self.account.CompAuxNum
+
+    @property
+    def CompAuxLib(self) -> Optional[str]:
+        """Auxiliary account label (e.g., 'Client Dupont')."""
+        return self.account.CompAuxLib
+
+    @property
+    def PieceDate(self) -> str:
+        """Date of the supporting document (invoice, expense report) in 'YYYYMMDD' format."""
+        return _date_text(self.piece_date)
+
+    @property
+    def DateLet(self) -> Optional[str]:
+        """Matching date in 'YYYYMMDD' format, if the entry is matched."""
+        return _date_text(self.date_let) if self.date_let else None
+
+    @DateLet.setter
+    def DateLet(self, value: Optional[str]) -> None:
+        self.date_let = _to_ordinal(value) if value else 0
+
+    @property
+    def ValidDate(self) -> str:
+        """Accounting validation date in 'YYYYMMDD' format."""
+        return _date_text(self.valid_date)
 
     def __str__(self) -> str:
         return str(self._asdict())
@@ -150,25 +248,21 @@ class FecRecord:
         }
 
     @classmethod
-    def from_dict(cls, data: Dict[str, str]) -> 'FecRecord':
-        """Creates a FecRecord instance from a dictionary."""
+    def from_dict(cls, data: Dict[str, str], tables: Optional[FecRecordTables] = None) -> 'FecRecord':
+        """Creates a FecRecord instance from a dictionary (sharing its journal and account with the records of tables)."""
         instance = cls.__new__(cls)
-        instance.JournalCode = data.get("JournalCode", "")
-        instance.JournalLib = data.get("JournalLib", "")
+        instance.journal = Journal(data.get("JournalCode", ""), data.get("JournalLib", ""))
+        instance.account = FecAccount(data.get("CompteNum", ""), data.get("CompteLib", ""), data.get("CompAuxNum"), data.get("CompAuxLib"))
         instance.EcritureNum = data.get("EcritureNum", "")
-        instance.EcritureDate = data.get("EcritureDate", "")
-        instance.CompteNum = data.get("CompteNum", "")
-        instance.CompteLib = data.get("CompteLib", "")
-        instance.CompAuxNum = data.get("CompAuxNum")
-        instance.CompAuxLib = data.get("CompAuxLib")
+        instance.ecriture_date = _to_ordinal(data.get("EcritureDate", ""))
         instance.PieceRef = data.get("PieceRef", "")
-        instance.PieceDate = data.get("PieceDate", "")
+        instance.piece_date = _to_ordinal(data.get("PieceDate", ""))
         instance.EcritureLib = data.get("EcritureLib", "")
         instance.Debit = data.get("Debit", "0,00")
         instance.Credit = data.get("Credit", "0,00")
         instance.EcritureLet = data.get("EcritureLet")
         instance.DateLet = data.get("DateLet")
-        instance.ValidDate = data.get("ValidDate", "")
+        instance.valid_date = _to_ordinal(data.get("ValidDate", ""))
         instance.Montantdevise = data.get("Montantdevise")
         instance.Idevise = data.get("Idevise")
-        return instance
+        return tables.share(instance) if tables else instance
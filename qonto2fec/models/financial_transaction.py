@@ -1,19 +1,53 @@
 from datetime import datetime
-from typing import Any, List
+from typing import Any, Dict, List, Optional, Tuple
 from .fec_record import FecRecord
 
 
+MAIN_BANK_ACCOUNT = "512"
+
+INVESTMENT_ACCOUNT = "512001"
+"""Counterpart of an internal transfer when the other account is not one of the configured IBANs (term deposit)"""
+
+GF_PARTNER_ACCOUNT = "512002"
+"""Counterpart of the transfers to GF PARTNER (Boursorama) when its IBAN is not one of the configured IBANs"""
+
+VAT_RATES = (0.0, 5.5, 10, 20)
+"""VAT rates supported (percent)"""
+
+
 class FinancialTransaction:
-    amount_excluding_vat: int = 0
+    """
+    Bank transaction retained from a raw Qonto transaction.
+    Only the fields read by the accounting rules are kept (slots, no per instance dict).
+    The fields needed by the validation are converted when the transaction is built, the others (LAZY_FIELDS)
+    are converted from the raw Qonto data on first access.
+    """
+
+    FIELDS = ("transaction_id", "amount_excluding_vat", "vat", "when", "attachments", "category", "thirdparty_name", "note",
+              "reference", "operation_type", "fec_records", "bank_account", "counterparty_account", "vat_items")
+    """Fields of a transaction (pickled state and _asdict)"""
+
+    LAZY_FIELDS = ("attachments", "category", "thirdparty_name", "note", "reference", "counterparty_account")
+    """Fields converted from the raw Qonto data on first access"""
+
+    __slots__ = FIELDS + ("_raw", "_accounts_by_iban")
+
+    transaction_id: str
+    """ Qonto transaction identifier """
+
+    amount_excluding_vat: int
     """ Net amount - 2 decimal value (1,23 euros is 123) """
 
-    vat: int = 0
+    vat: int
     """ Net amount - 2 decimal value (1,23 euros is 123) """
 
+    vat_items: Tuple[Tuple[float, int, int], ...]
+    """ VAT details (rate, net amount, VAT amount), signed like the amounts - empty without VAT details """
+
     when: datetime
     """ Operation date """
 
-    attachments: List[str] = []
+    attachments: List[str]
     """ Evidence pieces references """
 
     category: str
@@ -25,24 +59,92 @@ class FinancialTransaction:
     note: str
     """ Manually added note """
 
-    reference: str = ""
+    reference: str
     """ Reference """
 
     operation_type: str
     """ Operation type"""
 
-    fec_records: List[FecRecord] = []
+    fec_records: List[FecRecord]
     """ Associated fec records"""
 
+    bank_account: str
+    """ Ledger account of the bank account (IBAN) the transaction comes from """
+
+    counterparty_account: Optional[str]
+    """ Ledger account of the counterparty of a transfer when its IBAN is one of the configured IBANs """
+
+    _raw: Optional[Dict[str, Any]]
+    """ Raw Qonto transaction (None once every lazy field is converted) """
+
+    _accounts_by_iban: Optional[Dict[str, str]]
+    """ Ledger account per configured IBAN, kept with the raw data for counterparty_account """
+
+    def __getattr__(self, name: str) -> Any:
+        """Converts a lazy field on its first access (only called when the slot is not set yet)"""
+        if name not in FinancialTransaction.LAZY_FIELDS or self._raw is None:
+            raise AttributeError(f"'FinancialTransaction' object has no attribute '{name}'")
+        value = getattr(self, f"_get_{name}")(self._raw)
+        setattr(self, name, value)
+        for lazy_field in FinancialTransaction.LAZY_FIELDS:
+            try:
+                object.__getattribute__(self, lazy_field)
+            except AttributeError:
+                return value
+        # Every lazy field is converted : the raw data is released
+        self._raw = None
+        self._accounts_by_iban = None
+        return value
+
+    def _get_attachments(self, transaction: Dict[str, Any]) -> Any:
+        return transaction["attachment_ids"]
+
+    def _get_category(self, transaction: Dict[str, Any]) -> Any:
+        return transaction["category"] if len(transaction["label_ids"]) == 0 else transaction["labels"][0]["name"]
+
+    def _get_thirdparty_name(self, transaction: Dict[str, Any]) -> Any:
+        return transaction["label"]
+
+    def _get_note(self, transaction: Dict[str, Any]) -> Any:
+        note = transaction["note"]
+        if self.operation_type == "qonto_fee" and not note:
+            note = "Frais bancaires Qonto"
+        return note
+
+    def _get_reference(self, transaction: Dict[str, Any]) -> Any:
+        return transaction["reference"]
+
+    def _get_counterparty_account(self, transaction: Dict[str, Any]) -> Any:
+        counterparty = transaction.get("transfer") or transaction.get("income") or {}
+        counterparty_iban = str(counterparty.get("counterparty_account_number") or "").replace(" ", "").upper()
+        return (self._accounts_by_iban or {}).get(counterparty_iban)
+
     def __str__(self) -> str:
-        return str(vars(self))
+        return str(self._asdict())
+
+    def _asdict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in FinancialTransaction.FIELDS}
 
-    def __init__(self, transaction: Any) -> None:
+    def __getstate__(self) -> Dict[str, Any]:
+        return self._asdict()
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        """Restores a pickled transaction (snapshots saved before slots contain the same fields)"""
+        state = {"reference": "", "fec_records": [], "bank_account": MAIN_BANK_ACCOUNT, "counterparty_account": None, "vat_items": (), **state}
+        for name in FinancialTransaction.FIELDS:
+            setattr(self, name, state[name])
+        self._raw = None
+        self._accounts_by_iban = None
+
+    def __init__(self, transaction: Any, bank_account: str = MAIN_BANK_ACCOUNT, accounts_by_iban: Optional[Dict[str, str]] = None) -> None:
         """
-        Load data from a raw Qonto transaction.
+        Validates a raw Qonto transaction and keeps it for the conversion of the lazy fields, each raw field is read once.
+        accounts_by_iban (ledger account per configured IBAN) resolves the account of the counterparty of a transfer.
         If any validation problem is encountered, raise a ValueError Exception.
         """
-        name = f"{transaction['label']} ({transaction['transaction_id']})"
+        transaction_id = transaction["transaction_id"]
+        operation_type = transaction["operation_type"]
+        name = f"{transaction['label']} ({transaction_id})"
 
         if transaction["status"] != "completed":
             raise ValueError(f"{name} : Transaction is not yet completed or have been declined")
@@ -54,46 +156,46 @@ class FinancialTransaction:
             transaction["attachment_required"]
             and len(transaction["attachments"]) == 0
             and not transaction["attachment_lost"]
-            and transaction["operation_type"] != "qonto_fee"
+            and operation_type != "qonto_fee"
         ):
             raise ValueError(f"{name}: A required attachment is missing")
 
         if len(transaction["label_ids"]) > 1:
             raise ValueError(f"{name}: Only one label per transaction is allowed")
 
-        amount = transaction["amount_cents"]
         side = 1 if transaction["side"] == "credit" else -1
-
-        if "vat_details" in transaction is not None and "items" in transaction["vat_details"] and len(transaction["vat_details"]["items"]) > 0:
-            amount_excluding_vat = 0.0
-            vat = 0.0
-            for vat_detail in transaction["vat_details"]["items"]:
-                if vat_detail["rate"] not in [0.0, 5.5, 10, 20]:
+        amount = side * transaction["amount_cents"]
+
+        vat_items = []
+        raw_vat_items = (transaction.get("vat_details") or {}).get("items")
+        if raw_vat_items:
+            amount_excluding_vat = 0
+            vat = 0
+            for vat_detail in raw_vat_items:
+                if vat_detail["rate"] not in VAT_RATES:
                     raise ValueError(f"{name}: VAT rate not supported : {vat_detail['rate']}")
-                amount_excluding_vat += side * vat_detail["amount_excluding_vat_cents"]
                 if vat_detail["amount_cents"] is None:
                     raise ValueError(f"{name}: VAT amount not defined : {vat_detail['amount_cents']}")
-                vat += side * vat_detail["amount_cents"]
+                vat_items.append((float(vat_detail["rate"]), side * vat_detail["amount_excluding_vat_cents"], side * vat_detail["amount_cents"]))
+                amount_excluding_vat += vat_items[-1][1]
+                vat += vat_items[-1][2]
         else:
-            vat = 0.0
-            amount_excluding_vat = side * amount
-
-        if vat + amount_excluding_vat != amount * side:
-            raise ValueError(f"{name}: Amount error ! {vat} + {amount_excluding_vat} != {amount * side}")
+            vat = 0
+            amount_excluding_vat = amount
 
-        if transaction["operation_type"] == "qonto_fee" and (transaction["note"] is None or transaction["note"] == ""):
-            transaction["note"] = "Frais bancaires Qonto"
+        if vat + amount_excluding_vat != amount:
+            raise ValueError(f"{name}: Amount error ! {float(vat)} + {float(amount_excluding_vat)} != {amount}")
 
+        self.transaction_id = transaction_id
         self.amount_excluding_vat = int(amount_excluding_vat)
         self.vat = int(vat)
+        self.vat_items = tuple(vat_items)
         self.when = transaction["settled_at"]
-        self.attachments = transaction["attachment_ids"]
-        self.category = transaction["category"] if len(transaction["label_ids"]) == 0 else transaction["labels"][0]["name"]
-        self.thirdparty_name = transaction["label"]
-        self.note = transaction["note"]
-        self.reference = transaction["reference"]
-        self.operation_type = transaction["operation_type"]
+        self.operation_type = operation_type
         self.fec_records = []
+        self.bank_account = bank_account
+        self._raw = transaction
+        self._accounts_by_iban = accounts_by_iban
 
     def attach_fec_record(self, fec_record: FecRecord) -> None:
         self.fec_records.append(fec_record)
@@ -0,0 +1,19 @@
+from typing import List, NamedTuple
+from .financial_transaction import FinancialTransaction
+from .invoice import Invoice
+
+
+class QontoSnapshot(NamedTuple):
+    """Data retrieved from Qonto for an accounting period, saved to replay the accounting offline"""
+
+    client_invoices: List[Invoice]
+    """Client invoices issued during the period"""
+
+    client_credit_notes: List[Invoice]
+    """Client credit notes issued during the period"""
+
+    supplier_invoices: List[Invoice]
+    """Supplier invoices not yet paid"""
+
+    transactions: List[FinancialTransaction]
+    """Completed bank transactions"""
@@ -1,51 +1,145 @@
+import heapq
 import logging
 from datetime import datetime, timedelta
-from typing import Any, Dict, List, Optional, Tuple
-from tabulate import tabulate
-from colorama import Fore, Style
+from operator import attrgetter, itemgetter
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
 
 from .evidence_db import EvidenceDB
 from .ledger_account_db import LedgerAccountDB
 from .journal_db import JournalDB
 from .misc_transaction_db import MiscellaneousTransactionDB
-from ..models.financial_transaction import FinancialTransaction
+from ..models.financial_transaction import FinancialTransaction, GF_PARTNER_ACCOUNT, INVESTMENT_ACCOUNT
 from ..models.invoice import Invoice, CLIENT_CREDIT, CLIENT_INVOICE, SUPPLIER_INVOICE
-from ..models.fec_record import FecRecord
+from ..models.fec_record import FecRecord, FecRecordTables
+from ..models.ledger_account import LedgerAccount
+from ..models.misc_transaction import MiscellaneousTransaction
 from .file_utils import save_dict_to_csv, read_dict_from_csv
-from .date_utils import conv_date_from_utc_to_local
+from .date_utils import conv_date_from_utc_to_local, get_month_end, get_months
+from .fec_validation import validate_fec
+from .balance_accumulator import BalanceAccumulator
+from .ledger_query import LedgerQuery
+from .vat_ledger import VatLedger
+from .accounting_config import load_accounting_config
+from .classification import (ClassificationCache, PostingLine, PostingOperation, PostingTemplate, TransactionSignature,
+                             AMOUNT_FORMULAS, BANK, ZERO, NET, MINUS_NET, ABS_NET, ABS_VAT, MINUS_ABS_VAT, ABS_GROSS)
+from .lettrage import LettrageAllocator
+from .reconciliation import find_amounts_matching_total, DEFAULT_SEARCH_LIMIT
+from .reporting import display_cumulative_monthly_balance
+from .sqlite_store import SqliteLedgerStore
+from .event_log import EventLog
+from .closing import ClosingAggregates, ClosingParameters, ClosingResult, compute_closing, get_closing_aggregates, get_nb_months, \
+    load_closing_parameters
+from .provenance import Provenance, ProvenanceIndex, BANK_TRANSACTION, CLOSING, INVOICE, MISC_TRANSACTION, OPENING
+
+INVOICE_EVENT = 0
+MISC_EVENT = 1
+BANK_EVENT = 2
+"""Event types, in posting order for a same date"""
+
+
+class InvoiceEvent(NamedTuple):
+    when: datetime
+    order: int
+    invoice: Invoice
+
+
+class MiscTransactionEvent(NamedTuple):
+    when: datetime
+    order: int
+    misc_transaction: MiscellaneousTransaction
+
+
+class BankEvent(NamedTuple):
+    when: datetime
+    order: int
+    transaction: FinancialTransaction
+
+
+PostingEvent = Union[InvoiceEvent, MiscTransactionEvent, BankEvent]
+"""Something to post, merged by (when, order) in doAccounting"""
 
 
 class AccountingService:
 
     fec_records: List[FecRecord] = []
-    previous_year_fec_records: List[FecRecord] = []
+    fec_record_tables: FecRecordTables
+    """Journal and account instances shared by the records of the accounting run"""
+
+    balances: BalanceAccumulator
+    ledger_query: Optional[LedgerQuery] = None
+    vat_ledger: VatLedger
+    classification_cache: ClassificationCache
+    previous_year_balances: BalanceAccumulator
     fec_counter: int = 0
-    reconciliation_counter: int = 0
+    lettrage: LettrageAllocator
+    reconciliation_search_limit: int = DEFAULT_SEARCH_LIMIT
+    ledger_storage: str = "tsv"
+    """tsv (tab separated files) or sqlite (database, the FEC file is exported from the database)"""
+
+    provenance: ProvenanceIndex
+    current_provenance: Provenance
+    """Provenance of the FEC records being created"""
+
+    closing_parameters: ClosingParameters
+    """Rates and thresholds of the year-end closing (Closing section of accounting.cfg)"""
+
+    closing: Optional[ClosingResult] = None
+    """Provisions and taxes posted when closing the accounting period"""
+
+    event_log: Optional[EventLog] = None
+    """Log of the posting decisions (records created, lettrage, invoices and miscellaneous transactions posted), closed with the accounting"""
 
     journal_db: JournalDB
     evidence_db: EvidenceDB
     leadger_account_db: LedgerAccountDB
     misc_transaction_db: MiscellaneousTransactionDB
+    misc_path: str
+    """Miscellaneous transactions (OPS) file"""
+
     invoices: List[Invoice]
 
-    def __init__(self, siren: str, start_date: str, end_date: str) -> None:
+    def __init__(self, siren: str, start_date: str, end_date: str, reconciliation_search_limit: int = DEFAULT_SEARCH_LIMIT,
+                 ledger_storage: str = "tsv", previous_year: Optional["AccountingService"] = None) -> None:
+        """previous_year : closed accounting of the previous fiscal year (multi-year run), used instead of the saved FEC and ledger accounts"""
+        if ledger_storage not in ["tsv", "sqlite"]:
+            raise ValueError(f"Unknown ledger storage : {ledger_storage}")
+
         self.start_date = start_date
         self.end_date = end_date
         self.fec_filename = f"{siren}FEC{str(end_date)}"
         self.invoices = []
         self.invoices_filename = f"{siren}INVOICES{str(end_date)}"
+        self.vat_filename = f"{siren}VAT{str(end_date)}"
+        self.provenance_filename = f"{siren}PROVENANCE{str(end_date)}"
+        self.ledger_db_name = f"{siren}LEDGER{str(end_date)}"
+        self.ledger_storage = ledger_storage
+        self.reconciliation_search_limit = reconciliation_search_limit
+        self.lettrage = LettrageAllocator()
+        self.fec_records = []
+        self.fec_record_tables = FecRecordTables()
+        self.balances = BalanceAccumulator()
+        self.ledger_query = None
+        self.vat_ledger = VatLedger()
+        self.classification_cache = ClassificationCache()
+        self.provenance = ProvenanceIndex()
+        self.current_provenance = Provenance(OPENING, "FEC", start_date)
+        self.closing_parameters = load_closing_parameters(load_accounting_config().closing)
+        self.closing = None
 
         # Load databases
         self.journal_db = JournalDB()
         self.evidence_db = EvidenceDB(f"{siren}EVIDENCES{str(end_date)}")
-        self.leadger_account_db = LedgerAccountDB(f"{siren}ACCOUNTS")
+        self.leadger_account_db = LedgerAccountDB(f"{siren}ACCOUNTS", previous_year.leadger_account_db.accounts if previous_year else None)
 
         # Load miscellaneous transactions
-        misc_path = f"config/{siren}OPS{str(end_date)}.txt"
-        self.misc_transaction_db = MiscellaneousTransactionDB(misc_path, self.journal_db, self.leadger_account_db)
+        self.misc_path = f"config/{siren}OPS{str(end_date)}.txt"
+        self.misc_transaction_db = MiscellaneousTransactionDB(self.misc_path, self.journal_db, self.leadger_account_db)
 
-        # Load previous fiscal year FEC
-        self.previous_year_fec_records = self._load_previous_fec(siren)
+        # Load previous fiscal year FEC balances (kept in memory in a multi-year run)
+        if previous_year:
+            self.previous_year_balances = previous_year.balances
+        else:
+            self.previous_year_balances = BalanceAccumulator(self._load_previous_fec(siren))
 
     def _load_previous_fec(self, siren: str) -> List[FecRecord]:
         start_date_dt = datetime.strptime(self.start_date, "%Y-%m-%d")
@@ -53,42 +147,101 @@ class AccountingService:
         previous_fec_name = f"{siren}FEC{previous_day.strftime('%Y-%m-%d')}"
 
         data = read_dict_from_csv(previous_fec_name, escape=False)
-        return [FecRecord.from_dict(row) for row in data]
+        tables = FecRecordTables()
+        return [FecRecord.from_dict(row, tables) for row in data]
 
     def save(self) -> None:
-        # Save FEC records
-        save_dict_to_csv([r._asdict() for r in self.fec_records], self.fec_filename, False)
+        fec_rows = [r._asdict() for r in self.fec_records]
+        invoice_rows = [i._asdict() for i in self.invoices if i.type in [CLIENT_INVOICE, CLIENT_CREDIT]]
+
+        if self.ledger_storage == "sqlite":
+            # Save everything in one database transaction, then export the FEC file from the database
+            store = SqliteLedgerStore(self.ledger_db_name)
+            try:
+                with store.transaction():
+                    store.save_accounts([a._asdict() for a in self.leadger_account_db.accounts])
+                    store.save_evidences([e._asdict() for e in self.evidence_db.evidences])
+                    store.save_invoices(invoice_rows)
+                    store.save_fec_records(fec_rows)
+                store.export_fec(self.fec_filename)
+            finally:
+                store.close()
+        else:
+            # Save FEC records
+            save_dict_to_csv(fec_rows, self.fec_filename, False)
+
+            # Save Invoices
+            save_dict_to_csv(invoice_rows, self.invoices_filename, False)
+
+            # Save evidences database (completed with file paths when evidences are exported)
+            self.evidence_db.save()
+
+        # Save the provenance of each FEC line
+        self.provenance.save(self.provenance_filename)
 
-        # Save Invoices
-        save_dict_to_csv([i._asdict() for i in self.invoices if i.type in [CLIENT_INVOICE, CLIENT_CREDIT]], self.invoices_filename, False)
+        # Save monthly VAT figures
+        save_dict_to_csv(self.vat_ledger.to_rows(), self.vat_filename)
 
-        # Save ledger accounts database
+        # Save ledger accounts database (also the ledger account configuration of the next fiscal year)
         self.leadger_account_db.save()
 
     def exportEvidences(self, qonto_client: Any) -> None:
         self.evidence_db.download_evidences(qonto_client, self.start_date)
-        self.evidence_db.save()
+        if self.ledger_storage == "sqlite":
+            store = SqliteLedgerStore(self.ledger_db_name)
+            try:
+                with store.transaction():
+                    store.save_evidences([e._asdict() for e in self.evidence_db.evidences])
+            finally:
+                store.close()
+        else:
+            self.evidence_db.save()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """Pickled without its event log (checkpoints, scenarios)"""
+        return {**self.__dict__, "event_log": None}
 
     def addInvoices(self, invoices: List[Invoice]) -> None:
         self.invoices.extend(invoices)
 
-    def _getNextOpCounter(self, when: Optional[datetime]) -> int:
-        if when:
-            self.doAccountingForMiscTransactionBefore(when)
-            self.doAccountingForInvoicesBefore(when)
+    def reloadPendingInputs(self, invoices: List[Invoice], posted_until: Optional[datetime]) -> None:
+        """Replaces the invoices and miscellaneous transactions not posted yet (after posted_until, all if None)
+           by the current ones (OPS file read again)
+        """
+        self.invoices = [invoice for invoice in self.invoices if invoice.fec_record]
+        self.addInvoices([invoice for invoice in invoices if posted_until is None or invoice.when > posted_until])
+        self.misc_transaction_db = MiscellaneousTransactionDB(self.misc_path, self.journal_db, self.leadger_account_db)
+        if posted_until is not None:
+            self.misc_transaction_db.getUntil(posted_until)
 
+    def _getNextOpCounter(self) -> int:
         self.fec_counter += 1
         return self.fec_counter
 
-    def _getNextReconciliation(self) -> str:
-        i1 = self.reconciliation_counter % 26
-        i2 = int(self.reconciliation_counter / 26) % 26
-        i3 = int(self.reconciliation_counter / 26 / 26) % 26
-        rec = f"{chr(i3 + ord('A'))}{chr(i2 + ord('A'))}{chr(i1 + ord('A'))}"
-        self.reconciliation_counter += 1
-        if i3 > 25:
-            raise Exception("Reconciliation limit reached")
-        return rec
+    def _getNextReconciliation(self, account_code: str, thirdparty_name: str) -> str:
+        account = self.leadger_account_db.get_or_create(account_code, thirdparty_name)
+        return self.lettrage.allocate(account.fec_compte_num())
+
+    def _appendFecRecord(self, fec_record: FecRecord) -> FecRecord:
+        self.fec_record_tables.share(fec_record)
+        self.fec_records.append(fec_record)
+        self.balances.add(fec_record)
+        if self.current_provenance.kind != OPENING:
+            self.vat_ledger.record(fec_record)
+        self.provenance.add(str(fec_record.EcritureNum), self.current_provenance)
+        if self.event_log:
+            self.event_log.record(fec_record, self.current_provenance)
+        return fec_record
+
+    def _letter(self, fec_record: FecRecord, rec: str, date_let: Optional[str]) -> None:
+        if fec_record.EcritureLet:
+            self.lettrage.detach(fec_record)
+        fec_record.EcritureLet = rec
+        fec_record.DateLet = date_let
+        self.lettrage.attach(fec_record)
+        self.balances.letter(fec_record)
+        if self.event_log:
+            self.event_log.lettrage(fec_record)
 
     def _createFecRecordFromBankTransaction(self, transaction: FinancialTransaction,
                                             journal_code: str, account: str,
@@ -126,66 +279,58 @@ class AccountingService:
             ecriture_rec=rec
         )
         transaction.attach_fec_record(fecRecord)
-        self.fec_records.append(fecRecord)
+        self._appendFecRecord(fecRecord)
+        if rec:
+            self.lettrage.attach(fecRecord)
         return fecRecord
 
     def generateRAN(self) -> None:
         """
         Generates opening operation from previous fiscal year
         """
+        self.current_provenance = Provenance(OPENING, "FEC", self.start_date)
 
-        if not self.previous_year_fec_records:
+        previous_year = self.previous_year_balances
+        if not previous_year.compte_nums:
             return
 
-        # 1. Dictionnary to accumulate balance per account (in cents)
-        # Key : (CompteNum)
-        aggregate_balances: Dict[str, int] = {}
-
-        # 2. Initialization
+        # 1. Initialization
         ran_journal = self.journal_db.get_by_code("AN")
         ran_date = conv_date_from_utc_to_local(self.start_date)
-        ecriture_num = self._getNextOpCounter(None)
-        result = 0
+        ecriture_num = self._getNextOpCounter()
         an_evidence = self.evidence_db.get_or_add("AN", f"AN{ran_date.year}", ran_date)
 
-        for record in self.previous_year_fec_records:
-
-            # 1. Keep account class 1 to 5 and lines without accounting code
-            if record.CompteNum == '':
+        # 2. Unpaid customer or supplier (lines without lettrage are kept)
+        # Key : (CompteNum)
+        open_balances: Dict[str, int] = {}
+        for record in previous_year.open_items:
+            if record.CompteNum == '' or record.CompteNum[0] in "67" or not record.CompAuxNum:
                 continue
 
-            if record.CompteNum[0] in "67":
-                result += record.getCreditAsCent() - record.getDebitAsCent()
-                continue
+            acc = self.leadger_account_db.get_by_code_or_fail(record.CompteNum + record.CompAuxNum)
+            self._appendFecRecord(FecRecord(
+                when=ran_date,
+                label=record.EcritureLib,
+                journal=ran_journal,
+                account=acc,
+                debit_cent=record.getDebitAsCent(),
+                credit_cent=record.getCreditAsCent(),
+                ecriture_num=ecriture_num,
+                evidence=an_evidence
+            ))
+            open_balances[record.CompteNum] = open_balances.get(record.CompteNum, 0) + record.getDebitAsCent() - record.getCreditAsCent()
 
-            # 2. Unpaid customer or supplier
-            if record.CompAuxNum and (not record.EcritureLet or record.EcritureLet.strip() == ""):
-                # Keep the line only if Lettrage is mission (not payed)
-                acc = self.leadger_account_db.get_by_code_or_fail(record.CompteNum + record.CompAuxNum)
-
-                new_rec = FecRecord(
-                    when=ran_date,
-                    label=record.EcritureLib,
-                    journal=ran_journal,
-                    account=acc,
-                    debit_cent=record.getDebitAsCent(),
-                    credit_cent=record.getCreditAsCent(),
-                    ecriture_num=ecriture_num,
-                    evidence=an_evidence
-                )
-                self.fec_records.append(new_rec)
-
-            # 3. Other accounts (total aggregate per account)
-            else:
-                amount = record.getDebitAsCent() - record.getCreditAsCent()
-                aggregate_balances[record.CompteNum] = aggregate_balances.get(record.CompteNum, 0) + amount
+        # 3. Other accounts of class 1 to 5 (total aggregate per account)
+        for q_num, balance in previous_year.compte_nums.items():
+            if q_num == '' or q_num[0] in "67":
+                continue
 
-        for q_num, total_cent in aggregate_balances.items():
+            total_cent = -balance - open_balances.get(q_num, 0)
             if total_cent == 0:
                 continue
 
             # Création du FecRecord de RAN
-            new_record = FecRecord(
+            self._appendFecRecord(FecRecord(
                 when=ran_date,
                 label=f"Report à nouveau {ran_date.year}",
                 journal=ran_journal,
@@ -194,13 +339,13 @@ class AccountingService:
                 credit_cent=abs(total_cent) if total_cent < 0 else 0,
                 ecriture_num=ecriture_num,
                 evidence=an_evidence
-            )
-
-            self.fec_records.append(new_record)
+            ))
 
+        # 4. Result (account class 6 and 7)
+        result = previous_year.classes.get("6", 0) + previous_year.classes.get("7", 0)
         if result >= 0:
             # Création du FecRecord de RAN
-            new_record = FecRecord(
+            self._appendFecRecord(FecRecord(
                 when=ran_date,
                 label=f"Bénéfice exercice {ran_date.year}",
                 journal=ran_journal,
@@ -209,12 +354,10 @@ class AccountingService:
                 credit_cent=abs(result),
                 ecriture_num=ecriture_num,
                 evidence=an_evidence
-            )
-
-            self.fec_records.append(new_record)
+            ))
         else:
             # Création du FecRecord de RAN
-            new_record = FecRecord(
+            self._appendFecRecord(FecRecord(
                 when=ran_date,
                 label=f"Pertes exercice {ran_date.year}",
                 journal=ran_journal,
@@ -223,137 +366,147 @@ class AccountingService:
                 credit_cent=0,
                 ecriture_num=ecriture_num,
                 evidence=an_evidence
-            )
-
-            self.fec_records.append(new_record)
+            ))
 
     def doAccountingForBankTransaction(self, transaction: FinancialTransaction) -> None:
         """Apply accounting rules for a bank transaction,
            search and attach generated FEC records to the transaction
            and append it in fec_records collection
         """
+        self.current_provenance = Provenance(BANK_TRANSACTION, "Qonto", transaction.transaction_id)
 
         # Invoice payment
-        if transaction.category in ["sales", "other_income"] \
-                and transaction.amount_excluding_vat > 0 \
-                and "Virement interne" != transaction.reference:
+        if AccountingService._isCustomerPayment(transaction):
 
-            num = self._getNextOpCounter(transaction.when)
-            rec = self._getNextReconciliation()
-            bank_fec_record = self._createFecRecordFromBankTransaction(transaction, "BQ", "512", 0, transaction.amount_excluding_vat + transaction.vat, num)
+            num = self._getNextOpCounter()
+            bank_fec_record = self._createFecRecordFromBankTransaction(transaction, "BQ", transaction.bank_account, 0, transaction.amount_excluding_vat + transaction.vat, num)
             amount_to_match = transaction.amount_excluding_vat + transaction.vat
 
-            # Search corresponding invoice for reconcialiation and mark VAT to be paid
-            invoice_fec_found = False
-            partial_match_amount = 0
-            partial_match_fec_records: List[FecRecord] = []
-            for fec_record in self.fec_records:
-                if invoice_fec_found or fec_record.CompteNum[0:3] != "411":
-                    continue
-
-                # Already reconciliated or previously created bank record
-                if fec_record.EcritureLet or (fec_record == bank_fec_record):
-                    continue
-
-                amount_match = fec_record.getDebitAsCent() == amount_to_match and fec_record.getCreditAsCent() == 0
-                attachment_match = \
-                    (fec_record.PieceRef != '' and fec_record.PieceRef == bank_fec_record.PieceRef) \
-                    or (fec_record.EcritureLib != '' and fec_record.EcritureLib.strip() in bank_fec_record.EcritureLib)
-
-                if fec_record.getDebitAsCent() < amount_to_match and attachment_match:
-                    partial_match_amount += fec_record.getDebitAsCent()
-                    partial_match_fec_records.append(fec_record)
-                    mp = int(100*partial_match_amount/amount_to_match)
-                    logging.info(f"Partial match {fec_record.EcritureLib} with {bank_fec_record.EcritureLib} ({fec_record.getDebitAsCent()})/{mp}%")
-
-                    if partial_match_amount == amount_to_match:
-                        amount_match = True
-
-                if amount_match and attachment_match:
-                    invoice_fec_found = True
-
-                    # Reconciliate invoices
-                    if partial_match_fec_records:
-                        for partial_match_fec_record in partial_match_fec_records:
-                            fec = self._createFecRecordFromBankTransaction(
-                                transaction, "BQ", "4111",
-                                partial_match_fec_record.getDebitAsCent(),
-                                0, num, rec)
-                            partial_match_fec_record.EcritureLet = fec.EcritureLet
-                            partial_match_fec_record.DateLet = fec.DateLet
-
+            # Search corresponding invoice(s) for reconcialiation and mark VAT to be paid
+            invoice_fec_records = self._searchOpenItemsPaid(transaction, bank_fec_record, amount_to_match)
+            invoice_fec_found = len(invoice_fec_records) > 0
+            if invoice_fec_found:
+
+                # Reconciliate invoices
+                rec = self._getNextReconciliation("4111", transaction.thirdparty_name)
+                for invoice_fec_record in invoice_fec_records:
+                    fec = self._createFecRecordFromBankTransaction(
+                        transaction, "BQ", "4111",
+                        invoice_fec_record.getDebitAsCent(),
+                        0, num, rec)
+                    self._letter(invoice_fec_record, rec, fec.DateLet)
+
+                # Mark TVA to be paid
+                pending_vat_fec_record = self._appendFecRecord(FecRecord(
+                    when=transaction.when,
+                    label=fec.EcritureLib + " encaissée",
+                    journal=self.journal_db.get_by_code('VE'),
+                    account=self.leadger_account_db.get_by_code_or_fail('4458'),
+                    evidence=None,
+                    credit_cent=max(-transaction.vat, 0),
+                    debit_cent=max(transaction.vat, 0),
+                    ecriture_num=num,
+                    ecriture_rec=None
+                ))
+                collected_vat_fec_record = self._appendFecRecord(FecRecord(
+                    when=transaction.when,
+                    label=fec.EcritureLib + " encaissée",
+                    journal=self.journal_db.get_by_code('VE'),
+                    account=self.leadger_account_db.get_by_code_or_fail('44571'),
+                    evidence=None,
+                    credit_cent=max(transaction.vat, 0),
+                    debit_cent=max(-transaction.vat, 0),
+                    ecriture_num=num,
+                    ecriture_rec=None
+                ))
+                for vat_fec_record in [pending_vat_fec_record, collected_vat_fec_record]:
+                    if transaction.vat_items:
+                        self.vat_ledger.add_items(vat_fec_record, transaction.vat_items)
                     else:
-                        fec = self._createFecRecordFromBankTransaction(
-                            transaction, "BQ", "4111",
-                            transaction.amount_excluding_vat + transaction.vat,
-                            0, num, rec)
-                        fec_record.EcritureLet = fec.EcritureLet
-                        fec_record.DateLet = fec.DateLet
-
-                    # Mark TVA to be paid
-                    self.fec_records.append(FecRecord(
-                        when=transaction.when,
-                        label=fec.EcritureLib + " encaissée",
-                        journal=self.journal_db.get_by_code('VE'),
-                        account=self.leadger_account_db.get_by_code_or_fail('4458'),
-                        evidence=None,
-                        credit_cent=max(-transaction.vat, 0),
-                        debit_cent=max(transaction.vat, 0),
-                        ecriture_num=num,
-                        ecriture_rec=None
-                    ))
-                    self.fec_records.append(FecRecord(
-                        when=transaction.when,
-                        label=fec.EcritureLib + " encaissée",
-                        journal=self.journal_db.get_by_code('VE'),
-                        account=self.leadger_account_db.get_by_code_or_fail('44571'),
-                        evidence=None,
-                        credit_cent=max(transaction.vat, 0),
-                        debit_cent=max(-transaction.vat, 0),
-                        ecriture_num=num,
-                        ecriture_rec=None
-                    ))
+                        self.vat_ledger.add(vat_fec_record, transaction.amount_excluding_vat)
 
             if not invoice_fec_found:
                 print(transaction)
                 ref = f"{transaction.thirdparty_name} {transaction.when} {bank_fec_record.EcritureLib}"
                 logging.error(f"Invoice(s) not found in accounting for this bank transaction: {ref}")
 
-        # Financial investment
-        elif "Virement interne" in transaction.reference:
+        else:
+            signature = TransactionSignature.from_transaction(transaction)
+            template = self.classification_cache.get(signature, load_accounting_config(), self.leadger_account_db.accounts)
+            if template is None:
+                template = AccountingService.classifyBankTransaction(transaction, self.leadger_account_db.accounts)
+                self.classification_cache.put(signature, template)
+            self._applyPostingTemplate(transaction, template)
 
-            # starting
-            if transaction.amount_excluding_vat < 0 and transaction.vat == 0:
-                num = self._getNextOpCounter(transaction.when)
-                self._createFecRecordFromBankTransaction(transaction, "BQ", "512", -transaction.amount_excluding_vat, 0, num)
-                self._createFecRecordFromBankTransaction(transaction, "BQ", "580", 0, -transaction.amount_excluding_vat, num)
-                num = self._getNextOpCounter(transaction.when)
-                self._createFecRecordFromBankTransaction(transaction, "BQ", "580", -transaction.amount_excluding_vat, 0, num)
-                self._createFecRecordFromBankTransaction(transaction, "BQ", "512001", 0, -transaction.amount_excluding_vat, num)
+        if len(transaction.fec_records) == 0:
+            raise RuntimeError(f"Transaction not supported yet, please create new rules or update configuration : {transaction}")
 
-            # ending
-            if transaction.amount_excluding_vat > 0 and transaction.vat == 0:
-                num = self._getNextOpCounter(transaction.when)
-                self._createFecRecordFromBankTransaction(transaction, "BQ", "512001", transaction.amount_excluding_vat, 0, num)
-                self._createFecRecordFromBankTransaction(transaction, "BQ", "580", 0, transaction.amount_excluding_vat, num)
-                num = self._getNextOpCounter(transaction.when)
-                self._createFecRecordFromBankTransaction(transaction, "BQ", "580", transaction.amount_excluding_vat, 0, num)
-                self._createFecRecordFromBankTransaction(transaction, "BQ", "512", 0, transaction.amount_excluding_vat, num)
+    @staticmethod
+    def _isCustomerPayment(transaction: FinancialTransaction) -> bool:
+        return transaction.category in ["sales", "other_income"] \
+            and transaction.amount_excluding_vat > 0 \
+            and "Virement interne" != transaction.reference \
+            and not transaction.counterparty_account
+
+    @staticmethod
+    def _internalTransferBankSide(transaction: FinancialTransaction) -> PostingOperation:
+        """Bank side of an internal transfer, posted through the internal transfers account"""
+        if transaction.amount_excluding_vat < 0:
+            return PostingOperation(None, (
+                PostingLine("BQ", BANK, MINUS_NET, ZERO),
+                PostingLine("BQ", "580", ZERO, MINUS_NET)))
+        return PostingOperation(None, (
+            PostingLine("BQ", "580", NET, ZERO),
+            PostingLine("BQ", BANK, ZERO, NET)))
+
+    @staticmethod
+    def _investmentOperations(transaction: FinancialTransaction) -> List[PostingOperation]:
+        """Starting (bank to investment account) or ending (investment account to bank) of a financial investment"""
+        if transaction.vat != 0 or transaction.amount_excluding_vat == 0:
+            return []
+
+        # starting
+        if transaction.amount_excluding_vat < 0:
+            return [AccountingService._internalTransferBankSide(transaction), PostingOperation(None, (
+                PostingLine("BQ", "580", MINUS_NET, ZERO),
+                PostingLine("BQ", INVESTMENT_ACCOUNT, ZERO, MINUS_NET)))]
+
+        # ending
+        return [PostingOperation(None, (
+            PostingLine("BQ", INVESTMENT_ACCOUNT, NET, ZERO),
+            PostingLine("BQ", "580", ZERO, NET))), AccountingService._internalTransferBankSide(transaction)]
+
+    @staticmethod
+    def classifyBankTransaction(transaction: FinancialTransaction, accounts: List[LedgerAccount]) -> PostingTemplate:
+        """Accounting rules for a bank transaction (customer payments excepted),
+           the posting template returned must only depend on the transaction signature (see TransactionSignature)
+           and on the ledger accounts matching the transaction category
+        """
+        operations: List[PostingOperation] = []
+        note = None
+
+        # Transfer between two configured IBANs : each bank account posts its own side through the internal transfers account
+        if transaction.counterparty_account and transaction.vat == 0 and transaction.amount_excluding_vat != 0:
+            operations.append(AccountingService._internalTransferBankSide(transaction))
+
+        # Financial investment
+        elif "Virement interne" in transaction.reference:
+            operations.extend(AccountingService._investmentOperations(transaction))
 
         # Transfert to Boursorama
         elif transaction.thirdparty_name == "GF PARTNER":
 
             # starting
             if transaction.amount_excluding_vat < 0 and transaction.vat == 0:
-                num = self._getNextOpCounter(transaction.when)
-                self._createFecRecordFromBankTransaction(transaction, "BQ", "512", -transaction.amount_excluding_vat, 0, num)
-                self._createFecRecordFromBankTransaction(transaction, "BQ", "512002", 0, -transaction.amount_excluding_vat, num)
+                operations.append(PostingOperation(None, (
+                    PostingLine("BQ", BANK, MINUS_NET, ZERO),
+                    PostingLine("BQ", GF_PARTNER_ACCOUNT, ZERO, MINUS_NET))))
 
             # ending
             if transaction.amount_excluding_vat > 0 and transaction.vat == 0:
-                num = self._getNextOpCounter(transaction.when)
-                self._createFecRecordFromBankTransaction(transaction, "BQ", "512002", transaction.amount_excluding_vat, 0, num)
-                self._createFecRecordFromBankTransaction(transaction, "BQ", "512", 0, transaction.amount_excluding_vat, num)
+                operations.append(PostingOperation(None, (
+                    PostingLine("BQ", GF_PARTNER_ACCOUNT, NET, ZERO),
+                    PostingLine("BQ", BANK, ZERO, NET))))
 
         # VAT DGFIP
         elif (
@@ -363,405 +516,375 @@ class AccountingService:
             and transaction.amount_excluding_vat < 0
             and transaction.vat == 0
         ):
-            num = self._getNextOpCounter(transaction.when)
             # Remove TVA note
-            transaction.note = "Prélèvement TVA"
-            self._createFecRecordFromBankTransaction(transaction, "BQ", "512", -transaction.amount_excluding_vat, 0, num)
-            self._createFecRecordFromBankTransaction(transaction, "BQ", "44551", 0, -transaction.amount_excluding_vat, num)
+            note = "Prélèvement TVA"
+            operations.append(PostingOperation(None, (
+                PostingLine("BQ", BANK, MINUS_NET, ZERO),
+                PostingLine("BQ", "44551", ZERO, MINUS_NET, vat_base=ZERO))))
 
         else:
-            for account in self.leadger_account_db.accounts:
+            for account in accounts:
                 if transaction.category in account.thirdparty_names_or_quonto_categories:
                     # Exception : financial revenue and capital increase
                     if account.code in ["764", "1013", "4551"] and transaction.amount_excluding_vat > 0 and transaction.vat == 0:
-                        num = self._getNextOpCounter(transaction.when)
-                        self._createFecRecordFromBankTransaction(transaction, "BQ", "512", 0, transaction.amount_excluding_vat, num)
-                        self._createFecRecordFromBankTransaction(transaction, "BQ", account.code, transaction.amount_excluding_vat, 0, num)
+                        operations.append(PostingOperation(None, (
+                            PostingLine("BQ", BANK, ZERO, NET),
+                            PostingLine("BQ", account.code, NET, ZERO))))
 
                     # Exception : owner revenue
                     elif account.code in ["6411", "4551", "431"] and transaction.amount_excluding_vat < 0 and transaction.vat == 0:
-                        num = self._getNextOpCounter(transaction.when)
-                        self._createFecRecordFromBankTransaction(transaction, "BQ", "512", -transaction.amount_excluding_vat, 0, num)
-                        self._createFecRecordFromBankTransaction(transaction, "BQ", account.code, 0, -transaction.amount_excluding_vat, num)
+                        operations.append(PostingOperation(None, (
+                            PostingLine("BQ", BANK, MINUS_NET, ZERO),
+                            PostingLine("BQ", account.code, ZERO, MINUS_NET))))
 
                     # Taxes
                     elif account.code[0:1] == "4" and transaction.amount_excluding_vat < 0 and transaction.vat == 0:
-                        num = self._getNextOpCounter(transaction.when)
-                        self._createFecRecordFromBankTransaction(transaction, "BQ", "512", -transaction.amount_excluding_vat, 0, num)
-                        self._createFecRecordFromBankTransaction(transaction, "BQ", account.code, 0, -transaction.amount_excluding_vat, num)
+                        operations.append(PostingOperation(None, (
+                            PostingLine("BQ", BANK, MINUS_NET, ZERO),
+                            PostingLine("BQ", account.code, ZERO, MINUS_NET))))
 
                     # Exception : Taxes (CET)
                     elif account.code == "63511" and transaction.amount_excluding_vat < 0 and transaction.vat == 0:
-                        rec = self._getNextReconciliation()
-                        num = self._getNextOpCounter(transaction.when)
-                        self._createFecRecordFromBankTransaction(transaction, "OD", "447", -transaction.amount_excluding_vat, 0, num, rec)
-                        self._createFecRecordFromBankTransaction(transaction, "OD", account.code, 0, -transaction.amount_excluding_vat, num)
-                        num = self._getNextOpCounter(transaction.when)
-                        self._createFecRecordFromBankTransaction(transaction, "BQ", "512", -transaction.amount_excluding_vat, 0, num)
-                        self._createFecRecordFromBankTransaction(transaction, "BQ", "447", 0, -transaction.amount_excluding_vat, num, rec)
+                        operations.append(PostingOperation("447", (
+                            PostingLine("OD", "447", MINUS_NET, ZERO, lettered=True),
+                            PostingLine("OD", account.code, ZERO, MINUS_NET))))
+                        operations.append(PostingOperation(None, (
+                            PostingLine("BQ", BANK, MINUS_NET, ZERO),
+                            PostingLine("BQ", "447", ZERO, MINUS_NET, lettered=True))))
 
                     # Expenses
                     elif account.code[0:1] == "6" and transaction.amount_excluding_vat < 0:
-                        amount = abs(transaction.amount_excluding_vat) + abs(transaction.vat)
-                        rec = self._getNextReconciliation()
-                        num = self._getNextOpCounter(transaction.when)
-                        self._createFecRecordFromBankTransaction(transaction, "AC", "4011", amount, 0, num, rec)
-                        self._createFecRecordFromBankTransaction(transaction, "AC", account.code, 0, abs(transaction.amount_excluding_vat), num)
+                        lines = [
+                            PostingLine("AC", "4011", ABS_GROSS, ZERO, lettered=True),
+                            PostingLine("AC", account.code, ZERO, ABS_NET)]
                         if transaction.vat != 0:
-                            self._createFecRecordFromBankTransaction(transaction, "AC", "445661", 0, abs(transaction.vat), num)
-                        num = self._getNextOpCounter(transaction.when)
-                        self._createFecRecordFromBankTransaction(transaction, "BQ", "512", amount, 0, num)
-                        self._createFecRecordFromBankTransaction(transaction, "BQ", "4011", 0, amount, num, rec)
+                            lines.append(PostingLine("AC", "445661", ZERO, ABS_VAT, vat_base=NET))
+                        operations.append(PostingOperation("4011", tuple(lines)))
+                        operations.append(PostingOperation(None, (
+                            PostingLine("BQ", BANK, ABS_GROSS, ZERO),
+                            PostingLine("BQ", "4011", ZERO, ABS_GROSS, lettered=True))))
 
                     # Expenses (refund)
                     elif account.code[0:1] == "6" and transaction.amount_excluding_vat > 0:
-                        amount = abs(transaction.amount_excluding_vat) + abs(transaction.vat)
-                        rec = self._getNextReconciliation()
-                        num = self._getNextOpCounter(transaction.when)
-                        self._createFecRecordFromBankTransaction(transaction, "AC", "4011", 0, amount, num, rec)
-                        self._createFecRecordFromBankTransaction(transaction, "AC", account.code, abs(transaction.amount_excluding_vat), 0, num)
+                        lines = [
+                            PostingLine("AC", "4011", ZERO, ABS_GROSS, lettered=True),
+                            PostingLine("AC", account.code, ABS_NET, ZERO)]
                         if transaction.vat != 0:
-                            self._createFecRecordFromBankTransaction(transaction, "AC", "445661", 0, -1 * abs(transaction.vat), num)
-                        num = self._getNextOpCounter(transaction.when)
-                        self._createFecRecordFromBankTransaction(transaction, "BQ", "512", 0, amount, num)
-                        self._createFecRecordFromBankTransaction(transaction, "BQ", "4011", amount, 0, num, rec)
+                            lines.append(PostingLine("AC", "445661", ZERO, MINUS_ABS_VAT, vat_base=NET))
+                        operations.append(PostingOperation("4011", tuple(lines)))
+                        operations.append(PostingOperation(None, (
+                            PostingLine("BQ", BANK, ZERO, ABS_GROSS),
+                            PostingLine("BQ", "4011", ABS_GROSS, ZERO, lettered=True))))
+
+        return PostingTemplate(tuple(operations), note)
+
+    def _applyPostingTemplate(self, transaction: FinancialTransaction, template: PostingTemplate) -> None:
+        """Creates the FEC records of a bank transaction from its posting template"""
+        if template.note is not None:
+            transaction.note = template.note
+
+        rec = None
+        for operation in template.operations:
+            num = self._getNextOpCounter()
+            if operation.lettrage_account:
+                rec = self._getNextReconciliation(operation.lettrage_account, transaction.thirdparty_name)
+
+            for line in operation.lines:
+                fec_record = self._createFecRecordFromBankTransaction(
+                    transaction, line.journal_code,
+                    transaction.bank_account if line.account == BANK else line.account,
+                    AMOUNT_FORMULAS[line.credit](transaction),
+                    AMOUNT_FORMULAS[line.debit](transaction),
+                    num, rec if line.lettered else None)
+                if line.vat_base == NET and transaction.vat_items:
+                    self.vat_ledger.add_items(fec_record, transaction.vat_items)
+                elif line.vat_base is not None:
+                    self.vat_ledger.add(fec_record, AMOUNT_FORMULAS[line.vat_base](transaction))
+
+    def _searchOpenItemsPaid(self, transaction: FinancialTransaction, bank_fec_record: FecRecord, amount_to_match: int) -> List[FecRecord]:
+        """Searches the customer open items paid by a bank transaction :
+           a single open item of the same amount with the same evidence or label,
+           otherwise a combination of open items (same evidence, label or third party) whose total is the payment amount
+        """
+        thirdparty_account = self.leadger_account_db.get_by_name(transaction.thirdparty_name, "4111")
 
-        if len(transaction.fec_records) == 0:
-            raise RuntimeError(f"Transaction not supported yet, please create new rules or update configuration : {transaction}")
+        candidates: List[FecRecord] = []
+        for fec_record in self.balances.open_items:
+            if fec_record.CompteNum[0:3] != "411":
+                continue
 
-    def doAccountingForMiscTransactionBefore(self, when: Optional[datetime]) -> None:
-        misc_transactions = self.misc_transaction_db.getUntil(when)
-        for misc_transaction in misc_transactions:
-            num = None
-            for entry in misc_transaction.Entries:
-                self.doAccountingForInvoicesBefore(misc_transaction.EcritureDate)
-                if num is None:
-                    num = self._getNextOpCounter(None)
-                fec_record = FecRecord(
-                    when=misc_transaction.EcritureDate,
-                    label=misc_transaction.EcritureLib,
-                    journal=entry.Journal,
-                    account=entry.Account,
-                    evidence=self.evidence_db.get_or_add("GoogleDrive", misc_transaction.PieceRef, misc_transaction.PieceDate),
-                    credit_cent=entry.Credit,
-                    debit_cent=entry.Debit,
-                    ecriture_num=num,
-                    ecriture_rec=None
-                )
-                self.fec_records.append(fec_record)
+            # Already reconciliated or previously created bank record
+            if fec_record.EcritureLet or (fec_record == bank_fec_record):
+                continue
 
-    def doAccountingForInvoicesBefore(self, when: Optional[datetime]) -> None:
-        lastRecordWhen = conv_date_from_utc_to_local(self.start_date)
-        if len(self.fec_records):
-            lastRecordWhen = conv_date_from_utc_to_local(datetime.strptime(self.fec_records[-1].EcritureDate, "%Y%m%d"))
+            attachment_match = \
+                (fec_record.PieceRef != '' and fec_record.PieceRef == bank_fec_record.PieceRef) \
+                or (fec_record.EcritureLib != '' and fec_record.EcritureLib.strip() in bank_fec_record.EcritureLib)
 
-        for invoice in self.invoices:
+            if attachment_match and fec_record.getDebitAsCent() == amount_to_match and fec_record.getCreditAsCent() == 0:
+                return [fec_record]
 
-            # Customer invoices
-            if not invoice.fec_record and (not when or invoice.when <= when) and invoice.type in [CLIENT_CREDIT, CLIENT_INVOICE]:
-                num = self._getNextOpCounter(None)
-                fecRecord = FecRecord(
-                    when=max(invoice.when, lastRecordWhen),
-                    label=invoice.number,
-                    journal=self.journal_db.get_by_code('VE'),
-                    account=self.leadger_account_db.get_or_create('4111', invoice.thirdparty_name),
-                    evidence=self.evidence_db.get_or_add("Qonto", invoice.source_attachment_id, invoice.when),
-                    credit_cent=abs(invoice.total_amount_cent) if invoice.type == CLIENT_CREDIT else 0,
-                    debit_cent=invoice.total_amount_cent if invoice.type == CLIENT_INVOICE else 0,
-                    ecriture_num=num,
-                    ecriture_rec=None
-                )
-                invoice.fec_record = fecRecord
-                self.fec_records.append(fecRecord)
+            thirdparty_match = thirdparty_account is not None \
+                and fec_record.CompteNum == thirdparty_account.fec_compte_num() \
+                and (fec_record.CompAuxNum or None) == thirdparty_account.fec_compte_aux_num()
 
-                self.fec_records.append(FecRecord(
-                    when=max(invoice.when, lastRecordWhen),
-                    label=invoice.number,
-                    journal=self.journal_db.get_by_code('VE'),
-                    account=self.leadger_account_db.get_by_code_or_fail('706'),
-                    evidence=self.evidence_db.get_or_add("Qonto", invoice.source_attachment_id, invoice.when),
-                    credit_cent=invoice.amount_excluding_vat_cent if invoice.type == CLIENT_INVOICE else 0,
-                    debit_cent=abs(invoice.amount_excluding_vat_cent) if invoice.type == CLIENT_CREDIT else 0,
-                    ecriture_num=num,
-                    ecriture_rec=None
-                ))
+            if (attachment_match or thirdparty_match) and 0 < fec_record.getDebitAsCent() <= amount_to_match and fec_record.getCreditAsCent() == 0:
+                candidates.append(fec_record)
 
-                self.fec_records.append(FecRecord(
-                    when=max(invoice.when, lastRecordWhen),
-                    label=invoice.number,
-                    journal=self.journal_db.get_by_code('VE'),
-                    account=self.leadger_account_db.get_by_code_or_fail('4458'),
-                    evidence=self.evidence_db.get_or_add("Qonto", invoice.source_attachment_id, invoice.when),
-                    credit_cent=invoice.amount_vat_cent if invoice.type == CLIENT_INVOICE else 0,
-                    debit_cent=abs(invoice.amount_vat_cent) if invoice.type == CLIENT_CREDIT else 0,
-                    ecriture_num=num,
-                    ecriture_rec=None
-                ))
+        combination = find_amounts_matching_total([c.getDebitAsCent() for c in candidates], amount_to_match, self.reconciliation_search_limit)
+        if combination is None:
+            return []
 
-            # Supplier invoices
-            if not invoice.fec_record and (not when or invoice.when <= when) and invoice.type in [SUPPLIER_INVOICE]:
-
-                expense_account = 'THIRD_PARTY_ACCOUNT_NOT_FOUND'
-                vat_rate = 0.0
-                if invoice.thirdparty_name == "INTUITU ASSOCIES":
-                    expense_account = '6226'
-                    vat_rate = 0.2
-
-                if invoice.thirdparty_name == "GOOGLE COMMERCE LIMITED":
-                    expense_account = '6156'
-                    vat_rate = 0.2
-
-                try:
-                    expense_account_ledger = self.leadger_account_db.get_by_code_or_fail(expense_account)
-                except Exception as e:
-                    raise Exception(str(e) + " with thrid party name " + invoice.thirdparty_name) from e
-
-                num = self._getNextOpCounter(None)
-                fecRecord = FecRecord(
-                    when=max(invoice.when, lastRecordWhen),
-                    label=invoice.number,
-                    journal=self.journal_db.get_by_code('AC'),
-                    account=self.leadger_account_db.get_or_create('4011', invoice.thirdparty_name),
-                    evidence=self.evidence_db.get_or_add("Qonto", invoice.source_attachment_id, invoice.when),
-                    credit_cent=round(invoice.total_amount_cent * (1 + vat_rate)),
-                    debit_cent=0,
-                    ecriture_num=num,
-                    ecriture_rec=None
-                )
-                invoice.fec_record = fecRecord
-                self.fec_records.append(fecRecord)
-
-                self.fec_records.append(FecRecord(
-                    when=max(invoice.when, lastRecordWhen),
-                    label=invoice.number,
-                    journal=self.journal_db.get_by_code('AC'),
-                    account=expense_account_ledger,
-                    evidence=self.evidence_db.get_or_add("Qonto", invoice.source_attachment_id, invoice.when),
-                    credit_cent=0,
-                    debit_cent=abs(invoice.amount_excluding_vat_cent),
-                    ecriture_num=num,
-                    ecriture_rec=None
-                ))
+        for i in combination:
+            logging.info(f"Partial match {candidates[i].EcritureLib} with {bank_fec_record.EcritureLib} ({candidates[i].getDebitAsCent()})")
 
-                self.fec_records.append(FecRecord(
-                    when=max(invoice.when, lastRecordWhen),
-                    label=invoice.number,
-                    journal=self.journal_db.get_by_code('AC'),
-                    account=self.leadger_account_db.get_by_code_or_fail('445661'),
-                    evidence=self.evidence_db.get_or_add("Qonto", invoice.source_attachment_id, invoice.when),
-                    credit_cent=0,
-                    debit_cent=round(abs(invoice.amount_excluding_vat_cent) * vat_rate),
-                    ecriture_num=num,
-                    ecriture_rec=None
-                ))
+        return [candidates[i] for i in combination]
 
-    def computeBalances(self) -> Dict[Any, int]:
+    def doAccounting(self, bank_transactions: Iterable[FinancialTransaction], until: Optional[datetime] = None) -> None:
+        """Posts invoices, miscellaneous transactions and bank transactions in chronological order.
 
-        balances: Dict[str, int] = {}
+           The three event streams are sorted by date and merged (k-way merge), invoices first, then miscellaneous
+           transactions, then bank transactions for a same date and time (OPS dates have no time, their operations come
+           before the invoices and bank transactions of their day). Invoices are posted in date order, whatever
+           the order they were added in. Bank transactions must be sorted by date and can be produced lazily.
+           Invoices and miscellaneous transactions not posted yet are all posted, including those after the last
+           bank transaction, or only those until a date (bank transactions must then be before this date too) :
+           posting a period in several calls gives the same result.
+        """
+        pending_invoices = sorted([invoice for invoice in self.invoices if not invoice.fec_record and (not until or invoice.when <= until)],
+                                  key=attrgetter("when"))
+        misc_transactions = self.misc_transaction_db.stream() if not until else self.misc_transaction_db.getUntil(until)
+        invoice_events: Iterator[PostingEvent] = (InvoiceEvent(invoice.when, INVOICE_EVENT, invoice) for invoice in pending_invoices)
+        misc_events: Iterator[PostingEvent] = (MiscTransactionEvent(misc_transaction.EcritureDate, MISC_EVENT, misc_transaction)
+                                               for misc_transaction in misc_transactions)
+        bank_events: Iterator[PostingEvent] = (BankEvent(transaction.when, BANK_EVENT, transaction) for transaction in bank_transactions)
+
+        # Invoices dated before the records already posted are posted at the date of the last record
+        # (the records of the merge are in chronological order, the date is only read once)
+        last_record_when = self._getLastRecordWhen()
+        for event in heapq.merge(invoice_events, misc_events, bank_events, key=itemgetter(0, 1)):
+            first_position = len(self.fec_records)
+            if isinstance(event, InvoiceEvent):
+                invoice = event.invoice
+                if not invoice.fec_record:
+                    self._postInvoice(invoice, last_record_when)
+                    if self.event_log:
+                        self.event_log.invoice(invoice.source_name, invoice.source_id, invoice.number, first_position)
+            elif isinstance(event, MiscTransactionEvent):
+                misc_transaction = event.misc_transaction
+                self._postMiscTransaction(misc_transaction)
+                if self.event_log:
+                    self.event_log.misc_transaction(misc_transaction.PieceRef, misc_transaction.EcritureLib, first_position)
+            else:
+                self.doAccountingForBankTransaction(event.transaction)
+
+    def doAccountingByMonth(self, bank_transactions: List[FinancialTransaction], from_month: Optional[str] = None,
+                            checkpoint: Optional[Callable[[str, "AccountingService"], None]] = None) -> None:
+        """Posts the accounting period month by month (same result as doAccounting), the accounting being checkpointed
+           in the event log (and given to checkpoint with the month) before each month.
+           With from_month (YYYYMM), posting resumes at this month (earlier months already posted).
+           Months are posted in sequence : a month starts from the open items, lettrage codes, evidences and accounts
+           left by the previous ones (see README, "Comment ca marche ?").
+        """
+        months = get_months(self.start_date, self.end_date)
+        transactions_per_month: Dict[str, List[FinancialTransaction]] = {}
+        for transaction in bank_transactions:
+            month = transaction.when.strftime("%Y%m")
+            if not from_month or month >= from_month:
+                transactions_per_month.setdefault(max(months[0], min(month, months[-1])), []).append(transaction)
+
+        for month in months:
+            if from_month and month < from_month:
+                continue
+            if self.event_log:
+                self.event_log.checkpoint(month, self)
+            if checkpoint:
+                checkpoint(month, self)
+            self.doAccounting(transactions_per_month.get(month, []), get_month_end(month) if month != months[-1] else None)
+
+    def _postMiscTransaction(self, misc_transaction: MiscellaneousTransaction) -> None:
+        self.current_provenance = Provenance(MISC_TRANSACTION, "OPS", misc_transaction.PieceRef)
+        num = self._getNextOpCounter()
+        for entry in misc_transaction.Entries:
+            fec_record = FecRecord(
+                when=misc_transaction.EcritureDate,
+                label=misc_transaction.EcritureLib,
+                journal=entry.Journal,
+                account=entry.Account,
+                evidence=self.evidence_db.get_or_add("GoogleDrive", misc_transaction.PieceRef, misc_transaction.PieceDate),
+                credit_cent=entry.Credit,
+                debit_cent=entry.Debit,
+                ecriture_num=num,
+                ecriture_rec=None
+            )
+            self._appendFecRecord(fec_record)
 
-        for fec_record in self.fec_records:
-            change = fec_record.getCreditAsCent() - fec_record.getDebitAsCent()
+    def _getLastRecordWhen(self) -> datetime:
+        if len(self.fec_records):
+            return conv_date_from_utc_to_local(datetime.strptime(self.fec_records[-1].EcritureDate, "%Y%m%d"))
+        return conv_date_from_utc_to_local(self.start_date)
+
+    def _postInvoice(self, invoice: Invoice, lastRecordWhen: datetime) -> None:
+        self.current_provenance = Provenance(INVOICE, invoice.source_name, invoice.source_id)
+
+        # Customer invoices
+        if invoice.type in [CLIENT_CREDIT, CLIENT_INVOICE]:
+            num = self._getNextOpCounter()
+            fecRecord = FecRecord(
+                when=max(invoice.when, lastRecordWhen),
+                label=invoice.number,
+                journal=self.journal_db.get_by_code('VE'),
+                account=self.leadger_account_db.get_or_create('4111', invoice.thirdparty_name),
+                evidence=self.evidence_db.get_or_add("Qonto", invoice.source_attachment_id, invoice.when),
+                credit_cent=abs(invoice.total_amount_cent) if invoice.type == CLIENT_CREDIT else 0,
+                debit_cent=invoice.total_amount_cent if invoice.type == CLIENT_INVOICE else 0,
+                ecriture_num=num,
+                ecriture_rec=None
+            )
+            invoice.fec_record = fecRecord
+            self._appendFecRecord(fecRecord)
+
+            self._appendFecRecord(FecRecord(
+                when=max(invoice.when, lastRecordWhen),
+                label=invoice.number,
+                journal=self.journal_db.get_by_code('VE'),
+                account=self.leadger_account_db.get_by_code_or_fail('706'),
+                evidence=self.evidence_db.get_or_add("Qonto", invoice.source_attachment_id, invoice.when),
+                credit_cent=invoice.amount_excluding_vat_cent if invoice.type == CLIENT_INVOICE else 0,
+                debit_cent=abs(invoice.amount_excluding_vat_cent) if invoice.type == CLIENT_CREDIT else 0,
+                ecriture_num=num,
+                ecriture_rec=None
+            ))
 
-            groups = [
-                fec_record.CompteNum[0:1],
-                f"{fec_record.CompteNum} ({fec_record.CompteLib})"]
+            vat_fec_record = self._appendFecRecord(FecRecord(
+                when=max(invoice.when, lastRecordWhen),
+                label=invoice.number,
+                journal=self.journal_db.get_by_code('VE'),
+                account=self.leadger_account_db.get_by_code_or_fail('4458'),
+                evidence=self.evidence_db.get_or_add("Qonto", invoice.source_attachment_id, invoice.when),
+                credit_cent=invoice.amount_vat_cent if invoice.type == CLIENT_INVOICE else 0,
+                debit_cent=abs(invoice.amount_vat_cent) if invoice.type == CLIENT_CREDIT else 0,
+                ecriture_num=num,
+                ecriture_rec=None
+            ))
+            self.vat_ledger.add(vat_fec_record, invoice.amount_excluding_vat_cent)
+
+        # Supplier invoices
+        if invoice.type in [SUPPLIER_INVOICE]:
+
+            expense_account = 'THIRD_PARTY_ACCOUNT_NOT_FOUND'
+            vat_rate = 0.0
+            if invoice.thirdparty_name == "INTUITU ASSOCIES":
+                expense_account = '6226'
+                vat_rate = 0.2
+
+            if invoice.thirdparty_name == "GOOGLE COMMERCE LIMITED":
+                expense_account = '6156'
+                vat_rate = 0.2
+
+            try:
+                expense_account_ledger = self.leadger_account_db.get_by_code_or_fail(expense_account)
+            except Exception as e:
+                raise Exception(str(e) + " with thrid party name " + invoice.thirdparty_name) from e
+
+            num = self._getNextOpCounter()
+            fecRecord = FecRecord(
+                when=max(invoice.when, lastRecordWhen),
+                label=invoice.number,
+                journal=self.journal_db.get_by_code('AC'),
+                account=self.leadger_account_db.get_or_create('4011', invoice.thirdparty_name),
+                evidence=self.evidence_db.get_or_add("Qonto", invoice.source_attachment_id, invoice.when),
+                credit_cent=round(invoice.total_amount_cent * (1 + vat_rate)),
+                debit_cent=0,
+                ecriture_num=num,
+                ecriture_rec=None
+            )
+            invoice.fec_record = fecRecord
+            self._appendFecRecord(fecRecord)
+
+            self._appendFecRecord(FecRecord(
+                when=max(invoice.when, lastRecordWhen),
+                label=invoice.number,
+                journal=self.journal_db.get_by_code('AC'),
+                account=expense_account_ledger,
+                evidence=self.evidence_db.get_or_add("Qonto", invoice.source_attachment_id, invoice.when),
+                credit_cent=0,
+                debit_cent=abs(invoice.amount_excluding_vat_cent),
+                ecriture_num=num,
+                ecriture_rec=None
+            ))
 
-            for group in groups:
-                if group in balances:
-                    balances[group] += change
-                else:
-                    balances[group] = change
+            vat_fec_record = self._appendFecRecord(FecRecord(
+                when=max(invoice.when, lastRecordWhen),
+                label=invoice.number,
+                journal=self.journal_db.get_by_code('AC'),
+                account=self.leadger_account_db.get_by_code_or_fail('445661'),
+                evidence=self.evidence_db.get_or_add("Qonto", invoice.source_attachment_id, invoice.when),
+                credit_cent=0,
+                debit_cent=round(abs(invoice.amount_excluding_vat_cent) * vat_rate),
+                ecriture_num=num,
+                ecriture_rec=None
+            ))
+            self.vat_ledger.add(vat_fec_record, invoice.amount_excluding_vat_cent, vat_rate * 100)
 
-        return balances
+    def computeBalances(self) -> Dict[Any, int]:
 
-    def displayCumulativeMonthlyBalance(self) -> None:
-        headers = ["Account", "Label"]
-        for fec in self.fec_records:
-            if fec.EcritureDate[0:6] not in headers:
-                headers.append(fec.EcritureDate[0:6])
-
-        # Init table
-        accounts = list(set([(fec.CompteNum, fec.CompteLib) for fec in self.fec_records]))
-        accounts.sort()
-        data = []
-        for ac, la in accounts:
-            data.append([ac, la] + ([0.0] * (len(headers) - 2)))
-
-        # Do account value computation
-        for fec in self.fec_records:
-            for i, h in enumerate(headers):
-                for a in data:
-                    if fec.CompteNum == str(a[0]) and fec.CompteLib == str(a[1]) and h == fec.EcritureDate[0:6]:
-                        for month in range(i, self.getNbMonths()+3):
-                            if len(a) > month:
-                                a[month] = float(a[month]) + float(fec.getCreditAsCent() - fec.getDebitAsCent())/100
-
-        # Add subtotals lines
-        last_group = None
-        group_sum: List[float | str] = ["1", ""] + ([0.0] * (len(data[0])-2))
-        group_sum_1_5: List[float | str] = ["1+2+3+4+5", "==="] + ([0.0] * (len(data[0])-2))
-        group_sum_6_7: List[float | str] = ["6+7", "==="] + ([0.0] * (len(data[0])-2))
-        data_with_group: List[Any] = []
-        for line in data:
-            current_group = str(line[0])[0]
-            if current_group != last_group and last_group:
-                # Next group
-                data_with_group.append(["===", "==="] + (["==="] * (len(data[0])-2)))
-                data_with_group.append(group_sum)
-                data_with_group.append(["", ""] + ([""] * (len(data[0])-2)))
-                group_sum = [current_group, ""] + ([0.0] * (len(data[0])-2))
-
-            for i, value in enumerate(line):
-                if type(value) is float:
-                    if type(group_sum[i]) is float:
-                        group_sum[i] = float(group_sum[i]) + value
-                    if current_group in ["1", "2", "3", "4", "5"] and type(group_sum_1_5[i]) is float:
-                        group_sum_1_5[i] = float(group_sum_1_5[i]) + value
-                    if current_group in ["6", "7"] and type(group_sum_6_7[i]) is float:
-                        group_sum_6_7[i] = float(group_sum_6_7[i]) + value
-
-            last_group = current_group
-            data_with_group.append(line)
-
-        # last subtotal
-        data_with_group.append(["===", "==="] + (["==="] * (len(data[0])-2)))
-        data_with_group.append(group_sum)
-        data_with_group.append(["", ""] + ([""] * (len(data[0])-2)))
-
-        # main subtotal
-        data_with_group.append(group_sum_1_5)
-        data_with_group.append(group_sum_6_7)
-
-        # Round all values (prettier)
-        data_with_group_rounded = [[(round(value) if type(value) is float else value) for value in line] for line in data_with_group]
-
-        # Hide lines with only 0.0 value
-        data_with_group_rounded = [
-            line for line in data_with_group_rounded
-            if any(not isinstance(v, (int, float)) for v in line[2:]) or any(v != 0 for v in line[2:])
-        ]
-
-        def color_row(row: List[Any], i: int) -> List[Any]:
-            if len(row[0]) == 1 or "===" in row[0] or "+" in row[0]:
-                return [Fore.MAGENTA + str(cell) + Style.RESET_ALL for cell in row]
-            elif i % 2 == 0:
-                return [Fore.WHITE + str(cell) + Style.RESET_ALL for cell in row]
-            else:
-                return [Fore.BLUE + str(cell) + Style.RESET_ALL for cell in row]
+        """Balances per account class and per account (CompteNum (CompteLib))"""
+        balances: Dict[str, int] = dict(self.balances.classes)
+        for (compte_num, compte_lib), balance in self.balances.accounts.items():
+            balances[f"{compte_num} ({compte_lib})"] = balance
 
-        data_with_group_rounded_colored = [color_row(row, i) for i, row in enumerate(data_with_group_rounded)]
-        print(f"\n{'=' * 20}\nBalance\n{'=' * 20}\n")
-        print(tabulate(data_with_group_rounded_colored, headers=headers, colalign=(["left", "left"] + ["right"] * (len(data[0])-2))))
+        return balances
 
-    def validateFec(self) -> None:
-        """Controle FEC information with some basic validation rules"""
+    def getLedgerQuery(self) -> LedgerQuery:
+        """Date index of the balances, built on the first query then updated as FEC records are added"""
+        if self.ledger_query is None:
+            self.ledger_query = LedgerQuery(self.balances)
+        return self.ledger_query
 
-        # Group FEC line per accouting operation
-        fec_dict: Dict[str, List[FecRecord]] = {}
-        when_mem = None
-        valid_when_mem = None
-        carry_forward = 0
-        for fec in self.fec_records:
-            when = conv_date_from_utc_to_local(fec.EcritureDate)
-            if when_mem and when < when_mem:
-                logging.error(f"Record {fec}, accouting operation date breaks chronologic order")
-            when_mem = when
-
-            valid_when = conv_date_from_utc_to_local(fec.ValidDate)
-            if valid_when_mem and valid_when < valid_when_mem:
-                logging.error(f"Record {fec}, the validation date {fec} breaks chronologic order")
-            if valid_when < when_mem:
-                logging.error(f"Record {fec}, the validation date is before tje accouting operation date")
-            valid_when_mem = valid_when
-
-            fiscal_period_start = conv_date_from_utc_to_local(self.start_date)
-            fiscal_period_end = conv_date_from_utc_to_local(self.end_date)
-            if when < fiscal_period_start or when > fiscal_period_end:
-                logging.error(f"Record {fec}, date outside fiscal period")
-
-            if valid_when < fiscal_period_start or valid_when > fiscal_period_end:
-                logging.error(f"Record {fec}, valid date outside fiscal period")
-
-            reconciliation_when = conv_date_from_utc_to_local(fec.DateLet) if fec.DateLet else None
-            if reconciliation_when and (reconciliation_when < fiscal_period_start or reconciliation_when > fiscal_period_end):
-                logging.error(f"Record {fec}, reconciliation date outside fiscal period")
-
-            if fec.getCreditAsCent() != 0 and fec.getDebitAsCent() != 0:
-                logging.error(f"Record {fec} has credit and also debit amount defined")
-
-            if fec.getCreditAsCent() == 0 and fec.getDebitAsCent() == 0:
-                logging.error(f"Record {fec} has zero credit and debit")
-
-            if fec.JournalCode == "AN":
-                carry_forward += fec.getCreditAsCent() - fec.getDebitAsCent()
-
-            if fec.EcritureNum in fec_dict:
-                fec_dict[fec.EcritureNum].append(fec)
-            else:
-                fec_dict[fec.EcritureNum] = [fec]
+    def getTrialBalance(self, start_date: Optional[str] = None, end_date: Optional[str] = None) -> List[Tuple[str, str, int]]:
+        """Movements per account (CompteNum, CompteLib, credit - debit in cents) between two dates (included)"""
+        return self.getLedgerQuery().get_trial_balance(start_date, end_date)
 
-            # Check if account should be reconciliated
-            if any(fec.CompteNum.startswith(prefix) for prefix in ["411", "401"]):
-                if not fec.EcritureLet or fec.EcritureLet.strip() == "":
-                    logging.warning(f"Record {fec.EcritureNum} ({fec.EcritureLib}) on account {fec.CompteNum} is not reconciliated")
+    def getAccountBalance(self, compte_num_prefix: str, as_of: str) -> int:
+        """Balance (credit - debit in cents) of the accounts starting with a prefix at the end of a date"""
+        return self.getLedgerQuery().get_balance(compte_num_prefix, as_of)
 
-        # Reconciliation balance
-        amount_per_reconciliation: Dict[str, int] = {}
-        for fec in self.fec_records:
-            if fec.EcritureLet and fec.EcritureLet in amount_per_reconciliation:
-                amount_per_reconciliation[fec.EcritureLet] += fec.getCreditAsCent() - fec.getDebitAsCent()
+    def getPeriodMovement(self, compte_num_prefix: str, start_date: str, end_date: str) -> int:
+        """Movements (credit - debit in cents) of the accounts starting with a prefix between two dates (included)"""
+        return self.getLedgerQuery().get_movement(compte_num_prefix, start_date, end_date)
 
-            if fec.EcritureLet and fec.EcritureLet not in amount_per_reconciliation:
-                amount_per_reconciliation[fec.EcritureLet] = fec.getCreditAsCent() - fec.getDebitAsCent()
+    def getVatReturn(self, month: str) -> Dict[Tuple[str, Optional[float]], List[int]]:
+        """VAT figures of a month (YYYY-MM) : [base, VAT] in cents per (collected/deductible/pending/paid, rate)"""
+        return self.vat_ledger.get_month(month)
 
-        for reconcialiation, amount in amount_per_reconciliation.items():
-            if amount != 0:
-                logging.error(f"Reconcialiation {reconcialiation} is not balanced : {amount}")
+    def displayCumulativeMonthlyBalance(self) -> None:
+        display_cumulative_monthly_balance(self.balances, self.getNbMonths())
 
-        if carry_forward != 0:
-            logging.error(f"Unbalanced carry forward balance : {carry_forward}")
+    def validateFec(self) -> None:
+        """Controle FEC information with some basic validation rules"""
+        validate_fec(self.fec_records, self.start_date, self.end_date, self.lettrage.index)
 
-        # Check balance per operation
-        for num, fec_list in fec_dict.items():
-            if sum([fec.getCreditAsCent() for fec in fec_list]) != sum([fec.getDebitAsCent() for fec in fec_list]):
-                logging.error(f"Operation {num} is not balanced")
+    def getClosingAggregates(self) -> ClosingAggregates:
+        """Account aggregates the closing is computed from (to call before the closing entries are posted)"""
+        return get_closing_aggregates(self.balances, self.start_date, self.end_date)
 
-        # Check for PR journal operations (Prévisionnel annuel)
-        pr_ops = [fec.getCreditAsCent() - fec.getDebitAsCent() for fec in self.fec_records if fec.JournalCode == "PR"]
-        if len(pr_ops) > 0:
-            logging.warning(f"Final FEC contains {len(pr_ops)} operations in 'PR' (Prévisionnel) journal.")
+    def computeClosing(self, parameters: Optional[ClosingParameters] = None) -> ClosingResult:
+        """Provisions and taxes of the closing with the configured parameters (or other ones for a what-if), nothing is posted"""
+        return compute_closing(self.getClosingAggregates(), parameters if parameters else self.closing_parameters)
 
-    def addSocialTaxesProvision(self) -> None:
+    def addSocialTaxesProvision(self, closing: ClosingResult) -> None:
+        self.current_provenance = Provenance(CLOSING, "accounting", "social_taxes_provision")
         end_date = datetime.strptime(str(self.end_date), "%Y-%m-%d")
+        mandatory_total_cent = closing.social_tax_provision_cent
+        madelin_total_cent = closing.madelin_provision_cent
 
-        mandatory_total_cent = 0
-        madelin_total_cent = 0
-        for fec_record in self.fec_records:
-            # Already paid
-            if fec_record.CompteNum[0:3] == "646":
-                mandatory_total_cent -= fec_record.getDebitAsCent() - fec_record.getCreditAsCent()
-
-            # Should have been paid
-            if fec_record.CompteNum[0:3] == "641":
-
-                # ACRE
-                tax_rate = 0.455
-                if datetime.strptime(fec_record.EcritureDate, "%Y%m%d") < datetime.strptime("20240731", "%Y%m%d"):
-                    tax_rate = 0.167
-
-                if fec_record.CompteNum == "64114":
-                    madelin_total_cent += round(float(fec_record.getDebitAsCent() - fec_record.getCreditAsCent()) * tax_rate)
-                else:
-                    mandatory_total_cent += round(float(fec_record.getDebitAsCent() - fec_record.getCreditAsCent()) * tax_rate)
-
-        if madelin_total_cent > 167400:
-            mandatory_total_cent += madelin_total_cent - 167400
-            madelin_total_cent = 167400
+        if mandatory_total_cent != 0 or madelin_total_cent != 0:
+            num = self._getNextOpCounter()
 
         if mandatory_total_cent != 0:
 
-            num = self._getNextOpCounter(None)
-            self.fec_records.append(FecRecord(
+            self._appendFecRecord(FecRecord(
                 when=end_date,
                 label="Provision URSSAF TNS",
                 journal=self.journal_db.get_by_code('OD'),
@@ -773,7 +896,7 @@ class AccountingService:
                 ecriture_rec=None
             ))
 
-            self.fec_records.append(FecRecord(
+            self._appendFecRecord(FecRecord(
                 when=end_date,
                 label="Provision cotisation sociales exploitant",
                 journal=self.journal_db.get_by_code('OD'),
@@ -787,7 +910,7 @@ class AccountingService:
 
         if madelin_total_cent != 0:
 
-            self.fec_records.append(FecRecord(
+            self._appendFecRecord(FecRecord(
                 when=end_date,
                 label="Provision URSSAF TNS",
                 journal=self.journal_db.get_by_code('OD'),
@@ -799,7 +922,7 @@ class AccountingService:
                 ecriture_rec=None
             ))
 
-            self.fec_records.append(FecRecord(
+            self._appendFecRecord(FecRecord(
                 when=end_date,
                 label="Provision URSSAF TNS",
                 journal=self.journal_db.get_by_code('OD'),
@@ -811,27 +934,41 @@ class AccountingService:
                 ecriture_rec=None
             ))
 
-    def getNbMonths(self) -> int:
+    def reverseFecLines(self, lines: List[int], label: str) -> None:
+        """Cancels FEC lines (1-based) with an operation at the end of the accounting period (debit and credit swapped)"""
+        if not lines:
+            return
+
+        self.current_provenance = Provenance(CLOSING, "accounting", label)
         end_date = datetime.strptime(str(self.end_date), "%Y-%m-%d")
-        start_date = datetime.strptime(str(self.start_date), "%Y-%m-%d")
-        return (end_date.year - start_date.year) * 12 + end_date.month - start_date.month
+        num = self._getNextOpCounter()
+        for line in lines:
+            record = self.fec_records[line - 1]
+            self._appendFecRecord(FecRecord(
+                when=end_date,
+                label=label,
+                journal=self.journal_db.get_by_code('OD'),
+                account=self.leadger_account_db.get_by_code_or_fail(record.CompteNum + (record.CompAuxNum or "")),
+                evidence=None,
+                credit_cent=record.getDebitAsCent(),
+                debit_cent=record.getCreditAsCent(),
+                ecriture_num=num,
+                ecriture_rec=None
+            ))
 
-    def addCompanyTaxes(self) -> None:
-        balances = self.computeBalances()
-        rcai_cent = (balances["7"] if "7" in balances else 0) + (balances["6"] if "6" in balances else 0)
+    def getNbMonths(self) -> int:
+        return get_nb_months(self.start_date, self.end_date)
 
-        if rcai_cent <= 0:
+    def addCompanyTaxes(self, closing: ClosingResult) -> None:
+        self.current_provenance = Provenance(CLOSING, "accounting", "company_taxes")
+        if closing.taxable_result_cent <= 0:
             return
 
         end_date = datetime.strptime(str(self.end_date), "%Y-%m-%d")
-        nb_months = self.getNbMonths()
-
-        reduced_taxes_threshold = round(4250000.0 * nb_months / 12)
-        fiscal_due_cent = int(min(rcai_cent, reduced_taxes_threshold) * 0.15 + max(0, rcai_cent - reduced_taxes_threshold) * 0.25)
+        fiscal_due_cent = closing.company_tax_cent
+        last_num = self._getNextOpCounter()
 
-        last_num = self._getNextOpCounter(None)
-
-        self.fec_records.append(FecRecord(
+        self._appendFecRecord(FecRecord(
             when=end_date,
             label="Impôts sur les sociétés",
             journal=self.journal_db.get_by_code("OD"),
@@ -840,7 +977,7 @@ class AccountingService:
             debit_cent=fiscal_due_cent,
             ecriture_num=last_num))
 
-        self.fec_records.append(FecRecord(
+        self._appendFecRecord(FecRecord(
               when=end_date,
               label="Impôts sur les sociétés",
               journal=self.journal_db.get_by_code("OD"),
@@ -854,31 +991,32 @@ class AccountingService:
             if invoice.type == CLIENT_CREDIT:
                 for invoice_search in self.invoices:
                     if invoice.source_id in invoice_search.associated_credit:
-                        rec = self._getNextReconciliation()
                         end_date = datetime.strptime(str(self.end_date), "%Y-%m-%d")
                         if not invoice.fec_record or not invoice_search.fec_record:
                             raise Exception("Technical error 0001")
-                        invoice.fec_record.EcritureLet = rec
-                        invoice.fec_record.DateLet = end_date.strftime("%Y%m%d")
-                        invoice_search.fec_record.EcritureLet = rec
-                        invoice_search.fec_record.DateLet = end_date.strftime("%Y%m%d")
+                        rec = self.lettrage.allocate(invoice.fec_record.CompteNum)
+                        self._letter(invoice.fec_record, rec, end_date.strftime("%Y%m%d"))
+                        self._letter(invoice_search.fec_record, rec, end_date.strftime("%Y%m%d"))
 
     def closeAccouting(self) -> None:
 
-        # Add remaining miscellaneous transaction
-        self.doAccountingForMiscTransactionBefore(None)
-
-        # Add remaining invoices
-        self.doAccountingForInvoicesBefore(None)
+        # Add remaining invoices and miscellaneous transactions
+        self.doAccounting([])
 
         # Invoice credit reconciliation
         self.doInvoiceAndCreditReconciliation()
 
+        # Compute provisions and taxes from the account aggregates
+        self.closing = self.computeClosing()
+
         # Add provision
-        self.addSocialTaxesProvision()
+        self.addSocialTaxesProvision(self.closing)
 
         # Add taxes
-        self.addCompanyTaxes()
+        self.addCompanyTaxes(self.closing)
 
         # Validate all operations
         self.validateFec()
+
+        if self.event_log:
+            self.event_log.close()
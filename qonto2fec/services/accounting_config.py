@@ -0,0 +1,75 @@
+import csv
+import io
+import os
+from typing import List, NamedTuple, Optional, Tuple
+from .config_cache import load_cached
+from .file_utils import DELIMITER, QUOTECHAR
+
+ACCOUNTING_CONFIG_PATH = "config/accounting.cfg"
+
+
+class AccountingConfig(NamedTuple):
+    """Parsed content of the accounting.cfg file"""
+
+    journals: Tuple[Tuple[str, str], ...]
+    """Journals (code, label)"""
+
+    accounts: Tuple[Tuple[str, str, Optional[str]], ...]
+    """Default ledger accounts (code, name, qonto labels or categories)"""
+
+    closing: Tuple[Tuple[str, str, str], ...] = ()
+    """Closing parameters (name, applicable from YYYYMMDD, value)"""
+
+
+def parse_accounting_config(config_text: str) -> AccountingConfig:
+    """Parses journal, account and closing sections of the accounting configuration file in a single pass"""
+    journals: List[Tuple[str, str]] = []
+    accounts: List[Tuple[str, str, Optional[str]]] = []
+    closing: List[Tuple[str, str, str]] = []
+    journal_section = False
+    account_section = False
+    closing_section = False
+    for line in config_text.split("\n"):
+        line = line.strip()
+        if not line or "**" in line:
+            continue
+        if line[0:2] == "* ":
+            journal_section = "Journal" in line
+            account_section = "Account" in line
+            closing_section = "Closing" in line
+        elif journal_section:
+            parts = line.split("\t")
+            journals.append((parts[0], "".join(parts[1:])))
+        elif account_section:
+            parts = [part for part in line.split("\t") if part.strip() != ""]
+            if len(parts) == 2:
+                accounts.append((parts[0], parts[1], None))
+            elif len(parts) == 3:
+                accounts.append((parts[0], parts[1], parts[2]))
+            else:
+                raise ValueError(f"Incorrect line in accounting.cfg file : {line}")
+        elif closing_section:
+            parts = [part.strip() for part in line.split("\t") if part.strip() != ""]
+            if len(parts) != 3:
+                raise ValueError(f"Incorrect line in accounting.cfg file : {line}")
+            closing.append((parts[0], parts[1], parts[2]))
+
+    return AccountingConfig(journals=tuple(journals), accounts=tuple(accounts), closing=tuple(closing))
+
+
+def load_accounting_config(path: str = ACCOUNTING_CONFIG_PATH) -> AccountingConfig:
+    """Loads the accounting configuration, parsing the file only when it has changed"""
+    return load_cached(path, parse_accounting_config, "accounting_cfg")
+
+
+def parse_ledger_accounts(data_text: str) -> Tuple[Tuple[str, str, str], ...]:
+    """Parses a ledger account database file (code, name, qonto labels or categories)"""
+    csvreader = csv.DictReader(io.StringIO(data_text, newline=""), delimiter=DELIMITER, quotechar=QUOTECHAR)
+    return tuple((row["code"], row["name"], row["thirdparty_names_or_quonto_categories"]) for row in csvreader)
+
+
+def load_ledger_accounts(path: str) -> Tuple[Tuple[str, str, str], ...]:
+    """Loads a ledger account database file, parsing the file only when it has changed"""
+    if not os.path.exists(path):
+        return ()
+    return load_cached(path, parse_ledger_accounts, "accounts")
@@ -0,0 +1,58 @@
+import io
+import logging
+import os
+import tarfile
+import time
+import zipfile
+from typing import List, Tuple, Union
+
+ZIP = "zip"
+TAR_XZ = "tar.xz"
+ARCHIVE_FORMATS = [ZIP, TAR_XZ]
+
+ArchiveMember = Tuple[str, Union[str, bytes]]
+"""Name in the archive, and path of the file or content"""
+
+
+def _write_zip(archive_path: str, members: List[ArchiveMember]) -> None:
+    with zipfile.ZipFile(archive_path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, member in members:
+            if isinstance(member, bytes):
+                archive.writestr(zipfile.ZipInfo(name, time.localtime()[0:6]), member, compress_type=zipfile.ZIP_DEFLATED)
+            else:
+                archive.write(member, name)
+
+
+def _write_tar_xz(archive_path: str, members: List[ArchiveMember]) -> None:
+    with tarfile.open(archive_path, "w:xz") as archive:
+        for name, member in members:
+            if isinstance(member, bytes):
+                info = tarfile.TarInfo(name)
+                info.size = len(member)
+                info.mtime = int(time.time())
+                archive.addfile(info, io.BytesIO(member))
+            else:
+                archive.add(member, name, recursive=False)
+
+
+def build_archive(archive_path: str, members: List[ArchiveMember], archive_format: str = ZIP) -> None:
+    """Writes an archive in a single pass, files being streamed from their location (nothing is copied beforehand).
+
+    In a tar.xz archive, hardlinked files (evidences with the same content) are stored once.
+    The archive is written to a temporary file renamed at the end, so an interrupted build does not leave a partial archive.
+    """
+    if archive_format not in ARCHIVE_FORMATS:
+        raise ValueError(f"Unknown archive format : {archive_format} (expected one of {', '.join(ARCHIVE_FORMATS)})")
+
+    temporary_path = f"{archive_path}.part"
+    try:
+        if archive_format == ZIP:
+            _write_zip(temporary_path, members)
+        else:
+            _write_tar_xz(temporary_path, members)
+        os.replace(temporary_path, archive_path)
+    finally:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+    logging.info(f"{archive_path} has been successfully saved ({len(members)} files)")
@@ -0,0 +1,124 @@
+from typing import Callable, Dict, Iterable, List, Tuple
+from ..models.fec_record import FecRecord
+
+
+class BalanceAccumulator:
+    """Running balances of a ledger, updated each time a FEC record is appended or lettered.
+
+    All balances are "credit - debit" amounts in cents. Closing computations and balance queries
+    read these aggregates (one value per account, class, month or journal) instead of the FEC records.
+    """
+
+    ITEMIZED_PREFIXES = ("641",)
+    """Account prefixes whose movements are also kept one by one (social contributions are rounded per FEC record)"""
+
+    accounts: Dict[Tuple[str, str], int]
+    """Balance per account (CompteNum, CompteLib)"""
+
+    compte_nums: Dict[str, int]
+    """Balance per account number (CompteNum), auxiliary accounts included"""
+
+    classes: Dict[str, int]
+    """Balance per account class (first digit of CompteNum)"""
+
+    months: Dict[Tuple[str, str], Dict[str, int]]
+    """Movements per account (CompteNum, CompteLib) and month (YYYYMM)"""
+
+    days: Dict[Tuple[str, str], Dict[str, int]]
+    """Movements per account (CompteNum, CompteLib) and day (YYYYMMDD)"""
+
+    itemized: Dict[str, List[Tuple[str, int]]]
+    """Movements (YYYYMMDD, amount) in FEC order per account number (CompteNum) starting with one of the ITEMIZED_PREFIXES"""
+
+    journal_debits: Dict[str, int]
+    """Total debit per journal (JournalCode)"""
+
+    journal_credits: Dict[str, int]
+    """Total credit per journal (JournalCode)"""
+
+    month_headers: Dict[str, None]
+    """Months (YYYYMM) in order of first appearance"""
+
+    open_items: Dict[FecRecord, None]
+    """Third party records (401, 411 or auxiliary account) not yet lettered, in order of appearance"""
+
+    version: int
+    """Number of FEC records added (to detect stale balance indexes)"""
+
+    listeners: List[Callable[[Tuple[str, str], str, int], None]]
+    """Called with the account (CompteNum, CompteLib), the day (YYYYMMDD) and the change of each FEC record added (date indexes)"""
+
+    def __init__(self, fec_records: Iterable[FecRecord] = ()) -> None:
+        self.accounts = {}
+        self.compte_nums = {}
+        self.classes = {}
+        self.months = {}
+        self.days = {}
+        self.itemized = {}
+        self.journal_debits = {}
+        self.journal_credits = {}
+        self.month_headers = {}
+        self.open_items = {}
+        self.version = 0
+        self.listeners = []
+        for fec_record in fec_records:
+            self.add(fec_record)
+
+    def add(self, fec_record: FecRecord) -> None:
+        """Adds a new FEC record to the balances"""
+        self.version += 1
+        debit = fec_record.getDebitAsCent()
+        credit = fec_record.getCreditAsCent()
+        change = credit - debit
+        account = (fec_record.CompteNum, fec_record.CompteLib)
+        month = fec_record.EcritureDate[0:6]
+
+        self.accounts[account] = self.accounts.get(account, 0) + change
+        self.compte_nums[fec_record.CompteNum] = self.compte_nums.get(fec_record.CompteNum, 0) + change
+        self.classes[fec_record.CompteNum[0:1]] = self.classes.get(fec_record.CompteNum[0:1], 0) + change
+
+        account_months = self.months.setdefault(account, {})
+        account_months[month] = account_months.get(month, 0) + change
+        account_days = self.days.setdefault(account, {})
+        account_days[fec_record.EcritureDate] = account_days.get(fec_record.EcritureDate, 0) + change
+        self.month_headers[month] = None
+        for listener in self.listeners:
+            listener(account, fec_record.EcritureDate, change)
+        if fec_record.CompteNum.startswith(BalanceAccumulator.ITEMIZED_PREFIXES):
+            self.itemized.setdefault(fec_record.CompteNum, []).append((fec_record.EcritureDate, change))
+
+        self.journal_debits[fec_record.JournalCode] = self.journal_debits.get(fec_record.JournalCode, 0) + debit
+        self.journal_credits[fec_record.JournalCode] = self.journal_credits.get(fec_record.JournalCode, 0) + credit
+
+        third_party = fec_record.CompAuxNum or fec_record.CompteNum[0:3] in ["401", "411"]
+        if third_party and (not fec_record.EcritureLet or fec_record.EcritureLet.strip() == ""):
+            self.open_items[fec_record] = None
+
+    def letter(self, fec_record: FecRecord) -> None:
+        """Updates open items after a FEC record has been lettered"""
+        if fec_record.EcritureLet and fec_record.EcritureLet.strip() != "":
+            self.open_items.pop(fec_record, None)
+
+    def get_balance(self, compte_num_prefix: str) -> int:
+        """Balance of all the account numbers starting with a prefix"""
+        return sum([balance for compte_num, balance in self.compte_nums.items() if compte_num.startswith(compte_num_prefix)])
+
+    def get_days(self, compte_num_prefix: str) -> List[Tuple[str, str, int]]:
+        """Movements per day (CompteNum, YYYYMMDD, amount) of all the accounts starting with a prefix"""
+        return [
+            (compte_num, day, amount)
+            for (compte_num, _), account_days in self.days.items() if compte_num.startswith(compte_num_prefix)
+            for day, amount in account_days.items()]
+
+    def get_movements(self, compte_num_prefix: str) -> List[Tuple[str, str, int]]:
+        """Movements one by one (CompteNum, YYYYMMDD, amount) of the itemized accounts starting with a prefix"""
+        if not compte_num_prefix.startswith(BalanceAccumulator.ITEMIZED_PREFIXES):
+            raise ValueError(f"Movements of {compte_num_prefix} accounts are not itemized")
+        return [
+            (compte_num, day, amount)
+            for compte_num, movements in self.itemized.items() if compte_num.startswith(compte_num_prefix)
+            for day, amount in movements]
+
+    def get_open_items(self, compte_num: str) -> List[FecRecord]:
+        """Third party records not yet lettered on an account number"""
+        return [fec_record for fec_record in self.open_items if fec_record.CompteNum == compte_num]
@@ -0,0 +1,139 @@
+import logging
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+from ..models.financial_transaction import FinancialTransaction
+from ..models.ledger_account import LedgerAccount
+from .accounting_config import AccountingConfig
+
+
+BANK = "BANK"
+"""Account placeholder replaced by the ledger account of the transaction bank account"""
+
+ZERO = "0"
+NET = "net"
+MINUS_NET = "-net"
+ABS_NET = "|net|"
+ABS_VAT = "|vat|"
+MINUS_ABS_VAT = "-|vat|"
+ABS_GROSS = "|net|+|vat|"
+
+AMOUNT_FORMULAS: Dict[str, Callable[[FinancialTransaction], int]] = {
+    ZERO: lambda t: 0,
+    NET: lambda t: t.amount_excluding_vat,
+    MINUS_NET: lambda t: -t.amount_excluding_vat,
+    ABS_NET: lambda t: abs(t.amount_excluding_vat),
+    ABS_VAT: lambda t: abs(t.vat),
+    MINUS_ABS_VAT: lambda t: -1 * abs(t.vat),
+    ABS_GROSS: lambda t: abs(t.amount_excluding_vat) + abs(t.vat),
+}
+"""Amounts of a posting line computed from a bank transaction (in cents)"""
+
+
+class TransactionSignature(NamedTuple):
+    """What the accounting rules look at in a bank transaction (all the transactions with the same signature are posted the same way)"""
+
+    category: str
+    thirdparty_name: str
+    sign: int
+    """Sign of the amount excluding VAT (-1, 0 or 1)"""
+
+    has_vat: bool
+    internal_transfer: bool
+    """'Virement interne' in the reference"""
+
+    vat_return: bool
+    """'TVA' and 'CA3' in the reference"""
+
+    bank_account: str
+    counterparty_account: Optional[str]
+    """Ledger account of the counterparty of a transfer between two configured IBANs"""
+
+    @staticmethod
+    def from_transaction(transaction: FinancialTransaction) -> "TransactionSignature":
+        reference = str(transaction.reference)
+        return TransactionSignature(
+            category=transaction.category,
+            thirdparty_name=transaction.thirdparty_name,
+            sign=(transaction.amount_excluding_vat > 0) - (transaction.amount_excluding_vat < 0),
+            has_vat=transaction.vat != 0,
+            internal_transfer="Virement interne" in reference,
+            vat_return="TVA" in reference and "CA3" in reference,
+            bank_account=transaction.bank_account,
+            counterparty_account=transaction.counterparty_account)
+
+
+class PostingLine(NamedTuple):
+    """A FEC record to create, amounts are formula names (see AMOUNT_FORMULAS)"""
+
+    journal_code: str
+    account: str
+    """Ledger account code or BANK"""
+
+    credit: str
+    debit: str
+    lettered: bool = False
+    """Lettered with the code of the operation (or of the previous one)"""
+
+    vat_base: Optional[str] = None
+    """Taxable base formula when the line is on a VAT account"""
+
+
+class PostingOperation(NamedTuple):
+    """Lines sharing the same EcritureNum"""
+
+    lettrage_account: Optional[str]
+    """Account for which a new lettrage code is allocated (None to keep the current code)"""
+
+    lines: Tuple[PostingLine, ...]
+
+
+class PostingTemplate(NamedTuple):
+    """How a bank transaction is posted"""
+
+    operations: Tuple[PostingOperation, ...]
+    note: Optional[str] = None
+    """Replaces the transaction note (FEC label) when defined"""
+
+
+class ClassificationCache:
+    """Posting templates already computed, per transaction signature.
+
+    Templates depend on the accounting configuration and on the ledger accounts matching the transaction category:
+    the cache is emptied when accounting.cfg is reloaded, and the templates of a category are dropped
+    when a ledger account matching this category is added (ledger accounts are only appended).
+    """
+
+    templates: Dict[TransactionSignature, PostingTemplate]
+    config: Optional[AccountingConfig] = None
+    known_accounts: int = 0
+    """Number of ledger accounts the templates have been computed with"""
+
+    hits: int = 0
+    misses: int = 0
+
+    def __init__(self) -> None:
+        self.templates = {}
+
+    def _validate(self, config: AccountingConfig, accounts: List[LedgerAccount]) -> None:
+        if config is not self.config:
+            if self.templates:
+                logging.debug(f"Accounting configuration changed, {len(self.templates)} posting templates dropped")
+            self.templates = {}
+            self.config = config
+            self.known_accounts = len(accounts)
+
+        elif len(accounts) != self.known_accounts:
+            categories = {name for account in accounts[self.known_accounts:] for name in account.thirdparty_names_or_quonto_categories}
+            self.templates = {signature: template for signature, template in self.templates.items() if signature.category not in categories}
+            self.known_accounts = len(accounts)
+
+    def get(self, signature: TransactionSignature, config: AccountingConfig, accounts: List[LedgerAccount]) -> Optional[PostingTemplate]:
+        self._validate(config, accounts)
+        template = self.templates.get(signature)
+        if template is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return template
+
+    def put(self, signature: TransactionSignature, template: PostingTemplate) -> None:
+        self.templates[signature] = template
@@ -0,0 +1,131 @@
+from bisect import bisect_right
+from datetime import datetime
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+from .balance_accumulator import BalanceAccumulator
+
+DatedTable = Tuple[Tuple[str, float], ...]
+"""Values applicable from a date (YYYYMMDD, included), sorted by date"""
+
+
+class ClosingParameters(NamedTuple):
+    """Rates and thresholds of the year-end closing (dated tables, see the Closing section of accounting.cfg)"""
+
+    social_tax_rates: DatedTable = (("00000000", 0.167), ("20240731", 0.455))
+    """Social contributions of the manager (TNS) on their remuneration (641), by remuneration date (reduced rate with ACRE until the cut-off)"""
+
+    madelin_caps_cent: DatedTable = (("00000000", 167400),)
+    """Maximum Madelin contributions (on 64114 remuneration), by fiscal year end date (the excess is a mandatory contribution)"""
+
+    company_tax_thresholds_cent: DatedTable = (("00000000", 4250000),)
+    """Profit taxed at the reduced company tax rate for a 12 months fiscal year, by fiscal year end date"""
+
+    company_tax_reduced_rates: DatedTable = (("00000000", 0.15),)
+    """Reduced company tax rate (IS), by fiscal year end date"""
+
+    company_tax_rates: DatedTable = (("00000000", 0.25),)
+    """Normal company tax rate (IS), by fiscal year end date"""
+
+
+def get_dated_value(table: DatedTable, day: str) -> float:
+    """Value of a dated table applicable on a day (YYYYMMDD)"""
+    index = bisect_right([from_day for from_day, _ in table], day)
+    if index == 0:
+        raise ValueError(f"No value applicable on {day} in {table}")
+    return table[index - 1][1]
+
+
+def parse_dated_table(text: str) -> DatedTable:
+    """Parses a dated table from text : VALUE (applicable to all dates) or YYYYMMDD:VALUE,YYYYMMDD:VALUE,..."""
+    table = []
+    for item in text.split(","):
+        from_day, _, value = item.strip().rpartition(":")
+        table.append((from_day.replace("-", "") or "00000000", float(value)))
+    return tuple(sorted(table))
+
+
+def load_closing_parameters(lines: Iterable[Tuple[str, str, str]]) -> ClosingParameters:
+    """Closing parameters from the lines (name, applicable from, value) of accounting.cfg, defaults for the parameters not listed"""
+    tables: Dict[str, List[Tuple[str, float]]] = {}
+    for name, from_day, value in lines:
+        if name not in ClosingParameters._fields:
+            raise ValueError(f"Unknown closing parameter in accounting.cfg file : {name}")
+        tables.setdefault(name, []).append((from_day, float(value)))
+    return ClosingParameters()._replace(**{name: tuple(sorted(table)) for name, table in tables.items()})
+
+
+def get_nb_months(start_date: str, end_date: str) -> int:
+    end = datetime.strptime(end_date, "%Y-%m-%d")
+    start = datetime.strptime(start_date, "%Y-%m-%d")
+    return (end.year - start.year) * 12 + end.month - start.month
+
+
+class ClosingAggregates(NamedTuple):
+    """Account aggregates of a fiscal year before closing (amounts are "credit - debit" in cents)"""
+
+    end_date: str
+    """Fiscal year end date (YYYYMMDD)"""
+
+    nb_months: int
+    social_tax_balance_cent: int
+    """Balance of the social contributions already recorded (646)"""
+
+    remunerations: Tuple[Tuple[str, str, int], ...]
+    """Remuneration movements (CompteNum, YYYYMMDD, amount), one per FEC record (641)"""
+
+    result_cent: int
+    """Result before closing (classes 6 and 7)"""
+
+
+class ClosingResult(NamedTuple):
+    """Provisions and taxes of the year-end closing (amounts in cents)"""
+
+    social_tax_provision_cent: int
+    """Mandatory social contributions still to pay (646 / 4386)"""
+
+    madelin_provision_cent: int
+    """Madelin contributions still to pay (6461 / 43861)"""
+
+    taxable_result_cent: int
+    """Result after the social provisions, before company tax"""
+
+    company_tax_cent: int
+    net_result_cent: int
+    """Result carried forward to the next fiscal year (120 or 129)"""
+
+
+def get_closing_aggregates(balances: BalanceAccumulator, start_date: str, end_date: str) -> ClosingAggregates:
+    return ClosingAggregates(
+        end_date=end_date.replace("-", ""),
+        nb_months=get_nb_months(start_date, end_date),
+        social_tax_balance_cent=balances.get_balance("646"),
+        remunerations=tuple(balances.get_movements("641")),
+        result_cent=balances.classes.get("6", 0) + balances.classes.get("7", 0))
+
+
+def compute_closing(aggregates: ClosingAggregates, parameters: ClosingParameters) -> ClosingResult:
+    """Computes the closing provisions and taxes from the aggregates only (no FEC record is read or created)"""
+
+    # Social contributions : already paid, and should have been paid
+    mandatory_total_cent = aggregates.social_tax_balance_cent
+    madelin_total_cent = 0
+    for compte_num, day, change in aggregates.remunerations:
+        tax_rate = get_dated_value(parameters.social_tax_rates, day)
+        if compte_num == "64114":
+            madelin_total_cent += round(float(-change) * tax_rate)
+        else:
+            mandatory_total_cent += round(float(-change) * tax_rate)
+
+    madelin_cap_cent = int(get_dated_value(parameters.madelin_caps_cent, aggregates.end_date))
+    if madelin_total_cent > madelin_cap_cent:
+        mandatory_total_cent += madelin_total_cent - madelin_cap_cent
+        madelin_total_cent = madelin_cap_cent
+
+    # Company tax on the result after the social provisions
+    rcai_cent = aggregates.result_cent - mandatory_total_cent - madelin_total_cent
+    fiscal_due_cent = 0
+    if rcai_cent > 0:
+        reduced_taxes_threshold = round(get_dated_value(parameters.company_tax_thresholds_cent, aggregates.end_date) * aggregates.nb_months / 12)
+        fiscal_due_cent = int(min(rcai_cent, reduced_taxes_threshold) * get_dated_value(parameters.company_tax_reduced_rates, aggregates.end_date)
+                              + max(0, rcai_cent - reduced_taxes_threshold) * get_dated_value(parameters.company_tax_rates, aggregates.end_date))
+
+    return ClosingResult(mandatory_total_cent, madelin_total_cent, rcai_cent, fiscal_due_cent, rcai_cent - fiscal_due_cent)
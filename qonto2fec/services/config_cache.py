@@ -0,0 +1,81 @@
+import hashlib
+import logging
+import os
+import pickle
+from typing import Any, Callable, Dict, Tuple, TypeVar
+
+T = TypeVar("T")
+
+CACHE_DIR = "./cache/"
+"""Directory where compiled configuration files are stored"""
+
+CACHE_VERSION = 4
+"""Bump this value each time the format of a parsed payload changes"""
+
+_memory_cache: Dict[str, Tuple[int, int, Any]] = {}
+"""Parsed payloads already loaded by this process (key is name + path, value is mtime, size, payload)"""
+
+
+def _cache_path(name: str, path: str) -> str:
+    path_hash = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[0:12]
+    return os.path.join(CACHE_DIR, f"{name}-{path_hash}.pickle")
+
+
+def _write_cache(cache_path: str, header: Dict[str, Any], payload: Any) -> None:
+    try:
+        if not os.path.exists(CACHE_DIR):
+            os.makedirs(CACHE_DIR)
+        tmp_path = f"{cache_path}.tmp"
+        with open(tmp_path, "wb") as file:
+            pickle.dump((header, payload), file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logging.warning(f"Unable to write configuration cache {cache_path}: {e}")
+
+
+def load_cached(path: str, parser: Callable[[str], T], name: str) -> T:
+    """
+    Parses a text configuration file once and keeps the result in a compiled binary cache.
+
+    The cache is reused as long as the file modification time and size are unchanged.
+    When they changed, the content hash is compared before parsing again the file.
+    The parser must return an immutable payload (tuples, named tuples, strings, ...) as it is shared between callers.
+    """
+    stat = os.stat(path)
+    memory_key = f"{name}:{os.path.abspath(path)}"
+    if memory_key in _memory_cache:
+        mtime_ns, size, payload = _memory_cache[memory_key]
+        if mtime_ns == stat.st_mtime_ns and size == stat.st_size:
+            return payload  # type: ignore[no-any-return]
+
+    cache_path = _cache_path(name, path)
+    header: Dict[str, Any] = {}
+    cached_payload: Any = None
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, "rb") as file:
+                header, cached_payload = pickle.load(file)
+        except Exception as e:
+            logging.warning(f"Ignoring unreadable configuration cache {cache_path}: {e}")
+            header = {}
+
+    if header.get("version") == CACHE_VERSION and header.get("mtime_ns") == stat.st_mtime_ns and header.get("size") == stat.st_size:
+        logging.debug(f"{path} loaded from configuration cache")
+        _memory_cache[memory_key] = (stat.st_mtime_ns, stat.st_size, cached_payload)
+        return cached_payload  # type: ignore[no-any-return]
+
+    with open(path, "rb") as file:
+        content = file.read()
+    content_hash = hashlib.sha256(content).hexdigest()
+
+    if header.get("version") == CACHE_VERSION and header.get("sha256") == content_hash:
+        # File touched but content unchanged
+        payload = cached_payload
+    else:
+        logging.debug(f"{path} changed, parsing it again")
+        payload = parser(content.decode("utf-8"))
+
+    new_header = {"version": CACHE_VERSION, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha256": content_hash}
+    _write_cache(cache_path, new_header, payload)
+    _memory_cache[memory_key] = (stat.st_mtime_ns, stat.st_size, payload)
+    return payload  # type: ignore[no-any-return]
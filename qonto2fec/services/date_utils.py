@@ -1,5 +1,17 @@
-import pytz
-from datetime import datetime
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Any, Dict, List
+
+
+_timezones: Dict[str, Any] = {}
+"""pytz timezones, loaded on first use (pytz import is slow)"""
+
+
+def _get_timezone(name: str) -> Any:
+    if name not in _timezones:
+        import pytz
+        _timezones[name] = pytz.timezone(name)
+    return _timezones[name]
 
 
 def conv_date_from_utc_to_local(date: str | datetime) -> datetime:
@@ -7,16 +19,53 @@ def conv_date_from_utc_to_local(date: str | datetime) -> datetime:
     Normalize a date to Europe/Paris timezone from a UTC based date
     """
     if type(date) is str:
+        return _conv_str_date_from_utc_to_local(date)
+    return _conv_datetime_from_utc_to_local(date)  # type: ignore[arg-type]
+
+
+@lru_cache(maxsize=4096)
+def _conv_str_date_from_utc_to_local(date: str) -> datetime:
+    """Same as conv_date_from_utc_to_local for text dates (FEC dates are converted many times)"""
+    try:
+        date_t = datetime.strptime(date, "%Y-%m-%dT%H:%M:%S.%fZ")
+    except ValueError:
         try:
-            date = datetime.strptime(date, "%Y-%m-%dT%H:%M:%S.%fZ")
+            date_t = datetime.strptime(date, "%Y-%m-%d")
         except ValueError:
-            try:
-                date = datetime.strptime(str(date), "%Y-%m-%d")
-            except ValueError:
-                date = datetime.strptime(str(date), "%Y%m%d")
+            date_t = datetime.strptime(date, "%Y%m%d")
+    return _conv_datetime_from_utc_to_local(date_t)
+
+
+def get_months(start_date: str, end_date: str) -> List[str]:
+    """
+    Months (YYYYMM) from the month of start_date to the month of end_date (YYYY-MM-DD), included
+    """
+    start = datetime.strptime(start_date, "%Y-%m-%d")
+    end = datetime.strptime(end_date, "%Y-%m-%d")
+    return [f"{start.year + (start.month - 1 + i) // 12}{(start.month - 1 + i) % 12 + 1:02d}"
+            for i in range((end.year - start.year) * 12 + end.month - start.month + 1)]
+
+
+def get_previous_month(month: str) -> str:
+    """
+    Month (YYYYMM) before a month (YYYYMM)
+    """
+    year, month_number = int(month[0:4]), int(month[4:6])
+    return f"{year - 1}12" if month_number == 1 else f"{year}{month_number - 1:02d}"
+
+
+def get_month_end(month: str) -> datetime:
+    """
+    Last instant of a month (YYYYMM) in Europe/Paris timezone
+    """
+    year, month_number = int(month[0:4]), int(month[4:6])
+    next_month = datetime(year + month_number // 12, month_number % 12 + 1, 1)
+    return _get_timezone("Europe/Paris").localize(next_month) - timedelta(microseconds=1)  # type: ignore[no-any-return]
+
 
-    local_tz = pytz.timezone("Europe/Paris")
-    utc_tz = pytz.timezone("UTC")
+def _conv_datetime_from_utc_to_local(date: datetime) -> datetime:
+    local_tz = _get_timezone("Europe/Paris")
+    utc_tz = _get_timezone("UTC")
     dt_utc = utc_tz.localize(date)
     dt_local = local_tz.normalize(dt_utc)
     if type(dt_local) is datetime:
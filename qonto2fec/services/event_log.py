@@ -0,0 +1,293 @@
+import io
+import logging
+import marshal
+import os
+import pickle
+import struct
+from collections import Counter
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+from ..models.fec_record import FEC_COLUMNS, FecRecord, FecRecordTables
+from .balance_accumulator import BalanceAccumulator
+from .classification import ClassificationCache
+from .fec_diff import SEMANTIC_FIELDS
+from .provenance import Provenance, ProvenanceIndex
+
+EVENT_RECORD = 0
+"""A FEC record has been created (payload : FEC values)"""
+
+EVENT_LETTRAGE = 1
+"""A FEC record has been lettered (payload : record position, EcritureLet, DateLet)"""
+
+EVENT_INVOICE = 2
+"""An invoice has been posted (payload : source, source id, number, position of its first record)"""
+
+EVENT_MISC = 3
+"""A miscellaneous transaction has been posted (payload : PieceRef, EcritureLib, position of its first record)"""
+
+EVENT_SNAPSHOT = 4
+"""State of the accounting before the events of a month are posted
+(payload : month YYYYMM, number of events and of records before the snapshot, pickled replay state, see checkpoint)"""
+
+EVENT_PROVENANCE = 5
+"""Provenance of the next records (payload : kind, source, source id), logged when it changes"""
+
+MAGIC = b"QFEL\x03"
+"""File signature and format version"""
+
+_HEADER = struct.Struct("<BI")
+"""Event header : type, payload size"""
+
+_LET_INDEX = FEC_COLUMNS.index("EcritureLet")
+_DATE_LET_INDEX = FEC_COLUMNS.index("DateLet")
+_ECRITURE_NUM_INDEX = FEC_COLUMNS.index("EcritureNum")
+_SEMANTIC_INDEXES = [FEC_COLUMNS.index(field) for field in SEMANTIC_FIELDS]
+
+_FEC_RECORDS = "fec_records"
+_PROVENANCE = "provenance"
+_PREVIOUS_YEAR_BALANCES = "previous_year_balances"
+_CLASSIFICATION_CACHE = "classification_cache"
+_REBUILT_ATTRIBUTES = (_FEC_RECORDS, _PROVENANCE, _PREVIOUS_YEAR_BALANCES, _CLASSIFICATION_CACHE)
+"""Attributes of the accounting service not pickled in the snapshots : the ledger and the provenance index are rebuilt
+from the log, the previous year balances (only read when accounts are opened) and the classification cache are restored empty"""
+
+
+def _values(fec_record: FecRecord) -> List[Any]:
+    record = fec_record._asdict()
+    return [record[column] for column in FEC_COLUMNS]
+
+
+def _semantic_key(fec_record: FecRecord) -> Tuple[Any, ...]:
+    values = _values(fec_record)
+    return tuple(values[index] for index in _SEMANTIC_INDEXES)
+
+
+class _SnapshotPickler(pickle.Pickler):
+    """Pickles the replay state of the accounting service : logged FEC records are replaced by their position in the log,
+    the attributes of _REBUILT_ATTRIBUTES by their name"""
+
+    def __init__(self, file: BinaryIO, positions: Dict[FecRecord, int], accounting_service: Any) -> None:
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.positions = positions
+        self.rebuilt = {id(getattr(accounting_service, name)): name for name in _REBUILT_ATTRIBUTES}
+
+    def persistent_id(self, obj: Any) -> Any:
+        if type(obj) is FecRecord:
+            return self.positions.get(obj)
+        return self.rebuilt.get(id(obj))
+
+
+class _SnapshotUnpickler(pickle.Unpickler):
+    """Restores the replay state pickled by _SnapshotPickler with the records and provenances rebuilt from the log"""
+
+    def __init__(self, file: BinaryIO, fec_records: List[FecRecord], provenance: ProvenanceIndex) -> None:
+        super().__init__(file)
+        self.fec_records = fec_records
+        self.rebuilt: Dict[str, Any] = {_FEC_RECORDS: fec_records, _PROVENANCE: provenance,
+                                        _PREVIOUS_YEAR_BALANCES: BalanceAccumulator(), _CLASSIFICATION_CACHE: ClassificationCache()}
+
+    def persistent_load(self, pid: Any) -> Any:
+        if isinstance(pid, int):
+            return self.fec_records[pid]
+        return self.rebuilt[pid]
+
+
+class EventLog:
+    """Append-only binary log of the posting decisions of the accounting service.
+
+    Each event is a header (type, size) followed by a marshal payload. The replay state of the accounting service
+    (counters, lettrage allocator, balances and open items, VAT figures, invoices and OPS cursor) is snapshotted
+    at each monthly checkpoint, so the accounting can be replayed with changed rules from the snapshot of a month.
+    A snapshot does not contain the FEC records : they are referenced by their position in the log and rebuilt
+    from the events before the snapshot, so its size does not grow with the ledger.
+    The log is written to a .part file which replaces the log of the previous run when it is closed, the log of
+    the previous run being kept (.previous) to tell what changed since then.
+    """
+
+    name: str
+    path: str
+    file: Optional[BinaryIO] = None
+    events: int = 0
+    positions: Dict[FecRecord, int]
+    """Position of the records logged so far"""
+
+    provenance: Optional[Provenance] = None
+    """Provenance of the last record logged"""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.path = EventLog.get_path(name) + ".part"
+        self.positions = {}
+        self.events = 0
+
+        if not os.path.exists("./export/"):
+            os.makedirs("./export/")
+
+        self.file = open(self.path, "wb")
+        self.file.write(MAGIC)
+
+    @staticmethod
+    def get_path(name: str, previous: bool = False) -> str:
+        return f"./export/{name.replace('/', '').replace('-', '')}{'.previous' if previous else ''}.events"
+
+    def _write(self, event_type: int, payload: Any) -> None:
+        if not self.file:
+            raise ValueError(f"Event log {self.path} is closed")
+
+        data = marshal.dumps(payload)
+        self.file.write(_HEADER.pack(event_type, len(data)))
+        self.file.write(data)
+        self.events += 1
+
+    def checkpoint(self, month: str, accounting_service: Any) -> None:
+        """Snapshots the replay state of the accounting service before the events of a month (YYYYMM) are posted"""
+        state = io.BytesIO()
+        _SnapshotPickler(state, self.positions, accounting_service).dump(accounting_service)
+        self._write(EVENT_SNAPSHOT, (month, self.events, len(self.positions), state.getvalue()))
+
+    def record(self, fec_record: FecRecord, provenance: Provenance) -> None:
+        if provenance != self.provenance:
+            self.provenance = provenance
+            self._write(EVENT_PROVENANCE, tuple(provenance))
+        self.positions[fec_record] = len(self.positions)
+        self._write(EVENT_RECORD, tuple(_values(fec_record)))
+
+    def lettrage(self, fec_record: FecRecord) -> None:
+        values = _values(fec_record)
+        self._write(EVENT_LETTRAGE, (self.positions[fec_record], values[_LET_INDEX], values[_DATE_LET_INDEX]))
+
+    def invoice(self, source: str, source_id: str, number: str, first_position: int) -> None:
+        self._write(EVENT_INVOICE, (source, source_id, number, first_position))
+
+    def misc_transaction(self, piece_ref: str, label: str, first_position: int) -> None:
+        self._write(EVENT_MISC, (piece_ref, label, first_position))
+
+    def close(self) -> None:
+        """Closes the log and makes it the log of the last run"""
+        if self.file:
+            self.file.close()
+            self.file = None
+
+            path = EventLog.get_path(self.name)
+            if os.path.exists(path):
+                os.replace(path, EventLog.get_path(self.name, previous=True))
+            os.replace(self.path, path)
+            logging.info(f"{path} has been successfully saved ({self.events} events)")
+
+    def abort(self) -> None:
+        """Closes and removes the log of a run which did not complete (the log of the last run is kept)"""
+        if self.file:
+            self.file.close()
+            self.file = None
+            os.remove(self.path)
+            logging.info(f"{self.path} has been removed")
+
+
+def _read_header(file: BinaryIO, path: str) -> None:
+    if file.read(len(MAGIC)) != MAGIC:
+        raise ValueError(f"{path} is not an event log or has an unsupported version")
+
+
+def iter_events(path: str, offset: Optional[int] = None) -> Iterator[Tuple[int, int, Any]]:
+    """Yields the events (offset, type, payload) of a log, from the beginning or from an offset"""
+    with open(path, "rb") as file:
+        _read_header(file, path)
+        if offset is not None:
+            file.seek(offset)
+        while True:
+            event_offset = file.tell()
+            header = file.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                return  # End of log (or interrupted write)
+            event_type, size = _HEADER.unpack(header)
+            data = file.read(size)
+            if len(data) < size:
+                return
+            yield event_offset, event_type, marshal.loads(data)
+
+
+def _snapshot_offsets(path: str) -> List[int]:
+    """Offsets of the snapshots, found by reading the event headers only"""
+    offsets: List[int] = []
+    with open(path, "rb") as file:
+        _read_header(file, path)
+        while True:
+            offset = file.tell()
+            header = file.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                return offsets
+            event_type, size = _HEADER.unpack(header)
+            if event_type == EVENT_SNAPSHOT:
+                offsets.append(offset)
+            file.seek(size, os.SEEK_CUR)
+
+
+def _check_exists(path: str) -> None:
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{path} does not exists, please run the account or sync command first")
+
+
+def _rebuild(path: str, until_offset: Optional[int] = None) -> Tuple[List[FecRecord], ProvenanceIndex]:
+    """Rebuilds the FEC records (with their lettrage) and their provenance from the events of a log, up to an offset"""
+    fec_records: List[FecRecord] = []
+    provenance_index = ProvenanceIndex()
+    provenance = None
+    tables = FecRecordTables()
+    for offset, event_type, payload in iter_events(path):
+        if until_offset is not None and offset >= until_offset:
+            break
+        if event_type == EVENT_RECORD:
+            fec_records.append(FecRecord.from_dict(dict(zip(FEC_COLUMNS, payload)), tables))
+            if provenance:
+                provenance_index.add(payload[_ECRITURE_NUM_INDEX], provenance)
+        elif event_type == EVENT_LETTRAGE:
+            position, ecriture_let, date_let = payload
+            fec_records[position].EcritureLet = ecriture_let
+            fec_records[position].DateLet = date_let
+        elif event_type == EVENT_PROVENANCE:
+            provenance = Provenance(*payload)
+    return fec_records, provenance_index
+
+
+def load_ledger(path: str) -> List[FecRecord]:
+    """Rebuilds the FEC records from the events of a log"""
+    _check_exists(path)
+    return _rebuild(path)[0]
+
+
+def load_checkpoint(path: str, month: str) -> Tuple[str, Any]:
+    """Month (YYYYMM) and accounting service (not closed, without event log, see _REBUILT_ATTRIBUTES) of the last snapshot
+    taken at or before a month, or of the first snapshot if they are all after it"""
+    _check_exists(path)
+    checkpoint = None
+    for offset in _snapshot_offsets(path):
+        _, event_type, payload = next(iter_events(path, offset))
+        if checkpoint is not None and payload[0] > month:
+            break
+        checkpoint = offset, payload
+    if checkpoint is None:
+        raise ValueError(f"No snapshot in {path}, please run the account or sync command again")
+
+    offset, (snapshot_month, _, nb_records, state) = checkpoint
+    fec_records, provenance_index = _rebuild(path, offset)
+    if len(fec_records) != nb_records:
+        raise ValueError(f"{path} is corrupted : {len(fec_records)} records before the snapshot of {snapshot_month}, {nb_records} expected")
+    return snapshot_month, _SnapshotUnpickler(io.BytesIO(state), fec_records, provenance_index).load()
+
+
+def get_changes(name: str) -> Tuple[List[FecRecord], List[FecRecord]]:
+    """FEC records removed and added by the last run, compared to the previous one.
+
+    Records are compared on their semantic fields (see fec_diff.SEMANTIC_FIELDS) : a record only renumbered
+    (or lettered differently) is neither removed nor added.
+    """
+    previous_path = EventLog.get_path(name, previous=True)
+    previous = load_ledger(previous_path) if os.path.exists(previous_path) else []
+    current = load_ledger(EventLog.get_path(name))
+
+    previous_keys = [_semantic_key(r) for r in previous]
+    current_keys = [_semantic_key(r) for r in current]
+    previous_lines = Counter(previous_keys)
+    current_lines = Counter(current_keys)
+    removed = [r for r, key in zip(previous, previous_keys) if previous_lines[key] > current_lines[key]]
+    added = [r for r, key in zip(current, current_keys) if current_lines[key] > previous_lines[key]]
+    return removed, added
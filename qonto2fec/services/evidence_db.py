@@ -1,11 +1,9 @@
 import logging
 import os
-import urllib.request
-from typing import List, Any
+from typing import Any, Dict, List, Optional
 from datetime import datetime
-from tqdm import tqdm
 from ..models.evidence import Evidence
-from .file_utils import save_dict_to_csv
+from .file_utils import read_dict_from_csv, save_dict_to_csv
 
 
 class EvidenceDB:
@@ -16,6 +14,7 @@ class EvidenceDB:
 
     def __init__(self, name: str) -> None:
         self.db_name = name
+        self.evidences = []
 
     def get_or_add(self, source: str, reference: str, when: datetime) -> Evidence:
         if source is None or reference == "":
@@ -35,30 +34,59 @@ class EvidenceDB:
 
         return new_evidence
 
+    def load(self, rows: Optional[List[Dict[str, str]]] = None) -> None:
+        """Loads evidences previously saved in the export directory (or given rows, e.g. from the ledger database)"""
+        if rows is None:
+            rows = read_dict_from_csv(self.db_name, False)
+        self.evidences = [
+            Evidence(
+                number=int(row["number"]),
+                source=row["source"],
+                source_reference=row["source_reference"],
+                source_path=row["source_path"] if row["source_path"] else None,
+                when=row["when"])
+            for row in rows]
+
     def save(self) -> None:
         save_dict_to_csv([d._asdict() for d in self.evidences], self.db_name, False)
 
     def download_evidences(self, qonto_client: Any, start_date: str) -> None:
         """
         Download and save evidence files to the export directory
+
+        Files are stored once per content in the evidence store, numbered files are hardlinks to them.
+        Evidences already in the store are not downloaded again.
         """
+        from tqdm import tqdm
+        from .evidence_store import EvidenceStore
+
         if not os.path.exists(f"./export/EVIDENCES_{start_date.replace('-', '')}/"):
             os.makedirs(f"./export/EVIDENCES_{start_date.replace('-', '')}/")
 
         logging.info(f"Exporting evidences")
-        for evidence in tqdm(self.evidences, desc="Downloading evidences", unit="file"):
-            if evidence.source == "Qonto":
-                try:
-                    info = qonto_client.getAttachmentInfo(evidence.source_reference)
-                    url = info["url"]
-                    file_name = f"{evidence.number:05d}-{info['file_name']}"
-                    file_path = f"./export/EVIDENCES_{start_date.replace('-', '')}/{file_name}"
+        store = EvidenceStore()
+        try:
+            for evidence in tqdm(self.evidences, desc="Downloading evidences", unit="file"):
+                if evidence.source == "Qonto":
+                    try:
+                        entry = store.get(evidence.source_reference)
+                        if entry:
+                            logging.debug(f"Evidence {evidence.number} already downloaded, skipping download.")
+                            sha256, file_name = entry["sha256"], entry["file_name"]
+                        else:
+                            info = qonto_client.getAttachmentInfo(evidence.source_reference)
+                            file_name = info["file_name"]
+                            previous_path = f"./export/EVIDENCES_{start_date.replace('-', '')}/{evidence.number:05d}-{file_name}"
+                            if os.path.exists(previous_path):
+                                sha256 = store.add_file(evidence.source_reference, file_name, previous_path)
+                            else:
+                                logging.debug(f"Downloading evidence {evidence.number} from {evidence.source_reference}...")
+                                sha256 = store.download(evidence.source_reference, file_name, info["url"])
 
-                    if not os.path.exists(file_path):
-                        logging.debug(f"Downloading evidence {evidence.number} from {evidence.source_reference}...")
-                        urllib.request.urlretrieve(url, file_path)
-                    else:
-                        logging.debug(f"Evidence {evidence.number} already exists, skipping download.")
-                    evidence.source_path = file_path
-                except Exception as e:
-                    logging.error(f"Failed to download evidence {evidence.number}: {e}")
\ No newline at end of file
+                        file_path = f"./export/EVIDENCES_{start_date.replace('-', '')}/{evidence.number:05d}-{file_name}"
+                        store.link(sha256, file_path)
+                        evidence.source_path = file_path
+                    except Exception as e:
+                        logging.error(f"Failed to download evidence {evidence.number}: {e}")
+        finally:
+            store.save()
@@ -0,0 +1,100 @@
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+from typing import Dict, Optional
+from .file_utils import read_dict_from_csv, save_dict_to_csv
+
+STORE_DIR = "./export/EVIDENCES_STORE/"
+"""Content-addressed evidence files (named by their SHA-256)"""
+
+INDEX_NAME = "EVIDENCES_STORE_INDEX"
+"""Source reference -> SHA-256 and file name of the stored evidence files"""
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class EvidenceStore:
+    """Content-addressed store of the downloaded evidence files.
+
+    Each file is stored once under its SHA-256, whatever the number of evidences (attachments) with the same content.
+    Numbered evidence files (e.g. 00012-invoice.pdf) are hardlinks to the stored files (copies when links are not supported).
+    An index of the source references already downloaded avoids downloading them again, even when evidence numbers change.
+    """
+
+    root: str
+    index: Dict[str, Dict[str, str]]
+    """source_reference -> {source_reference, sha256, file_name}"""
+
+    def __init__(self, root: str = STORE_DIR) -> None:
+        self.root = root
+        if not os.path.exists(self.root):
+            os.makedirs(self.root)
+        self.index = {row["source_reference"]: row for row in read_dict_from_csv(INDEX_NAME, False)}
+
+    def get_path(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256[0:2], sha256)
+
+    def get(self, source_reference: str) -> Optional[Dict[str, str]]:
+        """Index entry of a source reference if its file is in the store"""
+        entry = self.index.get(source_reference)
+        if entry and os.path.exists(self.get_path(entry["sha256"])):
+            return entry
+        return None
+
+    def _add(self, source_reference: str, file_name: str, source: str, copy: bool) -> str:
+        """Hashes a file (streamed) and moves or copies it into the store"""
+        sha256 = hashlib.sha256()
+        with open(source, "rb") as file:
+            for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+                sha256.update(chunk)
+        digest = sha256.hexdigest()
+
+        path = self.get_path(digest)
+        if os.path.exists(path):
+            logging.debug(f"Evidence {source_reference} has the same content as a stored evidence ({digest})")
+            if not copy:
+                os.remove(source)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if copy:
+                shutil.copyfile(source, path)
+            else:
+                os.replace(source, path)
+
+        self.index[source_reference] = {"source_reference": source_reference, "sha256": digest, "file_name": file_name}
+        return digest
+
+    def add_file(self, source_reference: str, file_name: str, file_path: str) -> str:
+        """Adds an existing file (e.g. downloaded before the store existed)"""
+        return self._add(source_reference, file_name, file_path, copy=True)
+
+    def download(self, source_reference: str, file_name: str, url: str) -> str:
+        """Downloads a file into the store (written to a temporary file, hashed, then moved into the store)"""
+        import urllib.request
+
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=self.root, suffix=".part")
+        try:
+            with os.fdopen(file_descriptor, "wb") as file, urllib.request.urlopen(url) as response:
+                shutil.copyfileobj(response, file, CHUNK_SIZE)
+            os.chmod(temporary_path, 0o644)
+            return self._add(source_reference, file_name, temporary_path, copy=False)
+        finally:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+
+    def link(self, sha256: str, file_path: str) -> None:
+        """Makes file_path a hardlink to a stored file (a copy if hardlinks are not supported)"""
+        path = self.get_path(sha256)
+        if os.path.exists(file_path):
+            if os.path.samefile(path, file_path):
+                return
+            os.remove(file_path)
+        try:
+            os.link(path, file_path)
+        except OSError:
+            shutil.copyfile(path, file_path)
+
+    def save(self) -> None:
+        save_dict_to_csv(list(self.index.values()), INDEX_NAME, False)
@@ -0,0 +1,109 @@
+import hashlib
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+SEMANTIC_FIELDS = ["JournalCode", "EcritureDate", "CompteNum", "CompAuxNum", "PieceDate", "EcritureLib", "Debit", "Credit"]
+"""FEC fields compared by the diff (numbering fields like EcritureNum, EcritureLet, DateLet are ignored)"""
+
+FecRows = Callable[[], Iterable[Dict[str, str]]]
+"""Returns a new iterator on the FEC lines (as dict) each time it is called"""
+
+
+class FecOperation(NamedTuple):
+    """Lines of a FEC file sharing the same EcritureNum"""
+
+    num: str
+    date: str
+    label: str
+    lines: Tuple[Tuple[str, ...], ...]
+    """Semantic fields of each line, sorted"""
+
+
+class FecDiff(NamedTuple):
+    added: List[FecOperation]
+    removed: List[FecOperation]
+    modified: List[Tuple[FecOperation, FecOperation]]
+    """(old, new) operations with the same journal, date and label but different lines"""
+
+    unchanged: int
+
+
+def _iter_operations(rows: Iterable[Dict[str, str]], fields: List[str]) -> Iterator[FecOperation]:
+    """Groups consecutive lines with the same EcritureNum into operations"""
+    num = None
+    lines: List[Tuple[str, ...]] = []
+    date = label = ""
+    for row in rows:
+        if row["EcritureNum"] != num:
+            if lines:
+                yield FecOperation(num or "", date, label, tuple(sorted(lines)))
+            num, date, label, lines = row["EcritureNum"], row["EcritureDate"], row["EcritureLib"], []
+        lines.append(tuple(row.get(field) or "" for field in fields))
+    if lines:
+        yield FecOperation(num or "", date, label, tuple(sorted(lines)))
+
+
+def _digest(operation: FecOperation) -> bytes:
+    return hashlib.blake2b("\n".join("\t".join(line) for line in operation.lines).encode(), digest_size=16).digest()
+
+
+def _identity(operation: FecOperation) -> Tuple[str, str, str]:
+    """What must be equal for two different operations to be reported as a modification"""
+    return operation.lines[0][0], operation.date, operation.label
+
+
+def diff_fec(old_rows: FecRows, new_rows: FecRows, piece_ref: bool = False) -> FecDiff:
+    """Compares two FEC files by operation content, whatever their numbering.
+
+    Each operation is hashed from the semantic fields of its lines (and PieceRef with piece_ref, when evidence numbers are stable).
+    The old file is read twice and the new file once : only the hashes of the old operations and the unmatched new operations
+    are kept in memory. Unmatched operations are paired by journal, date and label (in file order) as modifications.
+    """
+    fields = SEMANTIC_FIELDS + (["PieceRef"] if piece_ref else [])
+
+    # Hashes of the old operations
+    old_digests: Dict[bytes, int] = defaultdict(int)
+    for operation in _iter_operations(old_rows(), fields):
+        old_digests[_digest(operation)] += 1
+
+    # New operations not found in the old file
+    unchanged = 0
+    added: List[FecOperation] = []
+    for operation in _iter_operations(new_rows(), fields):
+        digest = _digest(operation)
+        if old_digests.get(digest, 0) > 0:
+            old_digests[digest] -= 1
+            unchanged += 1
+        else:
+            added.append(operation)
+
+    # Old operations not found in the new file
+    removed: List[FecOperation] = []
+    remaining: Set[bytes] = {digest for digest, count in old_digests.items() if count > 0}
+    if remaining:
+        for operation in _iter_operations(old_rows(), fields):
+            digest = _digest(operation)
+            if digest in remaining:
+                removed.append(operation)
+                old_digests[digest] -= 1
+                if old_digests[digest] == 0:
+                    remaining.discard(digest)
+
+    # Pairs removed and added operations
+    removed_by_identity: Dict[Tuple[str, str, str], List[FecOperation]] = defaultdict(list)
+    for operation in removed:
+        removed_by_identity[_identity(operation)].append(operation)
+
+    modified: List[Tuple[FecOperation, FecOperation]] = []
+    paired: Set[int] = set()
+    still_added: List[FecOperation] = []
+    for operation in added:
+        candidates: Optional[List[FecOperation]] = removed_by_identity.get(_identity(operation))
+        if candidates:
+            old_operation = candidates.pop(0)
+            paired.add(id(old_operation))
+            modified.append((old_operation, operation))
+        else:
+            still_added.append(operation)
+
+    return FecDiff(still_added, [o for o in removed if id(o) not in paired], modified, unchanged)
@@ -0,0 +1,86 @@
+import logging
+from typing import Dict, List, Optional, Tuple
+from ..models.fec_record import FecRecord
+
+
+def validate_fec(fec_records: List[FecRecord], start_date: str, end_date: str,
+                 lettrage_index: Optional[Dict[Tuple[str, str], List[FecRecord]]] = None) -> None:
+    """Controle FEC information with some basic validation rules
+
+    The lettrage index (FEC records per account and lettrage code) is built from the records if not provided
+    """
+
+    # Group FEC line per accouting operation
+    # (FEC dates are YYYYMMDD strings, they are compared as text to avoid timezone conversions)
+    fec_dict: Dict[str, List[FecRecord]] = {}
+    when_mem = None
+    valid_when_mem = None
+    carry_forward = 0
+    fiscal_period_start = start_date.replace("-", "")
+    fiscal_period_end = end_date.replace("-", "")
+    for fec in fec_records:
+        when = fec.EcritureDate
+        if when_mem and when < when_mem:
+            logging.error(f"Record {fec}, accouting operation date breaks chronologic order")
+        when_mem = when
+
+        valid_when = fec.ValidDate
+        if valid_when_mem and valid_when < valid_when_mem:
+            logging.error(f"Record {fec}, the validation date {fec} breaks chronologic order")
+        if valid_when < when_mem:
+            logging.error(f"Record {fec}, the validation date is before tje accouting operation date")
+        valid_when_mem = valid_when
+
+        if when < fiscal_period_start or when > fiscal_period_end:
+            logging.error(f"Record {fec}, date outside fiscal period")
+
+        if valid_when < fiscal_period_start or valid_when > fiscal_period_end:
+            logging.error(f"Record {fec}, valid date outside fiscal period")
+
+        reconciliation_when = fec.DateLet if fec.DateLet else None
+        if reconciliation_when and (reconciliation_when < fiscal_period_start or reconciliation_when > fiscal_period_end):
+            logging.error(f"Record {fec}, reconciliation date outside fiscal period")
+
+        if fec.getCreditAsCent() != 0 and fec.getDebitAsCent() != 0:
+            logging.error(f"Record {fec} has credit and also debit amount defined")
+
+        if fec.getCreditAsCent() == 0 and fec.getDebitAsCent() == 0:
+            logging.error(f"Record {fec} has zero credit and debit")
+
+        if fec.JournalCode == "AN":
+            carry_forward += fec.getCreditAsCent() - fec.getDebitAsCent()
+
+        if fec.EcritureNum in fec_dict:
+            fec_dict[fec.EcritureNum].append(fec)
+        else:
+            fec_dict[fec.EcritureNum] = [fec]
+
+        # Check if account should be reconciliated
+        if any(fec.CompteNum.startswith(prefix) for prefix in ["411", "401"]):
+            if not fec.EcritureLet or fec.EcritureLet.strip() == "":
+                logging.warning(f"Record {fec.EcritureNum} ({fec.EcritureLib}) on account {fec.CompteNum} is not reconciliated")
+
+    # Reconciliation balance (lettrage codes are allocated per account)
+    if lettrage_index is None:
+        lettrage_index = {}
+        for fec in fec_records:
+            if fec.EcritureLet:
+                lettrage_index.setdefault((fec.CompteNum, fec.EcritureLet), []).append(fec)
+
+    for (compte_num, reconcialiation), lettered_records in lettrage_index.items():
+        amount = sum([fec.getCreditAsCent() - fec.getDebitAsCent() for fec in lettered_records])
+        if amount != 0:
+            logging.error(f"Reconcialiation {reconcialiation} on account {compte_num} is not balanced : {amount}")
+
+    if carry_forward != 0:
+        logging.error(f"Unbalanced carry forward balance : {carry_forward}")
+
+    # Check balance per operation
+    for num, fec_list in fec_dict.items():
+        if sum([fec.getCreditAsCent() for fec in fec_list]) != sum([fec.getDebitAsCent() for fec in fec_list]):
+            logging.error(f"Operation {num} is not balanced")
+
+    # Check for PR journal operations (Prévisionnel annuel)
+    pr_ops = [fec.getCreditAsCent() - fec.getDebitAsCent() for fec in fec_records if fec.JournalCode == "PR"]
+    if len(pr_ops) > 0:
+        logging.warning(f"Final FEC contains {len(pr_ops)} operations in 'PR' (Prévisionnel) journal.")
@@ -1,7 +1,8 @@
 import csv
 import logging
 import os
-from typing import Any, Dict, List
+import pickle
+from typing import Any, Dict, Iterator, List
 
 
 DELIMITER = "\t"
@@ -22,12 +23,14 @@ def save_dict_to_csv(data: List[Dict[str, Any]], name: str, escape: bool = True)
         logging.warning(f"{file_path} can't be successfully saved, no content")
         return
 
-    quoting_mode = csv.QUOTE_MINIMAL if escape else csv.QUOTE_NONE
-    with open(file_path, "w", newline="") as csvFile:
+    # Written to a temporary file then renamed, readers never see a partially written file
+    with open(f"{file_path}.tmp", "w", newline="") as csvFile:
         keys = data[0].keys()
-        csvwriter = csv.DictWriter(csvFile, keys, delimiter=DELIMITER, quotechar=QUOTECHAR, quoting=quoting_mode, extrasaction="ignore")
+        csvwriter = csv.DictWriter(csvFile, keys, delimiter=DELIMITER, quotechar=QUOTECHAR,
+                                   quoting=csv.QUOTE_MINIMAL if escape else csv.QUOTE_NONE, extrasaction="ignore")
         csvwriter.writeheader()
         csvwriter.writerows(data)
+    os.replace(f"{file_path}.tmp", file_path)
 
     logging.info(f"{file_path} has been successfully saved ({count} line{'s' if count > 1 else ''})")
 
@@ -41,9 +44,8 @@ def read_dict_from_csv(name: str, escape: bool = True) -> List[Dict[str, Any]]:
     if "/" not in name:
         file_path = f"./export/{name.replace('/', '').replace('-', '')}.txt"
     if os.path.exists(file_path):
-        quoting_mode = csv.QUOTE_MINIMAL if escape else csv.QUOTE_NONE
         with open(file_path, "r", newline="") as csvFile:
-            csvreader = csv.DictReader(csvFile, delimiter=DELIMITER, quotechar=QUOTECHAR, quoting=quoting_mode)
+            csvreader = csv.DictReader(csvFile, delimiter=DELIMITER, quotechar=QUOTECHAR, quoting=csv.QUOTE_MINIMAL if escape else csv.QUOTE_NONE)
             for row in csvreader:
                 data.append(row)
 
@@ -53,3 +55,46 @@ def read_dict_from_csv(name: str, escape: bool = True) -> List[Dict[str, Any]]:
         logging.info(f"{file_path} does not exists, starting with an empty database")
 
     return data
+
+
+def iter_dict_from_csv(name: str, escape: bool = True) -> Iterator[Dict[str, Any]]:
+    """
+    Reads python dict values from a CSV file line by line (same file naming as read_dict_from_csv)
+    """
+    file_path = name
+    if "/" not in name:
+        file_path = f"./export/{name.replace('/', '').replace('-', '')}.txt"
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"{file_path} does not exists")
+
+    with open(file_path, "r", newline="") as csvFile:
+        yield from csv.DictReader(csvFile, delimiter=DELIMITER, quotechar=QUOTECHAR, quoting=csv.QUOTE_MINIMAL if escape else csv.QUOTE_NONE)
+
+
+def save_object_to_file(data: Any, name: str) -> None:
+    """
+    Saves a python object (pickle format) in the export subfolder
+    """
+    if not os.path.exists("./export/"):
+        os.makedirs("./export/")
+
+    file_path = f"./export/{name.replace('/', '').replace('-','')}.pickle"
+    with open(file_path, "wb") as file:
+        pickle.dump(data, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    logging.info(f"{file_path} has been successfully saved")
+
+
+def read_object_from_file(name: str) -> Any:
+    """
+    Reads a python object saved with save_object_to_file from the export subfolder
+    """
+    file_path = f"./export/{name.replace('/', '').replace('-','')}.pickle"
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"{file_path} does not exists, please run the sync command first")
+
+    with open(file_path, "rb") as file:
+        data = pickle.load(file)
+
+    logging.info(f"{file_path} has been successfully loaded")
+    return data
@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta
+from typing import Any, List, Tuple
+from ..models.qonto_snapshot import QontoSnapshot
+from .date_utils import conv_date_from_utc_to_local
+
+FiscalPeriod = Tuple[str, str]
+"""Start and end dates (YYYY-MM-DD) of a fiscal year"""
+
+
+def get_fiscal_periods(first_start_date: str, start_date: str, end_date: str) -> List[FiscalPeriod]:
+    """Consecutive fiscal years from first_start_date until the accounting period (start_date, end_date), in chronological order.
+
+    Fiscal years before the accounting period last 12 months, except the first one which starts at first_start_date.
+    """
+    first_start = datetime.strptime(first_start_date, "%Y-%m-%d")
+    start = datetime.strptime(start_date, "%Y-%m-%d")
+    if first_start > start:
+        raise ValueError(f"First fiscal year start date {first_start_date} is after the accounting period start date {start_date}")
+
+    periods = [(start_date, end_date)]
+    while start > first_start:
+        end = start - timedelta(days=1)
+        start = max(first_start, start.replace(year=start.year - 1, day=28 if (start.month, start.day) == (2, 29) else start.day))
+        periods.insert(0, (start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")))
+    return periods
+
+
+def split_snapshot(snapshot: QontoSnapshot, periods: List[FiscalPeriod]) -> List[QontoSnapshot]:
+    """Partitions Qonto data retrieved for several fiscal years into one snapshot per fiscal year (same bounds as the Qonto client)"""
+    bounds = [(conv_date_from_utc_to_local(start), conv_date_from_utc_to_local(end) + timedelta(hours=23, minutes=59)) for start, end in periods]
+
+    def partition(items: List[Any]) -> List[List[Any]]:
+        parts: List[List[Any]] = [[] for _ in periods]
+        for item in items:
+            for index, (start, end) in enumerate(bounds):
+                if start <= item.when <= end:
+                    parts[index].append(item)
+                    break
+        return parts
+
+    return [QontoSnapshot(*parts) for parts in zip(partition(snapshot.client_invoices), partition(snapshot.client_credit_notes),
+                                                   partition(snapshot.supplier_invoices), partition(snapshot.transactions))]
@@ -1,5 +1,6 @@
 from typing import Dict
 from ..models.journal import Journal
+from .accounting_config import load_accounting_config
 
 
 class JournalDB:
@@ -8,19 +9,9 @@ class JournalDB:
 
     def __init__(self) -> None:
         # Load Journal labels from accounting configuration
-        with open("config/accounting.cfg", "r") as file:
-            config_text = file.read()
-
-        journal_section = False
-        for line in config_text.split("\n"):
-            line = line.strip()
-            if not line or "**" in line:
-                continue
-            if line[0:2] == "* ":
-                journal_section = "Journal" in line
-            elif journal_section:
-                parts = line.split("\t")
-                self.journals[parts[0]] = Journal(parts[0], "".join(parts[1:]))
+        self.journals = {}
+        for code, label in load_accounting_config().journals:
+            self.journals[code] = Journal(code, label)
 
     def get_by_code(self, code: str) -> Journal:
         if code in self.journals:
@@ -0,0 +1,15 @@
+import json
+from typing import Any, Callable
+
+
+def _get_loads() -> Callable[[bytes], Any]:
+    """orjson decoder when it is installed (optional dependency, several times faster), stdlib decoder otherwise"""
+    try:
+        import orjson
+        return orjson.loads
+    except ImportError:
+        return json.loads
+
+
+loads_bytes = _get_loads()
+"""Decodes a JSON document straight from the bytes of a response (UTF-8, no intermediate str with orjson)"""
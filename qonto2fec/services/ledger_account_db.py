@@ -2,7 +2,8 @@ import logging
 from typing import List, Optional
 
 from ..models.ledger_account import LedgerAccount
-from .file_utils import read_dict_from_csv, save_dict_to_csv
+from .accounting_config import load_accounting_config, load_ledger_accounts
+from .file_utils import save_dict_to_csv
 
 
 class LedgerAccountDB:
@@ -11,9 +12,15 @@ class LedgerAccountDB:
     accounts: List[LedgerAccount]
     db_name: str
 
-    def __init__(self, db_name: str) -> None:
-        db_path = f"./config/{db_name.replace('/', '').replace('-', '')}.txt"
-        self.accounts = [LedgerAccount(**a) for a in read_dict_from_csv(db_path)]
+    def __init__(self, db_name: str, accounts: Optional[List[LedgerAccount]] = None) -> None:
+        """accounts : ledger accounts to start from instead of the configuration file (e.g. accounts of the previous fiscal year)"""
+        if accounts is not None:
+            self.accounts = [LedgerAccount(a.code, a.name, "|".join(a.thirdparty_names_or_quonto_categories)) for a in accounts]
+            logging.info(f"{len(self.accounts)} ledger accounts of the previous fiscal year loaded")
+        else:
+            db_path = f"./config/{db_name.replace('/', '').replace('-', '')}.txt"
+            self.accounts = [LedgerAccount(code, name, names) for code, name, names in load_ledger_accounts(db_path)]
+            logging.info(f"{db_path} {len(self.accounts)} ledger accounts loaded")
         self.loadDefaultAccounts()
 
         self.db_name = db_name
@@ -102,30 +109,13 @@ class LedgerAccountDB:
 
     def loadDefaultAccounts(self) -> None:
         """Adds or update the missing account defined in the accouting.cfg file"""
-        with open("config/accounting.cfg", "r") as file:
-            config_text = file.read()
-
-        account_section = False
-        for line in config_text.split("\n"):
-            line = line.strip()
-            if not line or "**" in line:
-                continue
-            if line[0:2] == "* ":
-                account_section = "Account" in line
-            elif account_section:
-                parts = [part for part in line.split("\t") if part.strip() != ""]
-                if len(parts) == 2:
-                    account = LedgerAccount(parts[0], parts[1])
-                elif len(parts) == 3:
-                    account = LedgerAccount(parts[0], parts[1], parts[2])
-                else:
-                    ValueError(f"Incorrect line in accounting_plan.cfg file : {line}")
-
-                existing_account = self.get_by_code(account.code)
-                if not existing_account:
-                    self._add(account)
-                else:
-                    existing_account.name = account.name
+        for code, name, names in load_accounting_config().accounts:
+            account = LedgerAccount(code, name, names)
+            existing_account = self.get_by_code(account.code)
+            if not existing_account:
+                self._add(account)
+            else:
+                existing_account.name = account.name
 
     def save(self) -> None:
         save_dict_to_csv([a._asdict() for a in self.accounts], self.db_name, False)
@@ -0,0 +1,93 @@
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Tuple
+from .balance_accumulator import BalanceAccumulator
+
+
+class LedgerQuery:
+    """Balance queries on any date range, answered from per-account cumulative sums indexed by EcritureDate.
+
+    Each account has its sorted movement dates and the running total (credit - debit, in cents) at each date,
+    so that a balance at a date is a binary search (O(log n) per account).
+    Dates are YYYYMMDD or YYYY-MM-DD strings, bounds are included.
+
+    The index follows the balances it is built from : a FEC record added at or after the last indexed date
+    of its account is appended, an earlier one only shifts the cumulative sums of its account after its date.
+    """
+
+    dates: Dict[Tuple[str, str], List[str]]
+    """Sorted movement dates (YYYYMMDD) per account (CompteNum, CompteLib)"""
+
+    cumulative: Dict[Tuple[str, str], List[int]]
+    """Cumulative balance per account at each movement date"""
+
+    version: int
+    """Version of the balances indexed"""
+
+    def __init__(self, balances: BalanceAccumulator) -> None:
+        self.dates = {}
+        self.cumulative = {}
+        self.version = balances.version
+        for account, account_days in balances.days.items():
+            dates = sorted(account_days)
+            cumulative = []
+            total = 0
+            for day in dates:
+                total += account_days[day]
+                cumulative.append(total)
+            self.dates[account] = dates
+            self.cumulative[account] = cumulative
+        balances.listeners.append(self.add)
+
+    def add(self, account: Tuple[str, str], day: str, change: int) -> None:
+        """Indexes the movement of a FEC record added to the balances"""
+        self.version += 1
+        dates = self.dates.setdefault(account, [])
+        cumulative = self.cumulative.setdefault(account, [])
+        if not dates or day > dates[-1]:
+            dates.append(day)
+            cumulative.append((cumulative[-1] if cumulative else 0) + change)
+        elif day == dates[-1]:
+            cumulative[-1] += change
+        else:
+            # Out of order : the cumulative sums from this date are shifted
+            i = bisect_left(dates, day)
+            if dates[i] != day:
+                dates.insert(i, day)
+                cumulative.insert(i, cumulative[i - 1] if i > 0 else 0)
+            for j in range(i, len(cumulative)):
+                cumulative[j] += change
+
+    @staticmethod
+    def _date(date: str) -> str:
+        return date.replace("-", "")
+
+    def _balance_until(self, account: Tuple[str, str], date: str, include_date: bool) -> int:
+        dates = self.dates[account]
+        i = bisect_right(dates, date) if include_date else bisect_left(dates, date)
+        return self.cumulative[account][i - 1] if i > 0 else 0
+
+    def _accounts(self, compte_num_prefix: str) -> List[Tuple[str, str]]:
+        return [account for account in self.dates if account[0].startswith(compte_num_prefix)]
+
+    def get_balance(self, compte_num_prefix: str, as_of: str) -> int:
+        """Balance at the end of a date of all the accounts starting with a prefix"""
+        as_of = LedgerQuery._date(as_of)
+        return sum([self._balance_until(account, as_of, True) for account in self._accounts(compte_num_prefix)])
+
+    def get_movement(self, compte_num_prefix: str, start_date: Optional[str], end_date: Optional[str]) -> int:
+        """Movements between two dates of all the accounts starting with a prefix"""
+        return sum([self._get_account_movement(account, start_date, end_date) for account in self._accounts(compte_num_prefix)])
+
+    def _get_account_movement(self, account: Tuple[str, str], start_date: Optional[str], end_date: Optional[str]) -> int:
+        end_balance = self._balance_until(account, LedgerQuery._date(end_date), True) if end_date else self.cumulative[account][-1]
+        start_balance = self._balance_until(account, LedgerQuery._date(start_date), False) if start_date else 0
+        return end_balance - start_balance
+
+    def get_trial_balance(self, start_date: Optional[str] = None, end_date: Optional[str] = None) -> List[Tuple[str, str, int]]:
+        """Movements of each account (CompteNum, CompteLib, balance) between two dates (all dates if not defined)"""
+        trial_balance = []
+        for account in sorted(self.dates):
+            movement = self._get_account_movement(account, start_date, end_date)
+            if movement != 0:
+                trial_balance.append((account[0], account[1], movement))
+        return trial_balance
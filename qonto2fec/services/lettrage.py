@@ -0,0 +1,65 @@
+from typing import Dict, List, Tuple
+from ..models.fec_record import FecRecord
+
+
+MIN_CODE_LENGTH = 3
+"""Lettrage codes have at least 3 letters (AAA, AAB, ..., ZZZ, AAAA, ...)"""
+
+
+class LettrageAllocator:
+    """Allocates lettrage (reconciliation) codes and indexes the FEC records sharing a code.
+
+    Codes are allocated per account (FEC CompteNum) : each account has its own counter,
+    and codes get longer when the 3 letters codes of an account are exhausted.
+    """
+
+    counters: Dict[str, int]
+    """Next code number per account (CompteNum)"""
+
+    index: Dict[Tuple[str, str], List[FecRecord]]
+    """FEC records per account and lettrage code"""
+
+    def __init__(self) -> None:
+        self.counters = {}
+        self.index = {}
+
+    @staticmethod
+    def code(number: int) -> str:
+        """Converts a code number to letters (0 is AAA, 17575 is ZZZ, 17576 is AAAA)"""
+        width = MIN_CODE_LENGTH
+        while number >= 26 ** width:
+            number -= 26 ** width
+            width += 1
+
+        letters = []
+        for _ in range(width):
+            letters.append(chr(number % 26 + ord("A")))
+            number //= 26
+        return "".join(reversed(letters))
+
+    def allocate(self, compte_num: str) -> str:
+        """Returns a new lettrage code for an account"""
+        number = self.counters.get(compte_num, 0)
+        self.counters[compte_num] = number + 1
+        return LettrageAllocator.code(number)
+
+    def attach(self, fec_record: FecRecord) -> None:
+        """Indexes a lettered FEC record"""
+        if not fec_record.EcritureLet:
+            raise ValueError(f"FEC record without lettrage code : {fec_record}")
+
+        key = (fec_record.CompteNum, fec_record.EcritureLet)
+        if key in self.index:
+            self.index[key].append(fec_record)
+        else:
+            self.index[key] = [fec_record]
+
+    def detach(self, fec_record: FecRecord) -> None:
+        """Removes a FEC record from the index (before changing its lettrage code)"""
+        records = self.index.get((fec_record.CompteNum, fec_record.EcritureLet or ""), [])
+        if fec_record in records:
+            records.remove(fec_record)
+
+    def get_records(self, compte_num: str, code: str) -> List[FecRecord]:
+        """Returns the FEC records lettered with a code on an account"""
+        return self.index.get((compte_num, code), [])
@@ -1,129 +1,272 @@
+import io
 import logging
 import re
 from datetime import datetime
-from typing import Dict, List, Optional
+from functools import lru_cache
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
 from ..models.misc_transaction import MiscellaneousTransaction, MiscellaneousTransactionEntry
+from .config_cache import load_cached
 from .journal_db import JournalDB
 from .ledger_account_db import LedgerAccountDB
 from .date_utils import conv_date_from_utc_to_local
 
 
+class ParsedMiscellaneousEntry(NamedTuple):
+    """Operation line of the OPS file, before journal and account resolution"""
+
+    linenum: int
+    parts: Tuple[str, ...]
+    journal_code: str
+    account_code: str
+    debit: int
+    credit: int
+
+
+class ParsedMiscellaneousTransaction(NamedTuple):
+    """Operation of the OPS file, before journal and account resolution"""
+
+    EcritureDate: datetime
+    EcritureLib: str
+    PieceRef: str
+    PieceDate: datetime
+    ThirdPartyName: Optional[str]
+    Entries: Tuple[ParsedMiscellaneousEntry, ...]
+
+
+class ParsedOpsFile(NamedTuple):
+    """Operations of the OPS file and errors found while parsing it, before journal and account resolution"""
+
+    transactions: Tuple[ParsedMiscellaneousTransaction, ...]
+    errors: Tuple[str, ...]
+    """Format, date, amount and balance errors (operations with an error are not in transactions)"""
+
+
+AMOUNT_PATTERN = re.compile(r"(-?)(\d+)(?:[,.](\d{1,2}))?")
+"""Amount with at most 2 decimals (comma or dot)"""
+
+
+def parse_cents(amount: str) -> int:
+    """Converts an amount (e.g. 1234,56) to cents without float rounding"""
+    match = AMOUNT_PATTERN.fullmatch(amount.replace(" ", "").replace("\u00a0", ""))
+    if not match:
+        raise ValueError(f"Unexpected amount format : {amount}")
+    sign, units, decimals = match.groups()
+    cents = int(units) * 100 + int((decimals or "0").ljust(2, "0"))
+    return -cents if sign else cents
+
+
+@lru_cache(maxsize=4096)
+def parse_ops_date(date: str) -> datetime:
+    """Parses a DD/MM/YYYY date (the same dates are repeated on the header lines)"""
+    return datetime.strptime(date, "%d/%m/%Y")
+
+
+class _OpsFileParser:
+    """State of the single-pass parsing of an OPS file (see parse_misc_transactions)"""
+
+    transactions: List[ParsedMiscellaneousTransaction]
+    errors: List[str]
+    current_transaction: Optional[ParsedMiscellaneousTransaction] = None
+    header_lines: int = 0
+    """Header lines read for the current transaction (label, EcritureDate, then PieceRef and PieceDate)"""
+
+    header_linenum: int = 0
+    ecriture_lib: str = ""
+    ecriture_date: Optional[datetime] = None
+    entries: List[ParsedMiscellaneousEntry]
+    valid: bool = True
+    """False when an error has been found in the current transaction (not saved)"""
+
+    def __init__(self) -> None:
+        self.transactions = []
+        self.errors = []
+        self.entries = []
+
+    def _error(self, message: str) -> None:
+        self.errors.append(message)
+        self.valid = False
+
+    def close_transaction(self) -> None:
+        """Saves the current transaction if its debits and credits are balanced"""
+        if self.current_transaction and self.entries and self.valid:  # Ignore transactions without operations
+            debit = sum(entry.debit for entry in self.entries)
+            credit = sum(entry.credit for entry in self.entries)
+            if debit != credit:
+                self.errors.append(f"Operation {self.current_transaction.PieceRef} at line {self.header_linenum} is not balanced : "
+                                   f"debit {debit / 100:.2f}, credit {credit / 100:.2f}")
+            else:
+                self.transactions.append(self.current_transaction._replace(Entries=tuple(self.entries)))
+
+    def parse_header_line(self, linenum: int, line: str) -> None:
+        if self.header_lines == 3:
+            # Save the previous transaction
+            self.close_transaction()
+            self.current_transaction = None
+            self.header_lines = 0
+            self.ecriture_date = None
+            self.entries = []  # Reset operations for the new transaction
+            self.valid = True
+
+        self.header_lines += 1
+        parts = [part.strip() for part in line.replace("==", "").strip().split("\t") if part.strip()]
+
+        if self.header_lines == 1:  # First line: transaction label
+            self.header_linenum = linenum
+            self.ecriture_lib = parts[0] if len(parts) == 1 else ""
+            if not self.ecriture_lib:
+                self._error(f"Unexpected content at line {linenum}, missing EcritureLib : {parts}")
+
+        elif self.header_lines == 2:  # Second line: EcritureDate
+            try:
+                self.ecriture_date = parse_ops_date(parts[0]) if len(parts) == 1 else None
+            except ValueError:
+                self.ecriture_date = None
+            if not self.ecriture_date:
+                self._error(f"Unexpected date format at line {linenum} : {line}")
+
+        else:  # Third line: PieceRef, PieceDate, optional third party name
+            self._parse_piece_line(linenum, parts)
+
+    def _parse_piece_line(self, linenum: int, parts: List[str]) -> None:
+        if not 2 <= len(parts) <= 3:
+            self._error(f"Unexpected content at line {linenum} : {parts}")
+            return
+        try:
+            piece_date = parse_ops_date(parts[1])
+        except ValueError:
+            self._error(f"Unexpected date format at line {linenum} : {parts}")
+            return
+        if self.valid and self.ecriture_date:
+            self.current_transaction = ParsedMiscellaneousTransaction(
+                EcritureDate=self.ecriture_date,
+                EcritureLib=self.ecriture_lib,
+                PieceRef=parts[0],
+                PieceDate=piece_date,
+                ThirdPartyName=parts[2] if len(parts) == 3 else None,
+                Entries=()
+            )
+
+    def parse_entry_line(self, linenum: int, line: str) -> None:
+        parts = line.split()
+        if self.header_lines != 3:
+            self._error(f"Unexpected operation at line {linenum}, missing transaction header : {parts}")
+            return
+        if len(parts) != 4:
+            self._error(f"Unexpected content at line {linenum} : {parts}")
+            return
+        try:
+            debit = parse_cents(parts[2])
+            credit = parse_cents(parts[3])
+        except ValueError:
+            self._error(f"Unexpected amount format at line {linenum} : {parts}")
+            return
+
+        self.entries.append(ParsedMiscellaneousEntry(
+            linenum=linenum,
+            parts=tuple(parts),
+            journal_code=parts[0],
+            account_code=parts[1],
+            debit=debit,
+            credit=credit,
+        ))
+
+
+def parse_misc_transactions(data_text: str) -> ParsedOpsFile:
+    """Parses the raw text data of an OPS file (no database lookup, the result can be cached)
+
+    The file is read line by line in a single pass. All the errors (format, dates, amounts, operations
+    whose debits and credits differ) are collected and returned with the valid operations, to be raised
+    with the journal and account errors (see MiscellaneousTransactionDB).
+    """
+    parser = _OpsFileParser()
+    for linenum, line in enumerate(io.StringIO(data_text), start=1):
+        line = line.strip()
+
+        if not line or line.startswith("**"):  # Ignore comments and empty lines
+            continue
+
+        if line.startswith("=="):  # Transaction header
+            parser.parse_header_line(linenum, line)
+        else:  # Operation line
+            parser.parse_entry_line(linenum, line)
+
+    # Save the last transaction
+    parser.close_transaction()
+
+    return ParsedOpsFile(tuple(parser.transactions), tuple(parser.errors))
+
+
 class MiscellaneousTransactionDB:
     """Loads and stores miscellaneous transactions from a data file."""
 
     transactions: Dict[datetime, List[MiscellaneousTransaction]] = {}
+    sorted_transactions: List[MiscellaneousTransaction] = []
+    """All transactions in chronological order (file order for a same date)"""
+
+    position: int = 0
+    """Number of transactions already retrieved (in sorted_transactions)"""
+
     journal_db: JournalDB
     accounts_db: LedgerAccountDB
-    previous_date: datetime | None = None
 
     def __init__(self, filepath: str, journal_db: JournalDB, accounts_db: LedgerAccountDB) -> None:
         """Initialize and load transactions from the given file path."""
 
         self.journal_db = journal_db
         self.accounts_db = accounts_db
+        self.transactions = {}
 
-        with open(filepath.replace('-', ''), "r", encoding="utf-8") as file:
-            data_text = file.read()
+        # All the errors of the file (format, balance, journals and accounts) are raised together
+        parsed_file = load_cached(filepath.replace('-', ''), parse_misc_transactions, "ops")
+        errors = list(parsed_file.errors)
+        for parsed_transaction in parsed_file.transactions:
+            self._resolve_transaction(parsed_transaction, errors)
+        if errors:
+            raise ValueError(f"{len(errors)} error(s) in OPS file :\n" + "\n".join(errors))
 
-        self._parse_data(data_text)
+        self.sorted_transactions = [transaction for date in sorted(self.transactions) for transaction in self.transactions[date]]
+        self.position = 0
         logging.info(f"{filepath} {len(self.transactions)} miscellaneous transactions retrieved")
 
-    def _parse_data(self, data_text: str) -> None:
-        """Parses the raw text data and populates transactions."""
-        lines = data_text.split("\n")
-        current_transaction = None
-        ecriture_lib = None
-        ecriture_date = None
-        third_party_name = None
+    def _resolve_transaction(self, parsed: ParsedMiscellaneousTransaction, errors: List[str]) -> None:
+        """Resolves journals and ledger accounts of a parsed transaction and stores it (errors appended to errors)"""
         entries = []
-
-        for linenum, line in enumerate(lines):
-            line = line.strip()
-            linenum += 1  # enumerate starts at 0
-
-            if not line or line.startswith("**"):  # Ignore comments and empty lines
+        for entry in parsed.Entries:
+            parts = list(entry.parts)
+            try:
+                journal = self.journal_db.get_by_code(entry.journal_code)
+            except ValueError:
+                errors.append(f"Unexpected journal code at line {entry.linenum} : {parts}")
                 continue
 
-            if line.startswith("=="):  # Transaction header
-                if current_transaction:
-                    # Save the previous transaction
-                    self._store_transaction(current_transaction, entries)
-                    current_transaction = None
-                    ecriture_lib = None
-                    ecriture_date = None
-                    third_party_name = None
-                    entries = []  # Reset operations for the new transaction
-
-                line = re.sub('[\t]+', '\t', line.replace("==", ""))
-                parts = line.strip().split("\t")
-
-                if len(parts) == 1 and not ecriture_lib:  # First line: transaction label
-                    ecriture_lib = parts[0].strip()
-
-                elif len(parts) == 1 and ecriture_lib and not ecriture_date:  # Second line: EcritureDate
-                    ecriture_date_txt = parts[0].strip()
-                    try:
-                        ecriture_date = datetime.strptime(ecriture_date_txt, "%d/%m/%Y")
-                        ecriture_date_local = conv_date_from_utc_to_local(ecriture_date)
-                    except Exception as e:
-                        raise ValueError(f"Unexpected date format at line {linenum} : {line}") from e
-
-                else:  # Third line: PieceRef, PieceDate
-                    if 2 <= len(parts) <= 3:
-                        piece_ref = parts[0]
-                        piece_date_txt = parts[1]
-                        third_party_name = parts[2] if len(parts) == 3 else None
-                        try:
-                            piece_date = datetime.strptime(piece_date_txt, "%d/%m/%Y")
-                        except Exception as e:
-                            raise ValueError(f"Unexpected date format at line {linenum} : {parts}") from e
-
-                        if not ecriture_date or not ecriture_lib:
-                            raise ValueError(f"Unexpected content at line {linenum}, missing EcritureLib or EcritureDate : {parts}")
-
-                        current_transaction = MiscellaneousTransaction(
-                            EcritureDate=ecriture_date_local,
-                            EcritureLib=ecriture_lib,
-                            PieceRef=piece_ref,
-                            PieceDate=piece_date,
-                            Entries=[]
-                        )
-                    else:
-                        raise ValueError(f"Unexpected content at line {linenum} : {parts}")
-
-            else:  # Operation line
-                parts = line.split()
-                if len(parts) == 4:
-                    journal = self.journal_db.get_by_code(parts[0])
-                    if not journal:
-                        raise ValueError(f"Unexpected journal code at line {linenum} : {parts}")
-
-                    if not third_party_name or parts[1][0:3] not in ["401", "411"]:
-                        account = self.accounts_db.get_by_code(parts[1])
-                    else:
-                        account = self.accounts_db.get_or_create(parts[1], third_party_name)
-                    if not account:
-                        raise ValueError(f"Unexpected account code at line {linenum} : {parts}")
-
-                    # Validate number format
-                    try:
-                        debit = int(float(parts[2].replace(",", ".")) * 100)
-                        credit = int(float(parts[3].replace(",", ".")) * 100)
-                    except Exception as e:
-                        raise ValueError(f"Unexpected amount format at line {linenum} : {parts}") from e
-
-                    entries.append(MiscellaneousTransactionEntry(
-                        Journal=journal,
-                        Account=account,
-                        Credit=credit,
-                        Debit=debit,
-                    ))
+            try:
+                if not parsed.ThirdPartyName or entry.account_code[0:3] not in ["401", "411"]:
+                    account = self.accounts_db.get_by_code(entry.account_code)
                 else:
-                    raise ValueError(f"Unexpected content at line {linenum} : {parts}")
+                    account = self.accounts_db.get_or_create(entry.account_code, parsed.ThirdPartyName)
+            except ValueError:
+                account = None
+            if not account:
+                errors.append(f"Unexpected account code at line {entry.linenum} : {parts}")
+                continue
 
-        # Save the last transaction
-        if current_transaction:
-            self._store_transaction(current_transaction, entries)
+            entries.append(MiscellaneousTransactionEntry(
+                Journal=journal,
+                Account=account,
+                Credit=entry.credit,
+                Debit=entry.debit,
+            ))
+
+        if len(entries) < len(parsed.Entries):
+            return
+
+        self._store_transaction(MiscellaneousTransaction(
+            EcritureDate=conv_date_from_utc_to_local(parsed.EcritureDate),
+            EcritureLib=parsed.EcritureLib,
+            PieceRef=parsed.PieceRef,
+            PieceDate=parsed.PieceDate,
+            Entries=[]
+        ), entries)
 
     def _store_transaction(self, transaction: MiscellaneousTransaction, entries: List[MiscellaneousTransactionEntry]) -> None:
         """Stores a transaction in the dictionary using EcritureDate as the key."""
@@ -147,12 +290,15 @@ class MiscellaneousTransactionDB:
         """
         Retrieves all non already retrieved transactions until a date (or all remaining if until_date is None)
         """
-
         result = []
-        for transaction_date, transactions in self.transactions.items():
-            if (not self.previous_date or self.previous_date < transaction_date) and (not until_date or transaction_date <= until_date):
-                result.extend(transactions)
-
-        self.previous_date = until_date
-        result.sort(key=lambda transaction: transaction.EcritureDate)
+        while self.position < len(self.sorted_transactions) and (not until_date or self.sorted_transactions[self.position].EcritureDate <= until_date):
+            result.append(self.sorted_transactions[self.position])
+            self.position += 1
         return result
+
+    def stream(self) -> Iterator[MiscellaneousTransaction]:
+        """Yields the non already retrieved transactions in chronological order (each transaction is retrieved once)"""
+        while self.position < len(self.sorted_transactions):
+            transaction = self.sorted_transactions[self.position]
+            self.position += 1
+            yield transaction
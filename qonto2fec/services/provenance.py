@@ -0,0 +1,87 @@
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from .file_utils import read_dict_from_csv, save_dict_to_csv
+
+BANK_TRANSACTION = "bank_transaction"
+"""Qonto bank transaction (source_id is the Qonto transaction_id)"""
+
+INVOICE = "invoice"
+"""Client invoice, credit note or supplier invoice (source_id is the invoice id in its source)"""
+
+MISC_TRANSACTION = "misc_transaction"
+"""Miscellaneous transaction of the OPS file (source_id is its PieceRef)"""
+
+OPENING = "opening"
+"""Opening entries from the previous fiscal year balances"""
+
+CLOSING = "closing"
+"""Entries computed when closing the accounting period (source_id is the computation)"""
+
+
+class Provenance(NamedTuple):
+    """What produced a FEC record"""
+
+    kind: str
+    source: str
+    """System the source object comes from (Qonto, OPS file, ...)"""
+
+    source_id: str
+
+
+class ProvenanceIndex:
+    """Provenance of each FEC record (by line, in FEC order) with reverse lookups by source object and EcritureNum.
+
+    Saved next to the FEC file so that the origin of a line is a lookup, without fetching Qonto data again.
+    """
+
+    provenances: List[Provenance]
+    """Provenance per FEC line (index 0 is line 1)"""
+
+    ecriture_nums: List[str]
+    """EcritureNum per FEC line"""
+
+    lines_by_source: Dict[Tuple[str, str], List[int]]
+    """FEC lines (1-based) per (kind, source_id)"""
+
+    lines_by_ecriture_num: Dict[str, List[int]]
+
+    def __init__(self) -> None:
+        self.provenances = []
+        self.ecriture_nums = []
+        self.lines_by_source = {}
+        self.lines_by_ecriture_num = {}
+
+    def add(self, ecriture_num: str, provenance: Provenance) -> None:
+        """Adds the provenance of the next FEC line"""
+        self.provenances.append(provenance)
+        self.ecriture_nums.append(ecriture_num)
+        line = len(self.provenances)
+        self.lines_by_source.setdefault((provenance.kind, provenance.source_id), []).append(line)
+        self.lines_by_ecriture_num.setdefault(ecriture_num, []).append(line)
+
+    def get_provenance(self, line: int) -> Optional[Provenance]:
+        return self.provenances[line - 1] if 0 < line <= len(self.provenances) else None
+
+    def get_lines(self, kind: str, source_id: str) -> List[int]:
+        """FEC lines produced by a source object"""
+        return self.lines_by_source.get((kind, source_id), [])
+
+    def get_ecriture_lines(self, ecriture_num: str) -> List[int]:
+        return self.lines_by_ecriture_num.get(ecriture_num, [])
+
+    def to_rows(self) -> List[Dict[str, Any]]:
+        return [{"line": line, "EcritureNum": ecriture_num, "kind": provenance.kind, "source": provenance.source, "source_id": provenance.source_id}
+                for line, (ecriture_num, provenance) in enumerate(zip(self.ecriture_nums, self.provenances), start=1)]
+
+    def save(self, name: str) -> None:
+        save_dict_to_csv(self.to_rows(), name, False)
+
+    @staticmethod
+    def load(name: str) -> "ProvenanceIndex":
+        rows = read_dict_from_csv(name, False)
+        if not rows:
+            raise FileNotFoundError(f"No provenance found for {name}, please run the account or sync command first")
+
+        provenance_index = ProvenanceIndex()
+        for row in rows:
+            provenance_index.add(row["EcritureNum"], Provenance(row["kind"], row["source"], row["source_id"]))
+        return provenance_index
@@ -1,19 +1,28 @@
-import json
+import heapq
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from http.client import HTTPSConnection
 from operator import attrgetter
-from typing import Dict, List
-from ..models.financial_transaction import FinancialTransaction
+from typing import Callable, Dict, List, Optional, Tuple
+from ..models.financial_transaction import FinancialTransaction, MAIN_BANK_ACCOUNT
 from ..models.invoice import Invoice, CLIENT_INVOICE, CLIENT_CREDIT, SUPPLIER_INVOICE
+from ..models.qonto_snapshot import QontoSnapshot
 from .date_utils import conv_date_from_utc_to_local
+from .json_utils import loads_bytes
+
+
+def _updated_at_filter(updated_at_from: Optional[datetime]) -> str:
+    """Invoice listing filter on the update date (UTC)"""
+    return f"&filter[updated_at_from]={updated_at_from.strftime('%Y-%m-%dT%H:%M:%S.%fZ')}" if updated_at_from else ""
 
 
 class QontoClient:
     """Quonto API client"""
 
     qonto_iban: str
+    qonto_ibans: List[Tuple[str, str]]
     headers: Dict[str, str]
     conn: HTTPSConnection
 
@@ -21,6 +30,7 @@ class QontoClient:
         qonto_iban = os.environ.get("qonto-api-iban")
         if not qonto_iban:
             raise Exception("qonto-api-iban must be defined")
+        qonto_ibans = QontoClient.parseIbans(qonto_iban)
 
         qonto_key = os.environ.get("qonto-api-key")
         if not qonto_key:
@@ -31,12 +41,88 @@ class QontoClient:
             raise Exception("qonto_slug must be defined")
 
         self.headers = {"authorization": f"{qonto_slug}:{qonto_key}"}
-        self.conn = HTTPSConnection("thirdparty.qonto.com")
-        self.qonto_iban = qonto_iban
+        self.conn = QontoClient._newConnection()
+        self.qonto_iban = qonto_ibans[0][0]
+        self.qonto_ibans = qonto_ibans
+
+    @staticmethod
+    def _newConnection() -> HTTPSConnection:
+        return HTTPSConnection("thirdparty.qonto.com")
+
+    @staticmethod
+    def parseIbans(value: str) -> List[Tuple[str, str]]:
+        """
+        Parses the qonto-api-iban setting : a comma separated list of IBAN or IBAN:ledger account code.
+        The first IBAN is the main bank account (512), the ledger account of the other IBANs is mandatory (e.g. FRxx:512001).
+        """
+        ibans = []
+        for i, item in enumerate(value.split(",")):
+            parts = [part.strip() for part in item.split(":")]
+            if len(parts) == 1 and i == 0:
+                ibans.append((parts[0].replace(" ", "").upper(), MAIN_BANK_ACCOUNT))
+            elif len(parts) == 2 and parts[1][0:3] == "512":
+                ibans.append((parts[0].replace(" ", "").upper(), parts[1]))
+            else:
+                raise Exception(f"qonto-api-iban : invalid value {item}, expected IBAN:512xxx")
+
+        if len({account for _, account in ibans}) != len(ibans):
+            raise Exception("qonto-api-iban : each IBAN must have its own ledger account")
+
+        return ibans
+
+    def getSnapshot(self, start_date: str, end_date: str) -> QontoSnapshot:
+        """
+        Get all the data of an accounting period : client invoices, credit notes, supplier invoices to pay and bank transactions
+
+        The four listings are independent and fetched concurrently (each invoice listing on its own connection),
+        the snapshot is returned when all of them are complete
+        """
+        def fetch_invoices(listing: Callable[[str, str, HTTPSConnection], List[Invoice]]) -> List[Invoice]:
+            conn = QontoClient._newConnection()
+            try:
+                return listing(start_date, end_date, conn)
+            finally:
+                conn.close()
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            client_invoices = executor.submit(fetch_invoices, self.getClientInvoices)
+            client_credit_notes = executor.submit(fetch_invoices, self.getClientCreditNotes)
+            supplier_invoices = executor.submit(fetch_invoices, self.getToPaySupplierInvoices)
+            transactions = executor.submit(self.getTransactions, start_date, end_date)
+            return QontoSnapshot(client_invoices.result(), client_credit_notes.result(), supplier_invoices.result(), transactions.result())
+
+    def getTransactions(self, start_date: str, end_date: str, updated_at_from: Optional[datetime] = None,
+                        declined_ids: Optional[List[str]] = None) -> List[FinancialTransaction]:
+        """
+        Get all account transactions of all IBANs from Qonto Bank between two dates
+
+        Each IBAN is fetched concurrently (one connection per IBAN),
+        and the transactions are merged in chronological order (k-way merge of the sorted lists)
+
+        With updated_at_from (UTC), only the transactions updated since this date are retrieved
+        and the identifiers of the declined ones are added to declined_ids
+        """
+        if len(self.qonto_ibans) == 1:
+            iban, bank_account = self.qonto_ibans[0]
+            return self._getTransactionsForIban(self.conn, iban, bank_account, start_date, end_date, updated_at_from, declined_ids)
+
+        def fetch(iban_account: Tuple[str, str]) -> List[FinancialTransaction]:
+            conn = QontoClient._newConnection()
+            try:
+                return self._getTransactionsForIban(conn, iban_account[0], iban_account[1], start_date, end_date, updated_at_from, declined_ids)
+            finally:
+                conn.close()
+
+        with ThreadPoolExecutor(max_workers=len(self.qonto_ibans)) as executor:
+            transactions_per_iban = list(executor.map(fetch, self.qonto_ibans))
+
+        return list(heapq.merge(*transactions_per_iban, key=attrgetter("when")))
 
-    def getTransactions(self, start_date: str, end_date: str) -> List[FinancialTransaction]:
+    def _getTransactionsForIban(self, conn: HTTPSConnection, iban: str, bank_account: str,
+                                start_date: str, end_date: str, updated_at_from: Optional[datetime] = None,
+                                declined_ids: Optional[List[str]] = None) -> List[FinancialTransaction]:
         """
-        Get all account transactions from Qonto Bank between two dates
+        Get all account transactions of one IBAN from Qonto Bank between two dates
 
         https://api-doc.qonto.com/docs/business-api/2c89e53f7f645-list-transactions
         """
@@ -48,23 +134,26 @@ class QontoClient:
         settled_at_to = ""
         if end_date_t < conv_date_from_utc_to_local(datetime.now()):
             settled_at_to = f"&settled_at_to={end_date_t.strftime('%Y%m%dT%H%M%S.%fZ')}"
+        updated_at = f"&updated_at_from={updated_at_from.strftime('%Y-%m-%dT%H:%M:%S.%fZ')}" if updated_at_from else ""
 
         transactions = []
         next_page = 1
         includes = "includes[]=vat_details&includes[]=labels&includes[]=attachments"
         while next_page is not None:
-            url = f"/v2/transactions?iban={self.qonto_iban}&{includes}&page={next_page}&{settled_at_from}{settled_at_to}"
-            self.conn.request("GET", url, "{}", self.headers)
-            response = self.conn.getresponse()
+            url = f"/v2/transactions?iban={iban}&{includes}&page={next_page}&{settled_at_from}{settled_at_to}{updated_at}"
+            conn.request("GET", url, "{}", self.headers)
+            response = conn.getresponse()
             if response.status != 200:
                 print(response.read())
                 raise Exception(response.status, response.reason)
 
             data = response.read()
-            page = json.loads(data.decode("utf-8"))
+            page = loads_bytes(data)
             next_page = page["meta"]["next_page"]
             for transaction in page["transactions"]:
                 if transaction["status"] == "declined":
+                    if declined_ids is not None:
+                        declined_ids.append(transaction["transaction_id"])
                     continue
 
                 if transaction["status"] != "completed":
@@ -72,7 +161,7 @@ class QontoClient:
 
                 if transaction["status"] == "completed":
                     transaction["settled_at"] = conv_date_from_utc_to_local(transaction["settled_at"])
-                    financial_transaction = FinancialTransaction(transaction)
+                    financial_transaction = FinancialTransaction(transaction, bank_account, dict(self.qonto_ibans))
                     if financial_transaction.when >= start_date_t and financial_transaction.when <= end_date_t:
                         transactions.append(financial_transaction)
                     else:
@@ -82,25 +171,34 @@ class QontoClient:
 
         return transactions
 
-    def getClientInvoices(self, start_date: str, end_date: str) -> List[Invoice]:
+    def getClientInvoices(self, start_date: str, end_date: str, conn: Optional[HTTPSConnection] = None,
+                          updated_at_from: Optional[datetime] = None, removed_ids: Optional[List[str]] = None) -> List[Invoice]:
+        """
+        Get the client invoices issued during a period
+
+        With updated_at_from (UTC), only the invoices updated since this date are retrieved
+        and the identifiers of the ones no longer issued during the period are added to removed_ids
+        """
+        conn = conn or self.conn
         start_date_t = conv_date_from_utc_to_local(start_date)
         end_date_t = conv_date_from_utc_to_local(end_date)
         end_date_t += timedelta(hours=23, minutes=59)
 
         created_at_from = f"filter[created_at_from]={start_date_t.strftime('%Y-%m-%dT%H:%M:%S.%fZ')}"
+        updated_at = _updated_at_filter(updated_at_from)
 
         invoices = []
         next_page = 1
         while next_page is not None:
-            url = f"/v2/client_invoices?{created_at_from}&page={next_page}"
-            self.conn.request("GET", url, "{}", self.headers)
-            response = self.conn.getresponse()
+            url = f"/v2/client_invoices?{created_at_from}{updated_at}&page={next_page}"
+            conn.request("GET", url, "{}", self.headers)
+            response = conn.getresponse()
             if response.status != 200:
                 print(response.read())
                 raise Exception(response.status, response.reason)
 
             data = response.read()
-            raw_invoices = json.loads(data.decode("utf-8"))
+            raw_invoices = loads_bytes(data)
             next_page = raw_invoices["meta"]["next_page"]
 
             for raw_invoice in raw_invoices["client_invoices"]:
@@ -122,31 +220,39 @@ class QontoClient:
                         invoice.associated_credit = raw_invoice["credit_notes_ids"]
 
                     invoices.append(invoice)
+                elif removed_ids is not None:
+                    removed_ids.append(raw_invoice["id"])
 
         invoices = sorted(invoices, key=attrgetter("when"))
 
         return invoices
 
-    def getClientCreditNotes(self, start_date: str, end_date: str) -> List[Invoice]:
+    def getClientCreditNotes(self, start_date: str, end_date: str, conn: Optional[HTTPSConnection] = None,
+                             updated_at_from: Optional[datetime] = None) -> List[Invoice]:
+        """
+        Get the client credit notes issued during a period (only the ones updated since updated_at_from (UTC) if given)
+        """
+        conn = conn or self.conn
         start_date_t = conv_date_from_utc_to_local(start_date)
         end_date_t = conv_date_from_utc_to_local(end_date)
         end_date_t += timedelta(hours=23, minutes=59)
 
         created_at_from = f"filter[created_at_from]={start_date_t.strftime('%Y-%m-%dT%H:%M:%S.%fZ')}"
         created_at_to = f"filter[created_at_to]={end_date_t.strftime('%Y-%m-%dT%H:%M:%S.%fZ')}"
+        updated_at = _updated_at_filter(updated_at_from)
 
         invoices = []
         next_page = 1
         while next_page is not None:
-            url = f"/v2/credit_notes?{created_at_from}&{created_at_to}&page={next_page}"
-            self.conn.request("GET", url, "{}", self.headers)
-            response = self.conn.getresponse()
+            url = f"/v2/credit_notes?{created_at_from}&{created_at_to}{updated_at}&page={next_page}"
+            conn.request("GET", url, "{}", self.headers)
+            response = conn.getresponse()
             if response.status != 200:
                 print(response.read())
                 raise Exception(response.status, response.reason)
 
             data = response.read()
-            raw_invoices = json.loads(data.decode("utf-8"))
+            raw_invoices = loads_bytes(data)
             next_page = raw_invoices["meta"]["next_page"]
 
             for raw_invoice in raw_invoices["credit_notes"]:
@@ -166,39 +272,52 @@ class QontoClient:
 
         return invoices
 
-    def getToPaySupplierInvoices(self, start_date: str, end_date: str) -> List[Invoice]:
+    def getToPaySupplierInvoices(self, start_date: str, end_date: str, conn: Optional[HTTPSConnection] = None,
+                                 updated_at_from: Optional[datetime] = None, removed_ids: Optional[List[str]] = None) -> List[Invoice]:
+        """
+        Get the supplier invoices issued during a period and not paid yet
+
+        With updated_at_from (UTC), only the invoices updated since this date are retrieved
+        and the identifiers of the ones paid, discarded or no longer issued during the period are added to removed_ids
+        """
+        conn = conn or self.conn
         start_date_t = conv_date_from_utc_to_local(start_date)
         end_date_t = conv_date_from_utc_to_local(end_date) + timedelta(hours=23, minutes=59)
+        updated_at = _updated_at_filter(updated_at_from)
 
         invoices = []
         next_page = 1
         while next_page is not None:
-            url = f"/v2/supplier_invoices?page={next_page}"
-            self.conn.request("GET", url, "{}", self.headers)
-            response = self.conn.getresponse()
+            url = f"/v2/supplier_invoices?page={next_page}{updated_at}"
+            conn.request("GET", url, "{}", self.headers)
+            response = conn.getresponse()
             if response.status != 200:
                 print(response.read())
                 raise Exception(response.status, response.reason)
 
             data = response.read()
-            raw_invoices = json.loads(data.decode("utf-8"))
+            raw_invoices = loads_bytes(data)
             next_page = raw_invoices["meta"]["next_page"]
 
             for raw_invoice in raw_invoices["supplier_invoices"]:
-                if raw_invoice["status"] not in ["paid", "discarded"]:
-                    issue_date = conv_date_from_utc_to_local(raw_invoice["issue_date"])
-                    if start_date_t <= issue_date <= end_date_t:
-                        invoices.append(Invoice(
-                            type=SUPPLIER_INVOICE,
-                            source_name="Qonto",
-                            source_id=raw_invoice["id"],
-                            source_attachment_id=raw_invoice["attachment_id"],
-                            when=conv_date_from_utc_to_local(raw_invoice["issue_date"]),
-                            number=raw_invoice["invoice_number"],
-                            total_amount_cents=round(float(raw_invoice["total_amount"]["value"])*100),
-                            amount_vat_cent=0,
-                            thirdparty_name=raw_invoice["supplier_name"]
-                        ))
+                to_pay = raw_invoice["status"] not in ["paid", "discarded"]
+                issue_date = conv_date_from_utc_to_local(raw_invoice["issue_date"]) if to_pay else None
+                if issue_date is None or not start_date_t <= issue_date <= end_date_t:
+                    if removed_ids is not None:
+                        removed_ids.append(raw_invoice["id"])
+                    continue
+
+                invoices.append(Invoice(
+                    type=SUPPLIER_INVOICE,
+                    source_name="Qonto",
+                    source_id=raw_invoice["id"],
+                    source_attachment_id=raw_invoice["attachment_id"],
+                    when=issue_date,
+                    number=raw_invoice["invoice_number"],
+                    total_amount_cents=round(float(raw_invoice["total_amount"]["value"])*100),
+                    amount_vat_cent=0,
+                    thirdparty_name=raw_invoice["supplier_name"]
+                ))
 
         invoices = sorted(invoices, key=attrgetter("when"))
 
@@ -218,7 +337,7 @@ class QontoClient:
             raise Exception(response.status, response.reason)
 
         data = response.read()
-        attachment = json.loads(data.decode("utf-8"))["attachment"]
+        attachment = loads_bytes(data)["attachment"]
         return {
             "url": attachment["url"],
             "file_name": attachment["file_name"]
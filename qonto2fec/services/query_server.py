@@ -0,0 +1,201 @@
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+from ..models.fec_record import FecRecord
+from .balance_accumulator import BalanceAccumulator
+from .ledger_query import LedgerQuery
+
+DEFAULT_PORT = 8642
+DEFAULT_RELOAD_INTERVAL = 2.0
+"""Seconds between two checks of the ledger files"""
+
+
+class LedgerIndex:
+    """FEC records of a run, indexed once for the queries of the HTTP service.
+
+    Amounts are in cents, balances are "credit - debit" amounts (as in BalanceAccumulator).
+    Account filters are account number prefixes.
+    """
+
+    fec_records: List[FecRecord]
+    balances: BalanceAccumulator
+    ledger_query: LedgerQuery
+    by_account: Dict[str, List[FecRecord]]
+    """FEC records per account number (CompteNum), in FEC order"""
+
+    account_numbers: List[str]
+    """Sorted account numbers (prefix search)"""
+
+    by_piece_ref: Dict[str, List[FecRecord]]
+    """FEC records per evidence (PieceRef), in FEC order"""
+
+    def __init__(self, fec_records: List[FecRecord]) -> None:
+        self.fec_records = fec_records
+        self.balances = BalanceAccumulator(fec_records)
+        self.ledger_query = LedgerQuery(self.balances)
+        self.by_account = {}
+        self.by_piece_ref = {}
+        for fec_record in fec_records:
+            self.by_account.setdefault(fec_record.CompteNum, []).append(fec_record)
+            if fec_record.PieceRef:
+                self.by_piece_ref.setdefault(fec_record.PieceRef, []).append(fec_record)
+        self.account_numbers = sorted(self.by_account)
+
+    def _accounts(self, prefix: str) -> List[str]:
+        """Account numbers starting with a prefix"""
+        start = bisect_left(self.account_numbers, prefix)
+        end = bisect_left(self.account_numbers, prefix + "\uffff")
+        return self.account_numbers[start:end]
+
+    def get_trial_balance(self, prefix: str = "", start_date: Optional[str] = None, end_date: Optional[str] = None) -> List[Dict[str, Any]]:
+        return [{"account": num, "label": lib, "balance_cent": amount}
+                for num, lib, amount in self.ledger_query.get_trial_balance(start_date, end_date) if num.startswith(prefix)]
+
+    def get_account_ledger(self, prefix: str, start_date: Optional[str] = None, end_date: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Grand livre : FEC records of the accounts (in FEC order per account) with the running balance"""
+        start = start_date.replace("-", "") if start_date else None
+        end = end_date.replace("-", "") if end_date else None
+        lines = []
+        for compte_num in self._accounts(prefix):
+            balance = 0
+            for fec_record in self.by_account[compte_num]:
+                if end and fec_record.EcritureDate > end:
+                    continue
+                balance += fec_record.getCreditAsCent() - fec_record.getDebitAsCent()
+                if not start or fec_record.EcritureDate >= start:
+                    lines.append(dict(fec_record._asdict(), balance_cent=balance))
+        return lines
+
+    def get_open_items(self, prefix: str = "") -> List[Dict[str, str]]:
+        """Third party records (401, 411 or auxiliary account) not lettered"""
+        return [fec_record._asdict() for fec_record in self.balances.open_items if fec_record.CompteNum.startswith(prefix)]
+
+    def get_evidence_records(self, piece_ref: str) -> List[Dict[str, str]]:
+        return [fec_record._asdict() for fec_record in self.by_piece_ref.get(piece_ref, [])]
+
+    def get_monthly_balance(self, prefix: str = "") -> List[Dict[str, Any]]:
+        """Cumulative balance of each account at the end of each month"""
+        months = sorted(self.balances.month_headers)
+        result = []
+        for (num, lib), movements in sorted(self.balances.months.items()):
+            if not num.startswith(prefix):
+                continue
+            balance = 0
+            cumulative = {}
+            for month in months:
+                balance += movements.get(month, 0)
+                cumulative[month] = balance
+            result.append({"account": num, "label": lib, "balance_cent": cumulative})
+        return result
+
+
+class LedgerServer:
+    """Local HTTP/JSON service answering ledger queries from a LedgerIndex kept in memory.
+
+    The index is built at start and built again in a background thread when one of the ledger files changes,
+    the new index replacing the previous one once complete (queries never see a partially loaded ledger).
+
+    Routes (GET, JSON answers) :
+    - /trial-balance?account=&from=&to=
+    - /ledger?account=&from=&to=
+    - /open-items?account=
+    - /evidence?ref=
+    - /monthly-balance?account=
+    """
+
+    load: Callable[[], List[FecRecord]]
+    paths: List[str]
+    """Files the ledger is loaded from (watched for changes)"""
+
+    index: LedgerIndex
+    file_stats: Tuple[Tuple[int, int], ...]
+
+    def __init__(self, load: Callable[[], List[FecRecord]], paths: List[str]) -> None:
+        self.load = load
+        self.paths = paths
+        self.file_stats = self._stats()
+        self.index = self._build()
+
+    def _stats(self) -> Tuple[Tuple[int, int], ...]:
+        return tuple((os.stat(path).st_mtime_ns, os.stat(path).st_size) if os.path.exists(path) else (0, 0) for path in self.paths)
+
+    def _build(self) -> LedgerIndex:
+        started_at = time.perf_counter()
+        index = LedgerIndex(self.load())
+        logging.info(f"Ledger loaded ({len(index.fec_records)} records) in {time.perf_counter() - started_at:.2f}s")
+        return index
+
+    def reload_if_changed(self) -> bool:
+        """Builds the index again when a ledger file has changed (the file stats are only kept once the index is built,
+           a failed reload is tried again at the next check)"""
+        stats = self._stats()
+        if stats == self.file_stats:
+            return False
+        self.index = self._build()
+        self.file_stats = stats
+        return True
+
+    def _watch(self, interval: float) -> None:
+        while True:
+            time.sleep(interval)
+            try:
+                self.reload_if_changed()
+            except Exception as e:
+                logging.error(f"Ledger reload failed, keeping the previous ledger : {e}")
+
+    def query(self, path: str, parameters: Dict[str, str]) -> Any:
+        index = self.index
+        account = parameters.get("account", "")
+        if path == "/trial-balance":
+            return index.get_trial_balance(account, parameters.get("from"), parameters.get("to"))
+        if path == "/ledger":
+            if not account:
+                raise ValueError("account parameter is required")
+            return index.get_account_ledger(account, parameters.get("from"), parameters.get("to"))
+        if path == "/open-items":
+            return index.get_open_items(account)
+        if path == "/evidence":
+            if "ref" not in parameters:
+                raise ValueError("ref parameter is required")
+            return index.get_evidence_records(parameters["ref"])
+        if path == "/monthly-balance":
+            return index.get_monthly_balance(account)
+        raise LookupError(f"Unknown route {path}")
+
+    def serve(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT, reload_interval: float = DEFAULT_RELOAD_INTERVAL) -> None:
+        ledger_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                url = urlparse(self.path)
+                parameters = {key: values[0] for key, values in parse_qs(url.query).items()}
+                try:
+                    status, body = 200, ledger_server.query(url.path, parameters)
+                except LookupError as e:
+                    status, body = 404, {"error": str(e)}
+                except ValueError as e:
+                    status, body = 400, {"error": str(e)}
+
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                logging.debug(format % args)
+
+        threading.Thread(target=self._watch, args=(reload_interval,), daemon=True).start()
+        httpd = ThreadingHTTPServer((host, port), Handler)
+        logging.info(f"Ledger query service listening on http://{host}:{port}/")
+        try:
+            httpd.serve_forever()
+        finally:
+            httpd.server_close()
@@ -0,0 +1,47 @@
+import logging
+from typing import Dict, List, Optional, Tuple
+
+
+DEFAULT_SEARCH_LIMIT = 100000
+"""Default maximum number of partial sums explored while searching a combination of open items"""
+
+
+def find_amounts_matching_total(amounts: List[int], total: int, search_limit: int = DEFAULT_SEARCH_LIMIT) -> Optional[List[int]]:
+    """
+    Searches a combination of amounts (positive, in cents) whose sum is exactly the total (subset sum).
+
+    Bounded dynamic programming over the reachable partial sums : each partial sum is kept once
+    with a back pointer to rebuild the combination. Amounts are considered in the given order,
+    so the combination found favours the first amounts (oldest open items).
+
+    Returns the indexes of the amounts in the combination,
+    or None if there is no combination or if the search reached the search limit (number of partial sums).
+    """
+    if total <= 0:
+        return None
+
+    # Partial sum -> (previous partial sum, index of the amount added)
+    reachable: Dict[int, Tuple[int, int]] = {0: (0, -1)}
+
+    for index, amount in enumerate(amounts):
+        if amount <= 0 or amount > total:
+            continue
+
+        for partial_sum in list(reachable.keys()):
+            new_sum = partial_sum + amount
+            if new_sum > total or new_sum in reachable:
+                continue
+
+            reachable[new_sum] = (partial_sum, index)
+            if new_sum == total:
+                combination = []
+                while new_sum != 0:
+                    new_sum, amount_index = reachable[new_sum]
+                    combination.append(amount_index)
+                return sorted(combination)
+
+            if len(reachable) > search_limit:
+                logging.warning(f"Reconciliation search limit reached ({search_limit} partial sums) for {len(amounts)} open items")
+                return None
+
+    return None
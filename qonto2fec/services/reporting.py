@@ -0,0 +1,168 @@
+from typing import Any, Dict, List, Optional, Tuple
+from .balance_accumulator import BalanceAccumulator
+from .closing import ClosingResult
+from .fec_diff import FecDiff, FecOperation
+from .vat_ledger import VatLedger
+
+
+def display_cumulative_monthly_balance(balances: BalanceAccumulator, nb_months: int) -> None:
+    """Prints the cumulative balance of each account, month by month, with subtotals per account class"""
+    from tabulate import tabulate
+    from colorama import Fore, Style
+
+    headers = ["Account", "Label"] + list(balances.month_headers)
+    header_index = {h: i for i, h in enumerate(headers)}
+
+    # Init table and do account value computation from monthly movements
+    data = []
+    for account in sorted(balances.months):
+        line: List[Any] = [account[0], account[1]] + ([0.0] * (len(headers) - 2))
+        for month_header, change in balances.months[account].items():
+            for month in range(header_index[month_header], min(nb_months+3, len(line))):
+                line[month] = float(line[month]) + float(change)/100
+        data.append(line)
+
+    # Add subtotals lines
+    last_group = None
+    group_sum: List[float | str] = ["1", ""] + ([0.0] * (len(data[0])-2))
+    group_sum_1_5: List[float | str] = ["1+2+3+4+5", "==="] + ([0.0] * (len(data[0])-2))
+    group_sum_6_7: List[float | str] = ["6+7", "==="] + ([0.0] * (len(data[0])-2))
+    data_with_group: List[Any] = []
+    for line in data:
+        current_group = str(line[0])[0]
+        if current_group != last_group and last_group:
+            # Next group
+            data_with_group.append(["===", "==="] + (["==="] * (len(data[0])-2)))
+            data_with_group.append(group_sum)
+            data_with_group.append(["", ""] + ([""] * (len(data[0])-2)))
+            group_sum = [current_group, ""] + ([0.0] * (len(data[0])-2))
+
+        for i, value in enumerate(line):
+            if type(value) is float:
+                if type(group_sum[i]) is float:
+                    group_sum[i] = float(group_sum[i]) + value
+                if current_group in ["1", "2", "3", "4", "5"] and type(group_sum_1_5[i]) is float:
+                    group_sum_1_5[i] = float(group_sum_1_5[i]) + value
+                if current_group in ["6", "7"] and type(group_sum_6_7[i]) is float:
+                    group_sum_6_7[i] = float(group_sum_6_7[i]) + value
+
+        last_group = current_group
+        data_with_group.append(line)
+
+    # last subtotal
+    data_with_group.append(["===", "==="] + (["==="] * (len(data[0])-2)))
+    data_with_group.append(group_sum)
+    data_with_group.append(["", ""] + ([""] * (len(data[0])-2)))
+
+    # main subtotal
+    data_with_group.append(group_sum_1_5)
+    data_with_group.append(group_sum_6_7)
+
+    # Round all values (prettier)
+    data_with_group_rounded = [[(round(value) if type(value) is float else value) for value in line] for line in data_with_group]
+
+    # Hide lines with only 0.0 value
+    data_with_group_rounded = [
+        line for line in data_with_group_rounded
+        if any(not isinstance(v, (int, float)) for v in line[2:]) or any(v != 0 for v in line[2:])
+    ]
+
+    def color_row(row: List[Any], i: int) -> List[Any]:
+        if len(row[0]) == 1 or "===" in row[0] or "+" in row[0]:
+            return [Fore.MAGENTA + str(cell) + Style.RESET_ALL for cell in row]
+        elif i % 2 == 0:
+            return [Fore.WHITE + str(cell) + Style.RESET_ALL for cell in row]
+        else:
+            return [Fore.BLUE + str(cell) + Style.RESET_ALL for cell in row]
+
+    data_with_group_rounded_colored = [color_row(row, i) for i, row in enumerate(data_with_group_rounded)]
+    print(f"\n{'=' * 20}\nBalance\n{'=' * 20}\n")
+    print(tabulate(data_with_group_rounded_colored, headers=headers, colalign=(["left", "left"] + ["right"] * (len(data[0])-2))))
+
+
+def display_trial_balance(trial_balance: List[Tuple[str, str, int]], title: str) -> None:
+    """Prints the movements of each account (credit - debit) with a total per account class"""
+    from tabulate import tabulate
+
+    data: List[Any] = []
+    class_totals: Dict[str, int] = {}
+    for compte_num, compte_lib, amount in trial_balance:
+        data.append([compte_num, compte_lib, round(amount / 100, 2)])
+        class_totals[compte_num[0:1]] = class_totals.get(compte_num[0:1], 0) + amount
+
+    data.append(["===", "===", "==="])
+    for account_class, amount in sorted(class_totals.items()):
+        data.append([account_class, "", round(amount / 100, 2)])
+
+    print(f"\n{'=' * 20}\n{title}\n{'=' * 20}\n")
+    print(tabulate(data, headers=["Account", "Label", "Balance"], colalign=("left", "left", "right")))
+
+
+CLOSING_LABELS = {
+    "social_tax_provision_cent": "Provision cotisations sociales",
+    "madelin_provision_cent": "Provision Madelin",
+    "taxable_result_cent": "Résultat avant IS",
+    "company_tax_cent": "Impôt sur les sociétés",
+    "net_result_cent": "Résultat reporté"}
+
+
+def _closing_rows(results: List[ClosingResult]) -> List[List[Any]]:
+    return [[label] + [round(getattr(result, field) / 100, 2) for result in results] for field, label in CLOSING_LABELS.items()]
+
+
+def display_closing(results: Dict[str, ClosingResult]) -> None:
+    """Prints the closing provisions and taxes side by side (one column per set of parameters)"""
+    from tabulate import tabulate
+
+    print(f"\n{'=' * 20}\nClosing\n{'=' * 20}\n")
+    print(tabulate(_closing_rows(list(results.values())), headers=[""] + list(results), colalign=("left",) + ("right",) * len(results)))
+
+
+def display_scenarios(results: Dict[str, Any]) -> None:
+    """Prints the closing figures and the key account balances (credit - debit) of each scenario side by side"""
+    from tabulate import tabulate
+
+    data = _closing_rows([result.closing for result in results.values()])
+    data.append(["==="] + ["==="] * len(results))
+    for prefix in next(iter(results.values())).balances:
+        data.append([f"Solde {prefix}"] + [round(result.balances[prefix] / 100, 2) for result in results.values()])
+
+    print(f"\n{'=' * 20}\nScenarios\n{'=' * 20}\n")
+    print(tabulate(data, headers=[""] + list(results), colalign=("left",) + ("right",) * len(results)))
+
+
+def display_vat_returns(vat_ledger: VatLedger, month: Optional[str] = None) -> None:
+    """Prints the VAT figures (base and VAT per kind and rate) and the VAT due of each month, or of one month"""
+    from tabulate import tabulate
+
+    data: List[Any] = []
+    for vat_month in sorted(vat_ledger.months) if not month else [month.replace("-", "")]:
+        for (kind, rate), (base_cent, vat_cent) in sorted(vat_ledger.get_month(vat_month).items(), key=lambda item: (item[0][0], item[0][1] or 0.0)):
+            data.append([vat_month, kind, "" if rate is None else rate, round(base_cent / 100, 2), round(vat_cent / 100, 2)])
+        data.append([vat_month, "due", "", "", round(vat_ledger.get_due(vat_month) / 100, 2)])
+        data.append(["", "", "", "", ""])
+
+    print(f"\n{'=' * 20}\nVAT (CA3)\n{'=' * 20}\n")
+    print(tabulate(data, headers=["Month", "Kind", "Rate", "Base", "VAT"], colalign=("left", "left", "right", "right", "right")))
+
+
+def display_fec_diff(fec_diff: FecDiff) -> None:
+    """Prints the operations added, removed and modified between two FEC files"""
+    from tabulate import tabulate
+
+    def rows(sign: str, operation: FecOperation) -> List[Any]:
+        return [[sign, operation.num, operation.date, line[2], line[3], line[5], line[6], line[7]] for line in operation.lines]
+
+    data: List[Any] = []
+    for operation in fec_diff.removed:
+        data.extend(rows("-", operation))
+    for operation in fec_diff.added:
+        data.extend(rows("+", operation))
+    for old_operation, new_operation in fec_diff.modified:
+        data.extend(rows("~-", old_operation))
+        data.extend(rows("~+", new_operation))
+
+    print(f"\n{'=' * 20}\nFEC diff\n{'=' * 20}\n")
+    if data:
+        print(tabulate(data, headers=["", "EcritureNum", "Date", "Account", "Aux", "Label", "Debit", "Credit"]))
+    print(f"\n{len(fec_diff.added)} added, {len(fec_diff.removed)} removed, {len(fec_diff.modified)} modified, {fec_diff.unchanged} unchanged operations")
@@ -0,0 +1,176 @@
+import logging
+import multiprocessing
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from .accounting import AccountingService
+from .closing import ClosingParameters, ClosingResult, parse_dated_table
+from .config_cache import load_cached
+from .date_utils import conv_date_from_utc_to_local
+from .misc_transaction_db import MiscellaneousTransactionDB
+from .provenance import INVOICE, MISC_TRANSACTION
+
+PARAMETER = "parameter"
+"""Closing parameter changed : parameter NAME [YYYYMMDD:]VALUE[,...]"""
+
+ADD_OPS = "add_ops"
+"""Miscellaneous transactions of another OPS file added : add_ops PATH"""
+
+REMOVE_OPS = "remove_ops"
+"""Miscellaneous transaction removed : remove_ops PIECEREF"""
+
+MOVE_INVOICE = "move_invoice"
+"""Invoice issued on another date : move_invoice NUMBER YYYY-MM-DD"""
+
+OVERRIDE_KINDS = {PARAMETER: 2, ADD_OPS: 1, REMOVE_OPS: 1, MOVE_INVOICE: 2}
+"""Number of arguments per override kind"""
+
+REFERENCE = "reference"
+"""Name of the scenario without override"""
+
+KEY_ACCOUNTS = ("512", "401", "411", "43", "44")
+"""Account prefixes whose balance is compared between scenarios (bank, suppliers, clients, social organisations, State)"""
+
+
+class ScenarioOverride(NamedTuple):
+    kind: str
+    arguments: Tuple[str, ...]
+
+
+class Scenario(NamedTuple):
+    name: str
+    overrides: Tuple[ScenarioOverride, ...]
+
+
+class ScenarioResult(NamedTuple):
+    closing: ClosingResult
+    balances: Dict[str, int]
+    """Balance ("credit - debit" in cents) per key account prefix after closing"""
+
+
+def parse_scenarios(data_text: str) -> Tuple[Scenario, ...]:
+    """Parses a scenario file : a "* name" line per scenario followed by its overrides (kind and arguments separated by tabs)"""
+    scenarios: List[Scenario] = []
+    for linenum, line in enumerate(data_text.split("\n"), start=1):
+        line = line.strip()
+        if not line or line.startswith("**"):
+            continue
+        if line.startswith("* "):
+            scenarios.append(Scenario(line[2:].strip(), ()))
+            continue
+
+        parts = [part.strip() for part in line.split("\t") if part.strip() != ""]
+        if not scenarios:
+            raise ValueError(f"Unexpected content at line {linenum}, missing scenario name : {line}")
+        if parts[0] not in OVERRIDE_KINDS or len(parts) - 1 != OVERRIDE_KINDS[parts[0]]:
+            raise ValueError(f"Unexpected content at line {linenum} : {line}")
+        if parts[0] == PARAMETER and parts[1] not in ClosingParameters._fields:
+            raise ValueError(f"Unknown closing parameter at line {linenum} : {parts[1]}")
+        scenarios[-1] = scenarios[-1]._replace(overrides=scenarios[-1].overrides + (ScenarioOverride(parts[0], tuple(parts[1:])),))
+    return tuple(scenarios)
+
+
+def load_scenarios(path: str) -> Tuple[Scenario, ...]:
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No scenario file {path}")
+    return load_cached(path, parse_scenarios, "scenarios")
+
+
+def _apply(accounting_service: AccountingService, override: ScenarioOverride) -> None:
+    """Applies an override to the accounting of the period, posted until the last bank transaction"""
+    if override.kind == PARAMETER:
+        name, value = override.arguments
+        accounting_service.closing_parameters = accounting_service.closing_parameters._replace(**{name: parse_dated_table(value)})
+
+    elif override.kind == ADD_OPS:
+        misc_db = accounting_service.misc_transaction_db
+        added = MiscellaneousTransactionDB(override.arguments[0], accounting_service.journal_db, accounting_service.leadger_account_db)
+
+        # Transactions before the last posted record are posted at its date (chronological order of the FEC)
+        last_posted = conv_date_from_utc_to_local(accounting_service.fec_records[-1].EcritureDate) if accounting_service.fec_records else None
+        pending = misc_db.sorted_transactions[misc_db.position:] + [
+            misc_transaction._replace(EcritureDate=max(misc_transaction.EcritureDate, last_posted)) if last_posted else misc_transaction
+            for misc_transaction in added.sorted_transactions]
+        misc_db.sorted_transactions[misc_db.position:] = sorted(pending, key=lambda misc_transaction: misc_transaction.EcritureDate)
+
+    elif override.kind == REMOVE_OPS:
+        piece_ref = override.arguments[0]
+        misc_db = accounting_service.misc_transaction_db
+        misc_db.sorted_transactions[misc_db.position:] = [misc_transaction for misc_transaction in misc_db.sorted_transactions[misc_db.position:]
+                                                          if misc_transaction.PieceRef != piece_ref]
+        accounting_service.reverseFecLines(accounting_service.provenance.get_lines(MISC_TRANSACTION, piece_ref), f"Extourne {piece_ref}")
+
+    elif override.kind == MOVE_INVOICE:
+        number, date = override.arguments
+        invoices = [invoice for invoice in accounting_service.invoices if invoice.number == number or invoice.source_id == number]
+        if not invoices:
+            raise ValueError(f"No invoice {number} in the accounting period")
+        when = conv_date_from_utc_to_local(date)
+        in_period = accounting_service.start_date <= when.strftime("%Y-%m-%d") <= accounting_service.end_date
+        for invoice in invoices:
+            if not invoice.fec_record:
+                if in_period:
+                    invoice.when = when
+                else:
+                    accounting_service.invoices.remove(invoice)
+            elif not in_period:
+                accounting_service.reverseFecLines(accounting_service.provenance.get_lines(INVOICE, invoice.source_id), f"Extourne {invoice.number}")
+            else:
+                logging.info(f"Invoice {number} already posted, moving it inside the accounting period does not change the closing")
+
+
+def run_scenario(accounting_service: AccountingService, scenario: Scenario) -> ScenarioResult:
+    """Applies the overrides of a scenario to the accounting (not closed yet), closes it and returns its figures"""
+    for override in scenario.overrides:
+        _apply(accounting_service, override)
+    accounting_service.closeAccouting()
+    if accounting_service.closing is None:
+        raise Exception("Technical error - closing not computed")
+    return ScenarioResult(accounting_service.closing, {prefix: accounting_service.balances.get_balance(prefix) for prefix in KEY_ACCOUNTS})
+
+
+_forked_accounting_service: Optional[AccountingService] = None
+"""Accounting before closing, inherited by the worker processes when they are forked"""
+
+
+def _run_forked(scenario: Scenario) -> ScenarioResult:
+    if _forked_accounting_service is None:
+        raise Exception("Technical error - no accounting to fork")
+    return run_scenario(_forked_accounting_service, scenario)
+
+
+def _run_pickled(state: bytes, scenario: Scenario) -> ScenarioResult:
+    return run_scenario(pickle.loads(state), scenario)
+
+
+def run_scenarios(accounting_service: AccountingService, scenarios: Tuple[Scenario, ...], workers: int = 0) -> Dict[str, ScenarioResult]:
+    """Runs the reference and each scenario on its own copy of the accounting (not closed yet), in a process pool.
+
+    Where processes can be forked, each scenario runs in a new worker inheriting the accounting state copy-on-write
+    (nothing is copied until the scenario changes it), otherwise the state is pickled once and sent to the workers.
+    The accounting given is not modified.
+    """
+    global _forked_accounting_service
+
+    if accounting_service.event_log:
+        raise ValueError("Scenarios can not be run on an accounting with an event log")
+    all_scenarios = (Scenario(REFERENCE, ()),) + scenarios
+    started_at = time.perf_counter()
+
+    if "fork" in multiprocessing.get_all_start_methods():
+        # A new worker is forked for each scenario (changes of a scenario are never seen by the next one)
+        _forked_accounting_service = accounting_service
+        try:
+            with multiprocessing.get_context("fork").Pool(workers or None, maxtasksperchild=1) as pool:
+                results = pool.map(_run_forked, all_scenarios, chunksize=1)
+        finally:
+            _forked_accounting_service = None
+    else:
+        state = pickle.dumps(accounting_service, protocol=pickle.HIGHEST_PROTOCOL)
+        with ProcessPoolExecutor(max_workers=workers or None) as executor:
+            results = list(executor.map(_run_pickled, [state] * len(all_scenarios), all_scenarios))
+
+    logging.info(f"{len(all_scenarios)} scenarios computed in {time.perf_counter() - started_at:.1f}s")
+    return {scenario.name: result for scenario, result in zip(all_scenarios, results)}
@@ -0,0 +1,118 @@
+import logging
+import os
+import sqlite3
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+from ..models.fec_record import FEC_COLUMNS
+from .file_utils import save_dict_to_csv
+
+ACCOUNT_COLUMNS = ["code", "name", "thirdparty_names_or_quonto_categories"]
+EVIDENCE_COLUMNS = ["number", "source", "source_reference", "source_path", "when"]
+INVOICE_COLUMNS = ["type", "source", "source_id", "attachment_id", "number", "issued_when", "gross_amount", "net_amount", "vat_amount",
+                   "thirdpary_name", "associated_credit_source_ids"]
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS accounts ({", ".join(f'"{c}" TEXT' for c in ACCOUNT_COLUMNS)}, PRIMARY KEY ("code"));
+CREATE TABLE IF NOT EXISTS evidences ({", ".join(f'"{c}" TEXT' for c in EVIDENCE_COLUMNS)}, PRIMARY KEY ("number"));
+CREATE TABLE IF NOT EXISTS invoices ({", ".join(f'"{c}" TEXT' for c in INVOICE_COLUMNS)}, PRIMARY KEY ("source", "source_id"));
+CREATE TABLE IF NOT EXISTS fec_records ("line" INTEGER PRIMARY KEY, {", ".join(f'"{c}" TEXT' for c in FEC_COLUMNS)});
+CREATE INDEX IF NOT EXISTS fec_records_account ON fec_records ("CompteNum", "EcritureDate");
+CREATE INDEX IF NOT EXISTS fec_records_date ON fec_records ("EcritureDate");
+CREATE INDEX IF NOT EXISTS fec_records_lettrage ON fec_records ("CompteNum", "EcritureLet");
+CREATE INDEX IF NOT EXISTS fec_records_evidence ON fec_records ("PieceRef");
+CREATE INDEX IF NOT EXISTS invoices_number ON invoices ("number");
+"""
+
+
+def _upsert(table: str, columns: List[str], keys: List[str]) -> str:
+    """Insert or update statement, rows are only rewritten when a value changed"""
+    names = ", ".join(f'"{c}"' for c in columns)
+    values = ", ".join(f":{c}" for c in columns)
+    others = [c for c in columns if c not in keys]
+    updates = ", ".join(f'"{c}" = excluded."{c}"' for c in others)
+    changed = " OR ".join(f'"{c}" IS NOT excluded."{c}"' for c in others)
+    return f'INSERT INTO {table} ({names}) VALUES ({values}) ON CONFLICT ({", ".join(keys)}) DO UPDATE SET {updates} WHERE {changed}'
+
+
+class SqliteLedgerStore:
+    """SQLite database (WAL mode) of the accounts, evidences, invoices and FEC records of an accounting period.
+
+    Saves are upserts run in a single transaction : only new or modified rows are written.
+    FEC records are stored by line number (position in the FEC file), so the FEC file can be exported from the database.
+    """
+
+    db_name: str
+    db_path: str
+    connection: sqlite3.Connection
+
+    def __init__(self, db_name: str) -> None:
+        if not os.path.exists("./export/"):
+            os.makedirs("./export/")
+
+        self.db_name = db_name
+        self.db_path = f"./export/{db_name.replace('/', '').replace('-', '')}.sqlite"
+        self.connection = sqlite3.connect(self.db_path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Commits all the writes done in the block, or none of them if an exception is raised"""
+        with self.connection:
+            yield self.connection
+
+    def save_accounts(self, accounts: List[Dict[str, Any]]) -> None:
+        self.connection.executemany(_upsert("accounts", ACCOUNT_COLUMNS, ["code"]), accounts)
+
+    def save_evidences(self, evidences: List[Dict[str, Any]]) -> None:
+        self.connection.executemany(_upsert("evidences", EVIDENCE_COLUMNS, ["number"]), evidences)
+
+    def save_invoices(self, invoices: List[Dict[str, Any]]) -> None:
+        self.connection.executemany(_upsert("invoices", INVOICE_COLUMNS, ["source", "source_id"]), invoices)
+
+    def save_fec_records(self, fec_records: List[Dict[str, Any]]) -> None:
+        """Saves the FEC records (the whole FEC, in order) and removes the lines beyond its end"""
+        self.connection.executemany(
+            _upsert("fec_records", ["line"] + FEC_COLUMNS, ["line"]),
+            [dict(fec_record, line=line) for line, fec_record in enumerate(fec_records, start=1)])
+        self.connection.execute('DELETE FROM fec_records WHERE "line" > ?', (len(fec_records),))
+
+    def get_fec_records(self, compte_num: Optional[str] = None, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                        lettrage: Optional[str] = None, piece_ref: Optional[str] = None) -> List[Dict[str, str]]:
+        """FEC records (in FEC order) filtered by account number prefix, dates (YYYYMMDD, included), lettrage code or evidence"""
+        conditions = []
+        parameters: List[Any] = []
+        if compte_num:
+            conditions.append('"CompteNum" >= ? AND "CompteNum" < ?')
+            parameters.extend([compte_num, compte_num + "\uffff"])
+        if start_date:
+            conditions.append('"EcritureDate" >= ?')
+            parameters.append(start_date.replace("-", ""))
+        if end_date:
+            conditions.append('"EcritureDate" <= ?')
+            parameters.append(end_date.replace("-", ""))
+        if lettrage:
+            conditions.append('"EcritureLet" = ?')
+            parameters.append(lettrage)
+        if piece_ref:
+            conditions.append('"PieceRef" = ?')
+            parameters.append(piece_ref)
+
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        columns = ", ".join(f'"{c}"' for c in FEC_COLUMNS)
+        rows = self.connection.execute(f'SELECT {columns} FROM fec_records{where} ORDER BY "line"', parameters)
+        return [dict(row) for row in rows]
+
+    def get_evidences(self) -> List[Dict[str, str]]:
+        columns = ", ".join(f'"{c}"' for c in EVIDENCE_COLUMNS)
+        return [dict(row) for row in self.connection.execute(f'SELECT {columns} FROM evidences ORDER BY CAST("number" AS INTEGER)')]
+
+    def export_fec(self, name: str) -> None:
+        """Writes the FEC file (tab separated) from the database"""
+        save_dict_to_csv(self.get_fec_records(), name, False)
+        logging.info(f"FEC exported from {self.db_path}")
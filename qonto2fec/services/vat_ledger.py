@@ -0,0 +1,137 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from ..models.fec_record import FecRecord
+from .misc_transaction_db import parse_cents
+
+
+COLLECTED = "collected"
+"""VAT collected on cashed sales (44571)"""
+
+DEDUCTIBLE = "deductible"
+"""VAT deductible on goods and services (445661)"""
+
+PENDING = "pending"
+"""VAT on invoiced sales not yet cashed (4458)"""
+
+PAID = "paid"
+"""VAT paid to the tax administration (44551)"""
+
+VAT_ACCOUNTS = {"44571": COLLECTED, "445661": DEDUCTIBLE, "4458": PENDING, "44551": PAID}
+"""VAT figure per account number prefix"""
+
+VAT_RATES = [0.0, 5.5, 10.0, 20.0]
+"""Supported VAT rates (same as the rates accepted for Qonto transactions)"""
+
+
+class VatLedger:
+    """Monthly VAT figures (CA3 return), updated each time a FEC record is created on a VAT account.
+
+    Figures are kept per month (YYYYMM), kind (collected, deductible, pending or paid) and rate,
+    as the taxable base and the VAT amount in cents. A month's return is a dictionary lookup.
+
+    Every FEC record on a VAT account is recorded (see record) with an unknown rate (None) and no base,
+    add and add_items then move the VAT of a recorded FEC record to its rate with its taxable base.
+    VAT of records whose base is not known (e.g. miscellaneous transactions) stays under the unknown rate.
+    """
+
+    months: Dict[str, Dict[Tuple[str, Optional[float]], List[int]]]
+    """[base, VAT] per month (YYYYMM) and (kind, rate)"""
+
+    def __init__(self) -> None:
+        self.months = {}
+
+    @staticmethod
+    def get_kind(compte_num: str) -> Optional[str]:
+        """VAT figure of an account number (None for a non VAT account)"""
+        for prefix, kind in VAT_ACCOUNTS.items():
+            if compte_num.startswith(prefix):
+                return kind
+        return None
+
+    @staticmethod
+    def get_rate(base_cent: int, vat_cent: int) -> Optional[float]:
+        """Nearest supported rate for a base and a VAT amount (None if there is no base)"""
+        if base_cent == 0:
+            return None if vat_cent != 0 else 0.0
+        rate = abs(vat_cent) * 100 / abs(base_cent)
+        return min(VAT_RATES, key=lambda supported_rate: abs(supported_rate - rate))
+
+    @staticmethod
+    def _get_kind_and_vat(fec_record: FecRecord) -> Tuple[str, int]:
+        kind = VatLedger.get_kind(fec_record.CompteNum)
+        if not kind:
+            raise ValueError(f"{fec_record.CompteNum} is not a VAT account")
+
+        if kind in [DEDUCTIBLE, PAID]:
+            return kind, fec_record.getDebitAsCent() - fec_record.getCreditAsCent()
+        return kind, fec_record.getCreditAsCent() - fec_record.getDebitAsCent()
+
+    def record(self, fec_record: FecRecord) -> None:
+        """Records the VAT of a new FEC record, without base and rate (ignored if the record is not on a VAT account)"""
+        if VatLedger.get_kind(fec_record.CompteNum):
+            kind, vat_cent = VatLedger._get_kind_and_vat(fec_record)
+            self._add(fec_record.EcritureDate[0:6], kind, None, 0, vat_cent)
+
+    def _unrecord(self, fec_record: FecRecord) -> Tuple[str, int]:
+        kind, vat_cent = VatLedger._get_kind_and_vat(fec_record)
+        self._add(fec_record.EcritureDate[0:6], kind, None, 0, -vat_cent)
+        return kind, vat_cent
+
+    def add(self, fec_record: FecRecord, base_cent: int, rate: Optional[float] = None) -> None:
+        """Sets the taxable base of a recorded FEC record (rate deduced from the amounts if not given)"""
+        kind, vat_cent = self._unrecord(fec_record)
+        base_cent = -abs(base_cent) if vat_cent < 0 else abs(base_cent)
+        self._add(fec_record.EcritureDate[0:6], kind, rate if rate is not None else VatLedger.get_rate(base_cent, vat_cent), base_cent, vat_cent)
+
+    def add_items(self, fec_record: FecRecord, items: Sequence[Tuple[float, int, int]]) -> None:
+        """Splits the VAT of a recorded FEC record by rate : items (rate, base, VAT) whose VAT total is the amount of the record, up to the sign"""
+        kind, vat_cent = VatLedger._get_kind_and_vat(fec_record)
+        items_vat_cent = sum([item_vat_cent for _, _, item_vat_cent in items])
+        if abs(items_vat_cent) != abs(vat_cent):
+            raise ValueError(f"VAT items {items} do not match the VAT of {fec_record.EcritureLib} ({vat_cent})")
+
+        self._unrecord(fec_record)
+
+        sign = -1 if (items_vat_cent < 0) != (vat_cent < 0) else 1
+        for rate, base_cent, item_vat_cent in items:
+            self._add(fec_record.EcritureDate[0:6], kind, float(rate), sign * base_cent, sign * item_vat_cent)
+
+    def _add(self, month: str, kind: str, rate: Optional[float], base_cent: int, vat_cent: int) -> None:
+        month_figures = self.months.setdefault(month, {})
+        figures = month_figures.setdefault((kind, rate), [0, 0])
+        figures[0] += base_cent
+        figures[1] += vat_cent
+        if figures == [0, 0]:
+            del month_figures[(kind, rate)]
+
+    def get_month(self, month: str) -> Dict[Tuple[str, Optional[float]], List[int]]:
+        """[base, VAT] per (kind, rate) of a month (YYYYMM or YYYY-MM)"""
+        return self.months.get(month.replace("-", ""), {})
+
+    def get_total(self, month: str, kind: str) -> int:
+        """VAT amount of a kind for a month, all rates"""
+        return sum([figures[1] for (figure_kind, _), figures in self.get_month(month).items() if figure_kind == kind])
+
+    def get_due(self, month: str) -> int:
+        """VAT due for a month (collected - deductible), negative for a VAT credit"""
+        return self.get_total(month, COLLECTED) - self.get_total(month, DEDUCTIBLE)
+
+    def to_rows(self) -> List[Dict[str, Any]]:
+        rows = []
+        for month in sorted(self.months):
+            for (kind, rate), (base_cent, vat_cent) in sorted(self.months[month].items(), key=lambda item: (item[0][0], item[0][1] or 0.0)):
+                rows.append({
+                    "month": month,
+                    "kind": kind,
+                    "rate": "" if rate is None else str(rate),
+                    "base": f"{base_cent / 100:.2f}".replace(".", ","),
+                    "vat": f"{vat_cent / 100:.2f}".replace(".", ",")
+                })
+        return rows
+
+    @staticmethod
+    def from_rows(rows: List[Dict[str, Any]]) -> "VatLedger":
+        vat_ledger = VatLedger()
+        for row in rows:
+            rate = float(row["rate"]) if row["rate"] else None
+            vat_ledger._add(row["month"], row["kind"], rate, parse_cents(row["base"]), parse_cents(row["vat"]))
+        return vat_ledger
@@ -0,0 +1,245 @@
+import logging
+import os
+import pickle
+import time
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from ..models.financial_transaction import FinancialTransaction
+from ..models.invoice import Invoice
+from ..models.qonto_snapshot import QontoSnapshot
+from .accounting import AccountingService
+from .accounting_config import ACCOUNTING_CONFIG_PATH
+from .config_cache import load_cached
+from .date_utils import conv_date_from_utc_to_local, get_month_end, get_months
+from .file_utils import save_dict_to_csv, save_object_to_file
+from .misc_transaction_db import parse_misc_transactions
+
+DEFAULT_POLL_INTERVAL = 300
+"""Seconds between two polls"""
+
+CURSOR_MARGIN = timedelta(minutes=5)
+"""Transactions updated a little before the last poll are retrieved again (clock differences with Qonto)"""
+
+
+def _copy(data: Any) -> Any:
+    """Deep copy (accounting mutates invoices and transactions)"""
+    return pickle.loads(pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+class AccountingWatcher:
+    """Keeps the accounting of a period up to date with Qonto and the configuration files (watch mode).
+
+    The accounting service is checkpointed (pickled) before the events of each month are posted.
+    At each poll, the transactions and invoices updated since the last poll (cursor), the OPS file
+    and config/accounting.cfg are checked. The accounting is restored from the checkpoint of the first
+    month affected by a change and only the following months are posted again, then the outputs are rewritten
+    (each file is replaced atomically). A change of accounting.cfg (journals and accounts) recomputes the whole period.
+    The changes retrieved are staged : the cursor, the Qonto data, the parsed OPS file, the file stats and the checkpoints
+    are only replaced once the accounting has been computed and saved with them, so the changes of a failed poll
+    are retrieved again at the next poll. The process sleeps between two polls.
+    """
+
+    siren: str
+    start_date: str
+    end_date: str
+    reconciliation_search_limit: int
+    ledger_storage: str
+    qonto: Any
+    snapshot: QontoSnapshot
+    snapshot_name: str
+
+    months: List[str]
+    """Months (YYYYMM) of the accounting period"""
+
+    checkpoints: Dict[str, bytes]
+    """Pickled accounting service before the events of a month are posted"""
+
+    cursor: Optional[datetime] = None
+    """Transactions and invoices updated since this date (UTC) are retrieved at the next poll"""
+
+    file_stats: Dict[str, Tuple[int, int]]
+    """Modification time and size of the watched files"""
+
+    ops_path: str
+    ops: Tuple[Any, ...]
+    """Parsed OPS file the checkpoints have been computed with"""
+
+    def __init__(self, siren: str, start_date: str, end_date: str, reconciliation_search_limit: int, ledger_storage: str, qonto: Any) -> None:
+        self.siren = siren
+        self.start_date = start_date
+        self.end_date = end_date
+        self.reconciliation_search_limit = reconciliation_search_limit
+        self.ledger_storage = ledger_storage
+        self.qonto = qonto
+        self.snapshot_name = f"{siren}QONTO{end_date}"
+        self.ops_path = f"config/{siren}OPS{end_date}.txt".replace("-", "")
+        self.checkpoints = {}
+        self.file_stats = {}
+        self.ops = ()
+
+        self.months = get_months(start_date, end_date)
+
+    def _get_file_stats(self) -> Dict[str, Tuple[int, int]]:
+        return {path: (os.stat(path).st_mtime_ns, os.stat(path).st_size) if os.path.exists(path) else (0, 0)
+                for path in [ACCOUNTING_CONFIG_PATH, self.ops_path]}
+
+    def _load_ops(self) -> Tuple[Any, ...]:
+        return load_cached(self.ops_path, parse_misc_transactions, "ops").transactions if os.path.exists(self.ops_path) else ()
+
+    def start(self, fetch: Callable[[], QontoSnapshot]) -> None:
+        """Retrieves all the Qonto data (fetch) and does the accounting of the whole period"""
+        cursor = datetime.now(timezone.utc)
+        snapshot = fetch()
+        file_stats = self._get_file_stats()
+        ops = self._load_ops()
+        self.compute(snapshot, self.months[0], reload=False)
+        self.snapshot, self.cursor, self.file_stats, self.ops = snapshot, cursor, file_stats, ops
+
+    def run(self, fetch: Callable[[], QontoSnapshot], interval: int = DEFAULT_POLL_INTERVAL) -> None:
+        self.start(fetch)
+        logging.info(f"Watching Qonto and configuration files every {interval} seconds (Ctrl+C to stop)")
+        while True:
+            time.sleep(interval)
+            try:
+                self.poll()
+            except Exception as e:
+                logging.error(f"Accounting update failed, retrying at next poll : {e}")
+
+    def poll(self) -> Optional[str]:
+        """Applies the changes since the last poll, returns the first month recomputed (None if nothing changed)"""
+        poll_time = datetime.now(timezone.utc)
+        file_stats = self._get_file_stats()
+        months: List[str] = []
+        if file_stats[ACCOUNTING_CONFIG_PATH] != self.file_stats.get(ACCOUNTING_CONFIG_PATH):
+            logging.info(f"{ACCOUNTING_CONFIG_PATH} changed")
+            months.append(self.months[0])
+
+        ops = self.ops
+        ops_changed = file_stats[self.ops_path] != self.file_stats.get(self.ops_path)
+        if ops_changed:
+            ops = self._load_ops()
+            previous = {repr(parsed) for parsed in self.ops}
+            current = {repr(parsed) for parsed in ops}
+            months.extend([conv_date_from_utc_to_local(parsed.EcritureDate).strftime("%Y%m")
+                           for parsed in list(self.ops) + list(ops) if (repr(parsed) in previous) != (repr(parsed) in current)])
+
+        transactions, transaction_months = self._updateTransactions()
+        months.extend(transaction_months)
+        client_invoices, client_invoice_months = self._updateInvoices(
+            self.snapshot.client_invoices, lambda updated_at_from, removed_ids: self.qonto.getClientInvoices(
+                self.start_date, self.end_date, updated_at_from=updated_at_from, removed_ids=removed_ids))
+        client_credit_notes, client_credit_note_months = self._updateInvoices(
+            self.snapshot.client_credit_notes, lambda updated_at_from, removed_ids: self.qonto.getClientCreditNotes(
+                self.start_date, self.end_date, updated_at_from=updated_at_from))
+        supplier_invoices, supplier_invoice_months = self._updateInvoices(
+            self.snapshot.supplier_invoices, lambda updated_at_from, removed_ids: self.qonto.getToPaySupplierInvoices(
+                self.start_date, self.end_date, updated_at_from=updated_at_from, removed_ids=removed_ids))
+        invoice_months = client_invoice_months + client_credit_note_months + supplier_invoice_months
+        months.extend(invoice_months)
+
+        if not months:
+            logging.debug("No change")
+            self.cursor, self.file_stats = poll_time, file_stats
+            return None
+
+        snapshot = QontoSnapshot(client_invoices, client_credit_notes, supplier_invoices, transactions)
+        from_month = min(months)
+        self.compute(snapshot, from_month, reload=ops_changed or bool(invoice_months))
+        save_object_to_file(snapshot, self.snapshot_name)
+        self.snapshot, self.cursor, self.file_stats, self.ops = snapshot, poll_time, file_stats, ops
+        return from_month
+
+    def _updated_at_from(self) -> Optional[datetime]:
+        return self.cursor - CURSOR_MARGIN if self.cursor else None
+
+    def _updateTransactions(self) -> Tuple[List[FinancialTransaction], List[str]]:
+        """Transactions merged with the ones updated since the last poll and months of the changed transactions"""
+        declined_ids: List[str] = []
+        updated = self.qonto.getTransactions(self.start_date, self.end_date, self._updated_at_from(), declined_ids)
+
+        transactions = {transaction.transaction_id: transaction for transaction in self.snapshot.transactions}
+        months = []
+        for transaction in updated:
+            previous = transactions.get(transaction.transaction_id)
+            if previous and previous._asdict() == transaction._asdict():
+                continue
+            if previous:
+                months.append(previous.when.strftime("%Y%m"))
+            months.append(transaction.when.strftime("%Y%m"))
+            transactions[transaction.transaction_id] = transaction
+        for transaction_id in declined_ids:
+            if transaction_id in transactions:
+                months.append(transactions.pop(transaction_id).when.strftime("%Y%m"))
+
+        if not months:
+            return self.snapshot.transactions, months
+        logging.info(f"{len(months)} bank transaction changes retrieved from Qonto")
+        return sorted(transactions.values(), key=lambda transaction: transaction.when), months
+
+    def _updateInvoices(self, invoices: List[Invoice],
+                        listing: Callable[[Optional[datetime], List[str]], List[Invoice]]) -> Tuple[List[Invoice], List[str]]:
+        """Invoices merged with the ones updated since the last poll (listing) and months of the changed invoices"""
+        removed_ids: List[str] = []
+        updated = listing(self._updated_at_from(), removed_ids)
+
+        merged: Dict[str, Invoice] = {invoice.source_id: invoice for invoice in invoices}
+        months = []
+        for invoice in updated:
+            previous = merged.get(invoice.source_id)
+            if previous and vars(previous) == vars(invoice):
+                continue
+            if previous:
+                months.append(previous.when.strftime("%Y%m"))
+            months.append(invoice.when.strftime("%Y%m"))
+            merged[invoice.source_id] = invoice
+        for source_id in removed_ids:
+            if source_id in merged:
+                months.append(merged.pop(source_id).when.strftime("%Y%m"))
+
+        if not months:
+            return invoices, months
+        logging.info(f"{len(months)} invoice changes retrieved from Qonto")
+        return sorted(merged.values(), key=lambda invoice: invoice.when), months
+
+    def _newAccountingService(self) -> AccountingService:
+        accounting_service = AccountingService(self.siren, self.start_date, self.end_date, self.reconciliation_search_limit, self.ledger_storage)
+        accounting_service.generateRAN()
+        return accounting_service
+
+    def compute(self, snapshot: QontoSnapshot, from_month: str, reload: bool) -> None:
+        """Does the accounting of a snapshot again from a month (restored from its checkpoint) and saves it.
+
+        With reload, the OPS file and the invoices not posted yet are loaded again in the restored accounting.
+        The checkpoints are replaced once the accounting is saved.
+        """
+        index = min(bisect_left(self.months, from_month), len(self.months) - 1)
+        if self.months[index] not in self.checkpoints:
+            index = 0
+
+        started_at = time.perf_counter()
+        invoices = snapshot.client_invoices + snapshot.client_credit_notes + snapshot.supplier_invoices
+        if index == 0:
+            accounting_service = self._newAccountingService()
+            accounting_service.addInvoices(_copy(invoices))
+        else:
+            accounting_service = pickle.loads(self.checkpoints[self.months[index]])
+            if reload:
+                accounting_service.reloadPendingInputs(_copy(invoices), get_month_end(self.months[index - 1]))
+
+        # Posts each month from its checkpoint
+        checkpoints = {month: checkpoint for month, checkpoint in self.checkpoints.items() if month < self.months[index]}
+
+        def checkpoint(month: str, accounting_service: AccountingService) -> None:
+            checkpoints[month] = pickle.dumps(accounting_service, protocol=pickle.HIGHEST_PROTOCOL)
+
+        transactions = [transaction for transaction in snapshot.transactions
+                        if index == 0 or transaction.when.strftime("%Y%m") >= self.months[index]]
+        accounting_service.doAccountingByMonth(_copy(transactions), self.months[index] if index else None, checkpoint)
+
+        accounting_service.closeAccouting()
+        accounting_service.save()
+        save_dict_to_csv([{"account": account, "label": label, "balance": f"{amount / 100:.2f}".replace(".", ",")}
+                          for account, label, amount in accounting_service.getTrialBalance()], f"{self.siren}BALANCE{self.end_date}", False)
+        self.checkpoints = checkpoints
+        logging.info(f"Accounting updated from {self.months[index]} in {time.perf_counter() - started_at:.1f}s")
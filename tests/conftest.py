@@ -0,0 +1,16 @@
+import os
+import shutil
+from pathlib import Path
+
+import pytest
+
+REPOSITORY_DIR = Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture
+def accounting_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """Working directory of an accounting run (config/accounting.cfg of the repository, empty export and cache)"""
+    os.makedirs(tmp_path / "config")
+    shutil.copy(REPOSITORY_DIR / "config" / "accounting.cfg", tmp_path / "config" / "accounting.cfg")
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
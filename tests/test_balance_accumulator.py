@@ -0,0 +1,69 @@
+import random
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from qonto2fec.models.fec_record import FecRecord
+from qonto2fec.models.journal import Journal
+from qonto2fec.models.ledger_account import LedgerAccount
+from qonto2fec.services.balance_accumulator import BalanceAccumulator
+
+JOURNALS = [Journal("BQ", "Journal de banque"), Journal("VE", "Journal des ventes"), Journal("OD", "Opérations diverses")]
+ACCOUNTS = [LedgerAccount("512", "Banque"), LedgerAccount("411", "Clients"), LedgerAccount("41100001", "ACME", "ACME"),
+            LedgerAccount("401", "Fournisseurs"), LedgerAccount("6411", "Salaires"), LedgerAccount("6412", "Congés payés"),
+            LedgerAccount("706", "Prestations de services"), LedgerAccount("44571", "TVA collectée")]
+
+
+def _records(count: int) -> List[FecRecord]:
+    generator = random.Random(31)
+    records = []
+    for num in range(count):
+        amount = generator.randint(1, 500000)
+        credit = generator.random() < 0.5
+        records.append(FecRecord(datetime(2024, generator.randint(1, 12), generator.randint(1, 28), 12), f"label {num}",
+                                 generator.choice(JOURNALS), generator.choice(ACCOUNTS), amount if credit else 0, 0 if credit else amount, num))
+    return records
+
+
+def _sum(records: List[FecRecord], key: object) -> Dict[object, int]:
+    totals: Dict[object, int] = {}
+    for record in records:
+        k = key(record)  # type: ignore[operator]
+        totals[k] = totals.get(k, 0) + record.getCreditAsCent() - record.getDebitAsCent()
+    return totals
+
+
+def test_balances_match_a_full_recompute() -> None:
+    records = _records(2000)
+    balances = BalanceAccumulator()
+    lettered: List[FecRecord] = []
+    for i, record in enumerate(records):
+        balances.add(record)
+        if i % 7 == 0 and record.CompteNum.startswith(("411", "401")):
+            record.EcritureLet = "AAA"
+            balances.letter(record)
+            lettered.append(record)
+
+    assert balances.version == len(records)
+    assert balances.accounts == _sum(records, lambda r: (r.CompteNum, r.CompteLib))
+    assert balances.compte_nums == _sum(records, lambda r: r.CompteNum)
+    assert balances.classes == _sum(records, lambda r: r.CompteNum[0])
+    for account, months in balances.months.items():
+        assert months == _sum([r for r in records if (r.CompteNum, r.CompteLib) == account], lambda r: r.EcritureDate[0:6])
+    for account, days in balances.days.items():
+        assert days == _sum([r for r in records if (r.CompteNum, r.CompteLib) == account], lambda r: r.EcritureDate)
+    assert list(balances.month_headers) == list(dict.fromkeys(r.EcritureDate[0:6] for r in records))
+
+    assert balances.journal_debits == {journal.code: sum(r.getDebitAsCent() for r in records if r.JournalCode == journal.code)
+                                       for journal in JOURNALS}
+    assert balances.journal_credits == {journal.code: sum(r.getCreditAsCent() for r in records if r.JournalCode == journal.code)
+                                        for journal in JOURNALS}
+
+    assert list(balances.open_items) == [r for r in records if (r.CompAuxNum or r.CompteNum[0:3] in ["401", "411"]) and r not in lettered]
+    assert balances.get_open_items("4110000") == [r for r in balances.open_items if r.CompteNum == "4110000"]
+
+    for prefix in ["4", "41", "6", "641", "7"]:
+        assert balances.get_balance(prefix) == sum(r.getCreditAsCent() - r.getDebitAsCent() for r in records if r.CompteNum.startswith(prefix))
+    movements: List[Tuple[str, str, int]] = [(r.CompteNum, r.EcritureDate, r.getCreditAsCent() - r.getDebitAsCent())
+                                             for r in records if r.CompteNum.startswith("641")]
+    assert sorted(balances.get_movements("641")) == sorted(movements)
+    assert [m for m in balances.get_movements("6411")] == [m for m in movements if m[0].startswith("6411")]
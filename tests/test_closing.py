@@ -0,0 +1,78 @@
+from pathlib import Path
+from typing import List, Tuple
+
+import pytest
+
+from qonto2fec.services.accounting import AccountingService
+from qonto2fec.services.closing import ClosingAggregates, ClosingParameters, ClosingResult, compute_closing
+
+OPS = """==\tFacture
+==\t15/{month}/2024
+==\tF1\t15/{month}/2024
+OD\t512\t9000000\t0
+OD\t706\t0\t9000000
+
+==\tSalaire juin
+==\t30/06/2024
+==\tPAIE6\t30/06/2024
+OD\t6411\t3000\t0
+OD\t512\t0\t3000
+
+==\tSalaire septembre
+==\t30/09/2024
+==\tPAIE9\t30/09/2024
+OD\t6411\t4000,01\t0
+OD\t512\t0\t4000,01
+
+==\tMadelin
+==\t30/07/2024
+==\tMAD7\t30/07/2024
+OD\t64114\t5000\t0
+OD\t512\t0\t5000
+
+==\tMadelin
+==\t31/07/2024
+==\tMAD8\t31/07/2024
+OD\t64114\t3000\t0
+OD\t512\t0\t3000
+
+==\tURSSAF
+==\t15/10/2024
+==\tURS\t15/10/2024
+OD\t646\t1200,50\t0
+OD\t512\t0\t1200,50
+"""
+
+
+def _closing_records(accounting_service: AccountingService) -> List[Tuple[str, str, str]]:
+    return [(fec_record.CompteNum, fec_record.Debit, fec_record.Credit) for fec_record in accounting_service.fec_records
+            if fec_record.EcritureLib.startswith(("Provision", "Impôts sur les sociétés"))]
+
+
+# Figures of the closing computed from the FEC records before the closing was computed from the aggregates
+@pytest.mark.parametrize("start_date, month, company_tax", [("2024-01-01", "02", "2241223,91"), ("2024-05-01", "05", "2242640,58")])
+def test_closing_figures_are_unchanged(accounting_dir: Path, start_date: str, month: str, company_tax: str) -> None:
+    (accounting_dir / "config" / "123OPS20241231.txt").write_text(OPS.format(month=month))
+    accounting_service = AccountingService("123", start_date, "2024-12-31")
+    accounting_service.generateRAN()
+    accounting_service.doAccountingByMonth([])
+    accounting_service.closeAccouting()
+
+    assert _closing_records(accounting_service) == [("4386000", "0,00", "3320,50"), ("6461100", "3320,50", "0,00"),
+                                                    ("6951000", company_tax, "0,00"), ("4440000", "0,00", company_tax)]
+
+
+def test_madelin_excess_is_a_mandatory_contribution() -> None:
+    aggregates = ClosingAggregates(end_date="20241231", nb_months=12, social_tax_balance_cent=-120050,
+                                   remunerations=(("6411000", "20240630", -300000), ("64114", "20240730", -500000), ("64114", "20240731", -300000)),
+                                   result_cent=10000000)
+
+    # ACRE rate until July 30th : 835 + 1365 of Madelin contributions, capped to 1674
+    assert compute_closing(aggregates, ClosingParameters()) == ClosingResult(
+        social_tax_provision_cent=-120050 + 50100 + 52600, madelin_provision_cent=167400, taxable_result_cent=9849950,
+        company_tax_cent=637500 + 1399987, net_result_cent=9849950 - 2037487)
+
+
+def test_no_company_tax_on_a_loss() -> None:
+    aggregates = ClosingAggregates(end_date="20241231", nb_months=12, social_tax_balance_cent=0, remunerations=(), result_cent=-1000)
+    assert compute_closing(aggregates, ClosingParameters()) == ClosingResult(0, 0, -1000, 0, -1000)
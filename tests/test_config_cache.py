@@ -0,0 +1,72 @@
+import os
+from pathlib import Path
+from typing import List, Tuple
+
+import pytest
+
+from qonto2fec.services import config_cache
+from qonto2fec.services.config_cache import load_cached
+
+
+class CountingParser:
+    def __init__(self) -> None:
+        self.contents: List[str] = []
+
+    def __call__(self, content: str) -> Tuple[str, ...]:
+        self.contents.append(content)
+        return tuple(content.splitlines())
+
+
+@pytest.fixture
+def config_path(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    monkeypatch.setattr(config_cache, "CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(config_cache, "_memory_cache", {})
+    path = tmp_path / "accounts.cfg"
+    path.write_text("512\tBanque\n")
+    return path
+
+
+def _set_mtime(path: Path, mtime_ns: int) -> None:
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_unchanged_file_is_parsed_once(config_path: Path) -> None:
+    parser = CountingParser()
+    assert load_cached(str(config_path), parser, "test") == ("512\tBanque",)
+    assert load_cached(str(config_path), parser, "test") == ("512\tBanque",)
+    assert len(parser.contents) == 1
+
+    # Another process : loaded from the compiled cache
+    config_cache._memory_cache.clear()
+    assert load_cached(str(config_path), parser, "test") == ("512\tBanque",)
+    assert len(parser.contents) == 1
+
+
+def test_changed_file_is_parsed_again(config_path: Path) -> None:
+    parser = CountingParser()
+    load_cached(str(config_path), parser, "test")
+    mtime_ns = config_path.stat().st_mtime_ns
+
+    # Size changed, same modification time
+    config_path.write_text("512\tBanque\n706\tPrestations de services\n")
+    _set_mtime(config_path, mtime_ns)
+    assert load_cached(str(config_path), parser, "test") == ("512\tBanque", "706\tPrestations de services")
+
+    # Content changed, same size
+    config_path.write_text("512\tBanque\n707\tPrestations de services\n")
+    _set_mtime(config_path, mtime_ns + 1000)
+    assert load_cached(str(config_path), parser, "test") == ("512\tBanque", "707\tPrestations de services")
+    assert len(parser.contents) == 3
+
+
+def test_touched_file_reuses_the_cache(config_path: Path) -> None:
+    parser = CountingParser()
+    payload = load_cached(str(config_path), parser, "test")
+
+    # Same content with another modification time : the content hash matches the compiled cache
+    _set_mtime(config_path, config_path.stat().st_mtime_ns + 1000)
+    assert load_cached(str(config_path), parser, "test") == payload
+    _set_mtime(config_path, config_path.stat().st_mtime_ns + 1000)
+    config_cache._memory_cache.clear()
+    assert load_cached(str(config_path), parser, "test") == payload
+    assert len(parser.contents) == 1
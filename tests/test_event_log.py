@@ -0,0 +1,114 @@
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Any, List
+
+from qonto2fec.models.fec_record import FecRecord
+from qonto2fec.models.financial_transaction import FinancialTransaction
+from qonto2fec.models.invoice import CLIENT_INVOICE, Invoice
+from qonto2fec.models.journal import Journal
+from qonto2fec.models.ledger_account import LedgerAccount
+from qonto2fec.services.accounting import AccountingService
+from qonto2fec.services.date_utils import conv_date_from_utc_to_local, get_month_end, get_previous_month
+from qonto2fec.services.event_log import EventLog, get_changes, load_checkpoint, load_ledger
+from qonto2fec.services.provenance import MISC_TRANSACTION, Provenance
+
+NAME = "123EVENTS2024-12-31"
+
+OPS = """==\tCapital
+==\t10/01/2024
+==\tSTATUTS\t10/01/2024
+OD\t512\t1000,00\t0
+OD\t1013\t0\t1000,00
+
+==\tLoyer
+==\t15/03/2024
+==\tLOY\t15/03/2024
+OD\t6132\t500\t0
+OD\t4011\t0\t500
+"""
+
+
+def _when(month: int, day: int) -> datetime:
+    return conv_date_from_utc_to_local(datetime(2024, month, day, 9))
+
+
+def _invoices() -> List[Invoice]:
+    return [Invoice("Qonto", f"F{month}", f"att{month}", f"F{month}", CLIENT_INVOICE, _when(month, 5), 120000, 20000, "ACME")
+            for month in [1, 2, 3]]
+
+
+def _transaction(transaction_id: str, when: datetime, **fields: Any) -> FinancialTransaction:
+    return FinancialTransaction({
+        "transaction_id": transaction_id, "status": "completed", "currency": "EUR", "attachment_required": False, "attachments": [],
+        "attachment_lost": False, "operation_type": "card", "label_ids": [], "labels": [], "note": None, "reference": transaction_id,
+        "settled_at": when, "attachment_ids": [], "label": "OVH", "amount_cents": 1200, "side": "debit", "category": "Services en ligne",
+        **fields})
+
+
+def _transactions() -> List[FinancialTransaction]:
+    return [_transaction("R1", _when(1, 20)),
+            _transaction("P1", _when(2, 10), label="ACME", amount_cents=120000, side="credit", category="sales", operation_type="transfer"),
+            _transaction("R3", _when(3, 20)),
+            _transaction("P2", _when(4, 10), label="ACME", amount_cents=120000, side="credit", category="sales", operation_type="transfer")]
+
+
+def _ledger(accounting_service: AccountingService) -> List[Any]:
+    return [fec_record._asdict() for fec_record in accounting_service.fec_records]
+
+
+def test_replay_from_a_checkpoint(accounting_dir: Path) -> None:
+    (accounting_dir / "config" / "123OPS20241231.txt").write_text(OPS)
+    accounting_service = AccountingService("123", "2024-01-01", "2024-12-31")
+    accounting_service.event_log = EventLog(NAME)
+    accounting_service.generateRAN()
+    accounting_service.addInvoices(_invoices())
+    accounting_service.doAccountingByMonth(_transactions())
+    accounting_service.closeAccouting()
+    path = EventLog.get_path(NAME)
+    assert [r._asdict() for r in load_ledger(path)] == _ledger(accounting_service)
+
+    for from_month in ["202402", "202403", "202405"]:
+        month, restored = load_checkpoint(path, from_month)
+        assert month == from_month
+
+        # Records of the snapshot are the records rebuilt from the log, not copies
+        fec_record_ids = {id(fec_record) for fec_record in restored.fec_records}
+        assert restored.balances.open_items and all(id(fec_record) in fec_record_ids for fec_record in restored.balances.open_items)
+        assert len(restored.provenance.provenances) == len(restored.fec_records)
+
+        restored.reloadPendingInputs(_invoices(), get_month_end(get_previous_month(month)))
+        restored.doAccountingByMonth(_transactions(), month)
+        restored.closeAccouting()
+        assert _ledger(restored) == _ledger(accounting_service)
+
+
+def _record(label: str, ecriture_num: int, ecriture_rec: Any = None) -> FecRecord:
+    return FecRecord(datetime(2024, 1, 5), label, Journal("OD", "Opérations diverses"), LedgerAccount("512", "Banque"), 0, 1000, ecriture_num,
+                     ecriture_rec=ecriture_rec)
+
+
+def _log(accounting_dir: Path, fec_records: List[FecRecord]) -> EventLog:
+    event_log = EventLog(NAME)
+    for fec_record in fec_records:
+        event_log.record(fec_record, Provenance(MISC_TRANSACTION, "OPS", fec_record.EcritureLib))
+    return event_log
+
+
+def test_changes_ignore_renumbering(accounting_dir: Path) -> None:
+    _log(accounting_dir, [_record("A", 1), _record("B", 2)]).close()
+    _log(accounting_dir, [_record("C", 1), _record("A", 2, "AAA"), _record("B", 3)]).close()
+
+    removed, added = get_changes(NAME)
+    assert removed == []
+    assert [(r.EcritureNum, r.EcritureLib) for r in added] == [("1", "C")]
+
+
+def test_aborted_run_keeps_the_last_log(accounting_dir: Path) -> None:
+    _log(accounting_dir, [_record("A", 1)]).close()
+    event_log = _log(accounting_dir, [_record("B", 1), _record("C", 2)])
+    event_log.abort()
+
+    assert not os.path.exists(event_log.path)
+    assert not os.path.exists(EventLog.get_path(NAME, previous=True))
+    assert [r.EcritureLib for r in load_ledger(EventLog.get_path(NAME))] == ["A"]
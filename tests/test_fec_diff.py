@@ -0,0 +1,38 @@
+from typing import Dict, List
+
+from qonto2fec.services.fec_diff import diff_fec
+
+
+def _row(num: int, label: str, account: str, debit: str, credit: str, **fields: str) -> Dict[str, str]:
+    return {"JournalCode": "OD", "EcritureNum": str(num), "EcritureDate": "20240105", "CompteNum": account, "CompAuxNum": "",
+            "PieceRef": f"P{num}", "PieceDate": "20240105", "EcritureLib": label, "Debit": debit, "Credit": credit, "EcritureLet": "",
+            "DateLet": "", **fields}
+
+
+def _operation(num: int, label: str, amount: str, **fields: str) -> List[Dict[str, str]]:
+    return [_row(num, label, "6132000", amount, "0,00", **fields), _row(num, label, "5120000", "0,00", amount, **fields)]
+
+
+OLD = _operation(1, "Loyer", "500,00") + _operation(2, "OVH", "12,00") + _operation(3, "Banque", "3,00")
+
+
+def test_renumbering_is_not_a_change() -> None:
+    # Same operations, renumbered, lettered and in another order
+    new = _operation(7, "OVH", "12,00", EcritureLet="AAA", DateLet="20240110") + _operation(8, "Loyer", "500,00") + _operation(9, "Banque", "3,00")
+    diff = diff_fec(lambda: OLD, lambda: new)
+    assert (diff.added, diff.removed, diff.modified, diff.unchanged) == ([], [], [], 3)
+
+    # PieceRef is only compared when evidence numbers are stable
+    assert len(diff_fec(lambda: OLD, lambda: new, piece_ref=True).modified) == 3
+
+
+def test_content_changes_are_reported() -> None:
+    new = _operation(1, "Loyer", "510,00") + _operation(2, "OVH", "12,00") + _operation(3, "Assurance", "30,00")
+    diff = diff_fec(lambda: OLD, lambda: new)
+    assert diff.unchanged == 1
+
+    # Same journal, date and label : modification
+    assert [(old.label, [line[6] for line in old.lines], [line[6] for line in new.lines]) for old, new in diff.modified] == \
+        [("Loyer", ["0,00", "500,00"], ["0,00", "510,00"])]
+    assert [operation.label for operation in diff.added] == ["Assurance"]
+    assert [operation.label for operation in diff.removed] == ["Banque"]
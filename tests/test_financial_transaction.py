@@ -0,0 +1,56 @@
+import pickle
+from datetime import datetime
+from typing import Any, Dict
+
+import pytest
+
+from qonto2fec.models.financial_transaction import FinancialTransaction
+
+
+def _raw_transaction(**fields: Any) -> Dict[str, Any]:
+    return {
+        "transaction_id": "t1", "status": "completed", "currency": "EUR", "attachment_required": False, "attachments": [],
+        "attachment_lost": False, "operation_type": "transfer", "label_ids": [], "labels": [], "note": None, "reference": "R1",
+        "settled_at": datetime(2024, 1, 5), "attachment_ids": ["a1"], "label": "ACME", "amount_cents": 1200, "side": "credit",
+        "category": "other_income", "income": {"counterparty_account_number": "fr76 0001"}, **fields}
+
+
+def test_lazy_fields_are_converted_on_first_access() -> None:
+    transaction = FinancialTransaction(_raw_transaction(), accounts_by_iban={"FR760001": "512001"})
+    assert (transaction.amount_excluding_vat, transaction.vat, transaction.when) == (1200, 0, datetime(2024, 1, 5))
+    with pytest.raises(AttributeError):
+        object.__getattribute__(transaction, "category")
+
+    assert transaction.category == "other_income"
+    assert transaction._raw is not None
+
+    assert (transaction.attachments, transaction.thirdparty_name, transaction.note, transaction.reference, transaction.counterparty_account) == \
+        (["a1"], "ACME", None, "R1", "512001")
+    # Every lazy field is converted : the raw data is not referenced anymore
+    assert transaction._raw is None
+
+
+def test_lazy_fields_depend_on_the_validated_fields() -> None:
+    transaction = FinancialTransaction(_raw_transaction(operation_type="qonto_fee", label_ids=["l1"], labels=[{"name": "Frais"}]))
+    assert (transaction.note, transaction.category) == ("Frais bancaires Qonto", "Frais")
+
+
+def test_pickled_transaction_has_every_field() -> None:
+    transaction = FinancialTransaction(_raw_transaction())
+    restored = pickle.loads(pickle.dumps(transaction))
+    assert restored._asdict() == transaction._asdict()
+    assert restored._raw is None
+    with pytest.raises(AttributeError):
+        restored.unknown_field
+
+
+@pytest.mark.parametrize("fields, error", [
+    ({"status": "pending"}, "not yet completed"),
+    ({"currency": "USD"}, "Only EUR"),
+    ({"label_ids": ["l1", "l2"]}, "Only one label"),
+    ({"vat_details": {"items": [{"rate": 7, "amount_cents": 1, "amount_excluding_vat_cents": 1199}]}}, "VAT rate not supported"),
+    ({"vat_details": {"items": [{"rate": 20, "amount_cents": 200, "amount_excluding_vat_cents": 900}]}}, "Amount error"),
+])
+def test_validation_is_not_deferred(fields: Dict[str, Any], error: str) -> None:
+    with pytest.raises(ValueError, match=error):
+        FinancialTransaction(_raw_transaction(**fields))
@@ -0,0 +1,47 @@
+from datetime import datetime
+from typing import List
+
+from qonto2fec.models.fec_record import FecRecord
+from qonto2fec.models.journal import Journal
+from qonto2fec.models.ledger_account import LedgerAccount
+from qonto2fec.services.balance_accumulator import BalanceAccumulator
+from qonto2fec.services.ledger_query import LedgerQuery
+
+JOURNAL = Journal("OD", "Opérations diverses")
+BANK = LedgerAccount("512", "Banque")
+RENT = LedgerAccount("6132", "Locations immobilières")
+
+
+def _record(account: LedgerAccount, month: int, day: int, debit_cent: int) -> FecRecord:
+    return FecRecord(datetime(2024, month, day, 12), "label", JOURNAL, account, 0, debit_cent, 1)
+
+
+def _balance(fec_records: List[FecRecord], prefix: str, start: str, end: str) -> int:
+    return sum(r.getCreditAsCent() - r.getDebitAsCent() for r in fec_records if r.CompteNum.startswith(prefix) and start <= r.EcritureDate <= end)
+
+
+def test_out_of_order_records_match_a_rebuilt_index() -> None:
+    balances = BalanceAccumulator()
+    ledger_query = LedgerQuery(balances)
+    fec_records = [_record(BANK, 3, 10, 1000), _record(RENT, 3, 15, 500), _record(BANK, 6, 1, 2000), _record(BANK, 9, 30, 4000),
+                   # Out of order : a new earlier date, an existing date before the last one, a date between two movements
+                   _record(BANK, 1, 5, 100), _record(BANK, 6, 1, 20), _record(BANK, 4, 2, 3), _record(RENT, 2, 1, 7),
+                   # In order again
+                   _record(BANK, 9, 30, 8), _record(BANK, 12, 31, 50000)]
+    for fec_record in fec_records:
+        balances.add(fec_record)
+
+    rebuilt = LedgerQuery(balances)
+    assert (ledger_query.dates, ledger_query.cumulative) == (rebuilt.dates, rebuilt.cumulative)
+    assert ledger_query.version == rebuilt.version == len(fec_records)
+
+    for date in ["2024-01-04", "2024-01-05", "2024-03-31", "2024-06-01", "20240930", "2024-12-31"]:
+        for prefix in ["5", "512", "6", ""]:
+            assert ledger_query.get_balance(prefix, date) == _balance(fec_records, prefix, "", date.replace("-", ""))
+    for start, end in [("2024-01-01", "2024-03-31"), ("2024-04-02", "2024-06-01"), ("2024-06-02", "2024-09-29")]:
+        assert ledger_query.get_movement("512", start, end) == _balance(fec_records, "512", start.replace("-", ""), end.replace("-", ""))
+    assert ledger_query.get_movement("6", None, None) == -507
+
+    assert ledger_query.get_trial_balance("2024-01-01", "2024-03-31") == [
+        ("5120000", "Banque", -1100), ("6132000", "Locations immobilières", -507)]
+    assert ledger_query.get_trial_balance("2024-06-02", "2024-09-29") == []
@@ -0,0 +1,42 @@
+from datetime import datetime
+
+from qonto2fec.models.fec_record import FecRecord
+from qonto2fec.models.journal import Journal
+from qonto2fec.models.ledger_account import LedgerAccount
+from qonto2fec.services.lettrage import LettrageAllocator
+
+
+def test_code_sequence() -> None:
+    assert [LettrageAllocator.code(number) for number in [0, 1, 25, 26, 675, 676]] == ["AAA", "AAB", "AAZ", "ABA", "AZZ", "BAA"]
+    assert LettrageAllocator.code(26 ** 3 - 1) == "ZZZ"
+    assert LettrageAllocator.code(26 ** 3) == "AAAA"
+    assert LettrageAllocator.code(26 ** 3 + 1) == "AAAB"
+    assert LettrageAllocator.code(26 ** 3 + 26 ** 4 - 1) == "ZZZZ"
+    assert LettrageAllocator.code(26 ** 3 + 26 ** 4) == "AAAAA"
+
+
+def test_codes_are_allocated_per_account() -> None:
+    allocator = LettrageAllocator()
+    assert [allocator.allocate("4111000") for _ in range(3)] == ["AAA", "AAB", "AAC"]
+    assert allocator.allocate("4011000") == "AAA"
+    assert allocator.allocate("4111000") == "AAD"
+
+    allocator.counters["4011000"] = 26 ** 3 - 1
+    assert [allocator.allocate("4011000"), allocator.allocate("4011000")] == ["ZZZ", "AAAA"]
+
+
+def test_records_are_indexed_by_account_and_code() -> None:
+    allocator = LettrageAllocator()
+    journal = Journal("VE", "Journal des ventes")
+    invoice = FecRecord(datetime(2024, 1, 5), "F1", journal, LedgerAccount("4111", "Clients"), 0, 1200, 1, ecriture_rec="AAA")
+    payment = FecRecord(datetime(2024, 1, 20), "P1", journal, LedgerAccount("4111", "Clients"), 1200, 0, 2, ecriture_rec="AAA")
+    allocator.attach(invoice)
+    allocator.attach(payment)
+    assert allocator.get_records(invoice.CompteNum, "AAA") == [invoice, payment]
+
+    # Relettered record
+    allocator.detach(payment)
+    payment.EcritureLet = "AAB"
+    allocator.attach(payment)
+    assert allocator.get_records(invoice.CompteNum, "AAA") == [invoice]
+    assert allocator.get_records(invoice.CompteNum, "AAB") == [payment]
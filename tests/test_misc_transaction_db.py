@@ -0,0 +1,83 @@
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+from qonto2fec.services.journal_db import JournalDB
+from qonto2fec.services.ledger_account_db import LedgerAccountDB
+from qonto2fec.services.misc_transaction_db import MiscellaneousTransactionDB, parse_cents, parse_misc_transactions
+
+CAPITAL = """==\tCapital
+==\t02/01/2024
+==\tSTATUTS\t01/01/2024
+OD\t512\t0\t1000,10
+OD\t1013\t1000,10\t0
+"""
+
+
+def test_parse_cents_is_exact() -> None:
+    # Amounts whose float conversion loses a cent (int(float("1.15") * 100) == 114)
+    assert parse_cents("1.15") == 115
+    assert parse_cents("0,29") == 29
+    assert parse_cents("4,35") == 435
+    assert parse_cents("1 000,5") == 100050
+    assert parse_cents("-12") == -1200
+    assert parse_cents("0") == 0
+
+
+@pytest.mark.parametrize("amount", ["1,234", "12,", "abc", "", "1,2,3"])
+def test_parse_cents_rejects_unexpected_formats(amount: str) -> None:
+    with pytest.raises(ValueError):
+        parse_cents(amount)
+
+
+def test_parse_valid_operation() -> None:
+    parsed = parse_misc_transactions("** comment\n\n" + CAPITAL)
+    assert parsed.errors == ()
+    assert len(parsed.transactions) == 1
+    transaction = parsed.transactions[0]
+    assert (transaction.EcritureLib, transaction.EcritureDate, transaction.PieceRef, transaction.ThirdPartyName) == \
+        ("Capital", datetime(2024, 1, 2), "STATUTS", None)
+    assert [(entry.linenum, entry.account_code, entry.debit, entry.credit) for entry in transaction.Entries] == \
+        [(6, "512", 0, 100010), (7, "1013", 100010, 0)]
+
+
+def test_parse_collects_all_errors() -> None:
+    parsed = parse_misc_transactions(
+        "==\tBad date\n==\t31/02/2024\n==\tREF1\t01/01/2024\nOD\t512\t0\t10\nOD\t1013\t10\t0\n\n"
+        "==\tBad amount\n==\t02/01/2024\n==\tREF2\t01/01/2024\nOD\t512\t0\t10,999\nOD\t1013\t10\t0\n\n"
+        "==\tNot balanced\n==\t02/01/2024\n==\tREF3\t01/01/2024\nOD\t512\t0\t10\nOD\t1013\t9,99\t0\n\n"
+        + CAPITAL)
+
+    assert len(parsed.errors) == 3
+    assert parsed.errors[0].startswith("Unexpected date format at line 2")
+    assert parsed.errors[1].startswith("Unexpected amount format at line 10")
+    assert parsed.errors[2] == "Operation REF3 at line 13 is not balanced : debit 9.99, credit 10.00"
+    assert [transaction.PieceRef for transaction in parsed.transactions] == ["STATUTS"]
+
+
+def test_resolution_errors_are_raised_with_the_parsing_errors(accounting_dir: Path) -> None:
+    ops_path = accounting_dir / "config" / "123OPS20241231.txt"
+    ops_path.write_text(
+        "==\tUnknown journal\n==\t02/01/2024\n==\tREF1\t01/01/2024\nXX\t512\t0\t10\nOD\t1013\t10\t0\n\n"
+        "==\tUnknown account\n==\t02/01/2024\n==\tREF2\t01/01/2024\nOD\t512\t0\t10\nOD\t999\t10\t0\n\n"
+        "==\tNot balanced\n==\t02/01/2024\n==\tREF3\t01/01/2024\nOD\t512\t0\t10\nOD\t1013\t9\t0\n\n"
+        + CAPITAL)
+
+    with pytest.raises(ValueError) as error:
+        MiscellaneousTransactionDB("config/123OPS2024-12-31.txt", JournalDB(), LedgerAccountDB("123ACCOUNTS"))
+
+    lines = str(error.value).splitlines()
+    assert lines[0] == "3 error(s) in OPS file :"
+    assert lines[1].startswith("Operation REF3 at line 13 is not balanced")
+    assert lines[2].startswith("Unexpected journal code at line 4")
+    assert lines[3].startswith("Unexpected account code at line 11")
+
+
+def test_valid_file_is_loaded(accounting_dir: Path) -> None:
+    ops_path = accounting_dir / "config" / "123OPS20241231.txt"
+    ops_path.write_text(CAPITAL)
+
+    misc_transaction_db = MiscellaneousTransactionDB("config/123OPS2024-12-31.txt", JournalDB(), LedgerAccountDB("123ACCOUNTS"))
+    transactions = misc_transaction_db.getUntil(None)
+    assert [(entry.Account.code, entry.Debit, entry.Credit) for entry in transactions[0].Entries] == [("512", 0, 100010), ("1013", 100010, 0)]
@@ -0,0 +1,73 @@
+from datetime import datetime
+from pathlib import Path
+from typing import List, Tuple
+
+from qonto2fec.models.financial_transaction import FinancialTransaction
+from qonto2fec.models.invoice import CLIENT_INVOICE, Invoice
+from qonto2fec.services.accounting import AccountingService
+from qonto2fec.services.date_utils import conv_date_from_utc_to_local
+
+OPS = """==\tCapital
+==\t10/01/2024
+==\tSTATUTS\t10/01/2024
+OD\t512\t0\t1000,00
+OD\t1013\t1000,00\t0
+
+==\tLoyer
+==\t15/01/2024
+==\tLOY\t15/01/2024
+OD\t6132\t500\t0
+OD\t4011\t0\t500
+"""
+
+
+def _when(day: int, hour: int = 0) -> datetime:
+    return conv_date_from_utc_to_local(datetime(2024, 1, day, hour))
+
+
+def _invoice(number: str, when: datetime) -> Invoice:
+    return Invoice("Qonto", number, f"att{number}", number, CLIENT_INVOICE, when, 120000, 20000, "ACME")
+
+
+def _bank_transaction(when: datetime) -> FinancialTransaction:
+    return FinancialTransaction({
+        "transaction_id": "t1", "status": "completed", "currency": "EUR", "attachment_required": False, "attachments": [],
+        "attachment_lost": False, "operation_type": "card", "label_ids": [], "labels": [], "note": None, "reference": "R1",
+        "settled_at": when, "attachment_ids": [], "label": "OVH", "amount_cents": 1200, "side": "debit", "category": "Services en ligne"})
+
+
+def _numbering(accounting_service: AccountingService) -> List[Tuple[str, str, str]]:
+    return list(dict.fromkeys((r.EcritureNum, r.EcritureDate, r.EcritureLib) for r in accounting_service.fec_records))
+
+
+def test_posting_order_and_numbering(accounting_dir: Path) -> None:
+    (accounting_dir / "config" / "123OPS20241231.txt").write_text(OPS)
+    accounting_service = AccountingService("123", "2024-01-01", "2024-12-31")
+    accounting_service.generateRAN()
+
+    # FA-20 and FB-18 are posted in date order (they were posted in the order they were added before the k-way merge)
+    accounting_service.addInvoices([_invoice("FA-20", _when(20, 9)), _invoice("FB-18", _when(18, 9)),
+                                    _invoice("FC-10", _when(10))])
+    accounting_service.doAccounting([_bank_transaction(_when(25, 9))])
+
+    assert _numbering(accounting_service) == [
+        ("1", "20240110", "FC-10"),  # Same date and time as the OPS operation : invoice first
+        ("2", "20240110", "Capital"),
+        ("3", "20240115", "Loyer"),
+        ("4", "20240118", "FB-18"),
+        ("5", "20240120", "FA-20"),
+        ("6", "20240125", "R1"),  # Purchase
+        ("7", "20240125", "R1"),  # Payment
+    ]
+
+
+def test_invoice_before_last_record(accounting_dir: Path) -> None:
+    (accounting_dir / "config" / "123OPS20241231.txt").write_text(OPS)
+    accounting_service = AccountingService("123", "2024-01-01", "2024-12-31")
+    accounting_service.doAccounting([_bank_transaction(_when(25, 9))], _when(31, 23))
+
+    # Invoice added late, dated before the records already posted : posted at the date of the last record
+    accounting_service.addInvoices([_invoice("FD-05", _when(5, 9)), _invoice("FE-28", _when(28, 9))])
+    accounting_service.doAccounting([])
+
+    assert _numbering(accounting_service)[-2:] == [("5", "20240125", "FD-05"), ("6", "20240128", "FE-28")]
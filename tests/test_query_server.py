@@ -0,0 +1,33 @@
+import os
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from qonto2fec.models.fec_record import FecRecord
+from qonto2fec.services.query_server import LedgerServer
+
+
+def test_failed_reload_is_retried(tmp_path: Path) -> None:
+    ledger_path = tmp_path / "ledger.txt"
+    ledger_path.write_text("v1")
+    failures = [ValueError("Ledger being written")]
+    loads: List[str] = []
+
+    def load() -> List[FecRecord]:
+        content = ledger_path.read_text()
+        if content == "v2" and failures:
+            raise failures.pop()
+        loads.append(content)
+        return []
+
+    server = LedgerServer(load, [str(ledger_path)])
+    ledger_path.write_text("v2")
+    os.utime(ledger_path, ns=(1, 1))
+    with pytest.raises(ValueError):
+        server.reload_if_changed()
+
+    # Same file stats : the failed reload is tried again
+    assert server.reload_if_changed()
+    assert loads == ["v1", "v2"]
+    assert not server.reload_if_changed()
@@ -0,0 +1,21 @@
+from qonto2fec.services.reconciliation import find_amounts_matching_total
+
+
+def test_exact_single_item() -> None:
+    assert find_amounts_matching_total([5000, 12000, 3000], 12000) == [1]
+
+
+def test_multi_item_match() -> None:
+    assert find_amounts_matching_total([5000, 12000, 3000, 4000], 8000) == [0, 2]
+
+
+def test_no_solution() -> None:
+    assert find_amounts_matching_total([5000, 12000, 3000], 7000) is None
+    assert find_amounts_matching_total([5000], 0) is None
+
+
+def test_search_limit_exceeded() -> None:
+    amounts = [2 ** i for i in range(12)]
+    total = sum(amounts)
+    assert find_amounts_matching_total(amounts, total) == list(range(12))
+    assert find_amounts_matching_total(amounts, total, search_limit=10) is None
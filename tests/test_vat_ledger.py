@@ -0,0 +1,65 @@
+from datetime import datetime
+from pathlib import Path
+
+from qonto2fec.models.fec_record import FecRecord
+from qonto2fec.models.journal import Journal
+from qonto2fec.models.ledger_account import LedgerAccount
+from qonto2fec.services.accounting import AccountingService
+from qonto2fec.services.vat_ledger import COLLECTED, DEDUCTIBLE, PAID, PENDING, VatLedger
+
+JOURNAL = Journal("OD", "Opérations diverses")
+
+OPS = """==\tTVA décembre
+==\t20/01/2024
+==\tCA3-12\t20/01/2024
+OD\t44551\t300,00\t0
+OD\t512\t0\t300,00
+
+==\tRégularisation
+==\t25/01/2024
+==\tREG\t25/01/2024
+OD\t445661\t0\t12,34
+OD\t6064\t12,34\t0
+"""
+
+
+def _record(account: str, credit_cent: int, debit_cent: int, day: int = 5) -> FecRecord:
+    return FecRecord(datetime(2024, 1, day, 12), "label", JOURNAL, LedgerAccount(account, account), credit_cent, debit_cent, 1)
+
+
+def test_recorded_vat_is_moved_to_its_rate() -> None:
+    vat_ledger = VatLedger()
+    collected = _record("44571", 2000, 0)
+    deductible = _record("445661", 0, 550)
+    vat_ledger.record(collected)
+    vat_ledger.record(deductible)
+    vat_ledger.record(_record("512", 0, 12000))
+    assert vat_ledger.get_month("2024-01") == {(COLLECTED, None): [0, 2000], (DEDUCTIBLE, None): [0, 550]}
+
+    vat_ledger.add(collected, 10000)
+    vat_ledger.add_items(deductible, [(5.5, 10000, 550)])
+    assert vat_ledger.get_month("2024-01") == {(COLLECTED, 20.0): [10000, 2000], (DEDUCTIBLE, 5.5): [10000, 550]}
+    assert vat_ledger.get_due("202401") == 1450
+
+
+def test_rows_round_trip_is_exact() -> None:
+    vat_ledger = VatLedger()
+    for account, credit_cent, debit_cent in [("44571", 29, 0), ("44571", 0, 100015), ("4458", 115, 0), ("44551", 0, 435)]:
+        vat_ledger.record(_record(account, credit_cent, debit_cent))
+
+    rows = vat_ledger.to_rows()
+    assert [row["vat"] for row in rows] == ["-999,86", "4,35", "1,15"]
+    assert VatLedger.from_rows(rows).months == vat_ledger.months
+
+
+def test_every_vat_account_record_is_in_the_ledger(accounting_dir: Path) -> None:
+    (accounting_dir / "config" / "123OPS20241231.txt").write_text(OPS)
+    accounting_service = AccountingService("123", "2024-01-01", "2024-12-31")
+    accounting_service.generateRAN()
+    accounting_service.doAccounting([])
+
+    assert accounting_service.getVatReturn("2024-01") == {(PAID, None): [0, 30000], (DEDUCTIBLE, None): [0, -1234]}
+    for prefix, kind in [("44551", PAID), ("445661", DEDUCTIBLE), ("44571", COLLECTED), ("4458", PENDING)]:
+        movement = accounting_service.getPeriodMovement(prefix, "20240101", "20240131")
+        vat_cent = accounting_service.vat_ledger.get_total("2024-01", kind)
+        assert vat_cent == (-movement if kind in [DEDUCTIBLE, PAID] else movement)
@@ -0,0 +1,126 @@
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pytest
+
+from qonto2fec.models.financial_transaction import FinancialTransaction
+from qonto2fec.models.invoice import CLIENT_INVOICE, SUPPLIER_INVOICE, Invoice
+from qonto2fec.models.qonto_snapshot import QontoSnapshot
+from qonto2fec.services.accounting import AccountingService
+from qonto2fec.services.date_utils import conv_date_from_utc_to_local
+from qonto2fec.services.watch import AccountingWatcher
+
+
+def _when(month: int, day: int) -> datetime:
+    return conv_date_from_utc_to_local(datetime(2024, month, day, 9))
+
+
+def _transaction(transaction_id: str, month: int, amount_cents: int = 1200) -> FinancialTransaction:
+    return FinancialTransaction({
+        "transaction_id": transaction_id, "status": "completed", "currency": "EUR", "attachment_required": False, "attachments": [],
+        "attachment_lost": False, "operation_type": "card", "label_ids": [], "labels": [], "note": None, "reference": transaction_id,
+        "settled_at": _when(month, 20), "attachment_ids": [], "label": "OVH", "amount_cents": amount_cents, "side": "debit",
+        "category": "Services en ligne"})
+
+
+def _invoice(number: str, month: int, type: str = CLIENT_INVOICE) -> Invoice:
+    return Invoice("Qonto", number, f"att{number}", number, type, _when(month, 5), 120000, 0 if type == SUPPLIER_INVOICE else 20000,
+                   "GOOGLE COMMERCE LIMITED" if type == SUPPLIER_INVOICE else "ACME")
+
+
+class FakeQonto:
+    """Qonto changes returned at the next poll, with the cursors received"""
+
+    def __init__(self) -> None:
+        self.transactions: List[FinancialTransaction] = []
+        self.client_invoices: List[Invoice] = []
+        self.removed_supplier_invoices: List[str] = []
+        self.cursors: List[Optional[datetime]] = []
+
+    def getTransactions(self, start_date: str, end_date: str, updated_at_from: Optional[datetime] = None,
+                        declined_ids: Optional[List[str]] = None) -> List[FinancialTransaction]:
+        self.cursors.append(updated_at_from)
+        return self.transactions
+
+    def getClientInvoices(self, start_date: str, end_date: str, updated_at_from: Optional[datetime] = None,
+                          removed_ids: Optional[List[str]] = None) -> List[Invoice]:
+        self.cursors.append(updated_at_from)
+        return self.client_invoices
+
+    def getClientCreditNotes(self, start_date: str, end_date: str, updated_at_from: Optional[datetime] = None) -> List[Invoice]:
+        self.cursors.append(updated_at_from)
+        return []
+
+    def getToPaySupplierInvoices(self, start_date: str, end_date: str, updated_at_from: Optional[datetime] = None,
+                                 removed_ids: Optional[List[str]] = None) -> List[Invoice]:
+        self.cursors.append(updated_at_from)
+        if removed_ids is not None:
+            removed_ids.extend(self.removed_supplier_invoices)
+        return []
+
+
+def _start(accounting_dir: Path, qonto: FakeQonto) -> AccountingWatcher:
+    (accounting_dir / "config" / "123OPS20241231.txt").write_text("")
+    watcher = AccountingWatcher("123", "2024-01-01", "2024-12-31", 10, "tsv", qonto)
+    watcher.start(lambda: QontoSnapshot([_invoice("F1", 1), _invoice("F4", 4)], [], [_invoice("S2", 2, SUPPLIER_INVOICE)],
+                                        [_transaction("R1", 1), _transaction("R3", 3), _transaction("R6", 6)]))
+    return watcher
+
+
+def _fec(accounting_dir: Path) -> str:
+    return (accounting_dir / "export" / "123FEC20241231.txt").read_text()
+
+
+def _expected_fec(accounting_dir: Path, snapshot: QontoSnapshot) -> str:
+    """FEC of a full recompute of a snapshot"""
+    watcher = AccountingWatcher("123", "2024-01-01", "2024-12-31", 10, "tsv", FakeQonto())
+    watcher.start(lambda: snapshot)
+    return _fec(accounting_dir)
+
+
+def test_changes_are_posted_from_the_first_month_affected(accounting_dir: Path) -> None:
+    qonto = FakeQonto()
+    watcher = _start(accounting_dir, qonto)
+    assert watcher.poll() is None
+
+    qonto.transactions = [_transaction("R5", 5), _transaction("R3", 3, 2400)]
+    qonto.client_invoices = [_invoice("F7", 7)]
+    qonto.removed_supplier_invoices = ["S2"]
+    assert watcher.poll() == "202402"
+    assert [transaction.transaction_id for transaction in watcher.snapshot.transactions] == ["R1", "R3", "R5", "R6"]
+    assert [invoice.number for invoice in watcher.snapshot.client_invoices] == ["F1", "F4", "F7"]
+    assert watcher.snapshot.supplier_invoices == []
+
+    # Invoices are retrieved from the cursor, like the transactions
+    assert all(cursor is not None for cursor in qonto.cursors)
+
+    fec = _fec(accounting_dir)
+    assert fec == _expected_fec(accounting_dir, watcher.snapshot)
+
+
+def test_failed_poll_is_retried(accounting_dir: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    qonto = FakeQonto()
+    watcher = _start(accounting_dir, qonto)
+    cursor, snapshot, checkpoints = watcher.cursor, watcher.snapshot, dict(watcher.checkpoints)
+
+    qonto.transactions = [_transaction("R8", 8)]
+    close_accounting = AccountingService.closeAccouting
+    failures: Dict[str, int] = {"count": 1}
+
+    def failing_close(accounting_service: AccountingService) -> None:
+        if failures["count"]:
+            failures["count"] -= 1
+            raise ValueError("Closing failed")
+        close_accounting(accounting_service)
+
+    monkeypatch.setattr(AccountingService, "closeAccouting", failing_close)
+    with pytest.raises(ValueError):
+        watcher.poll()
+
+    # Nothing is committed : the change is retrieved again from the same cursor
+    assert (watcher.cursor, watcher.snapshot, watcher.checkpoints) == (cursor, snapshot, checkpoints)
+    qonto.transactions = [_transaction("R8", 8)]
+    assert watcher.poll() == "202408"
+    assert [transaction.transaction_id for transaction in watcher.snapshot.transactions] == ["R1", "R3", "R6", "R8"]
+    assert _fec(accounting_dir) == _expected_fec(accounting_dir, watcher.snapshot)